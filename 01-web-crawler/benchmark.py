@@ -0,0 +1,526 @@
+"""
+Crawler benchmarks
+
+All benchmarks run against a local HTTP server (see localserver.py), so
+the numbers do not depend on the network.  Most crawl fixtures/catalog;
+synthetic crawls generated catalogs of any size (see
+catalog_generator.py).
+
+    python3 benchmark.py crawl [--latency SECONDS] [--rounds N]
+    python3 benchmark.py pool [--rounds N]
+    python3 benchmark.py cache [--latency SECONDS]
+    python3 benchmark.py parse [--rounds N]
+    python3 benchmark.py scan [--rounds N]
+    python3 benchmark.py pipeline [--latency SECONDS] [--workers N ...]
+    python3 benchmark.py seen [--sizes N ...] [--error-rate RATE]
+    python3 benchmark.py links [--rounds N]
+    python3 benchmark.py tokens [--rounds N] [--root DIR]
+    python3 benchmark.py synthetic [--sizes N ...] [--concurrency N ...]
+"""
+# pylint: disable-msg=invalid-name
+
+import argparse
+import gc
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+
+import catalog_generator
+import crawler
+import httpcache
+import httppool
+import linkscan
+import localserver
+import parsers
+import seenurls
+import tokenizer
+import urlnorm
+import util
+
+
+def bench_crawl(args):
+    '''
+    Pages per second for the serial crawler and for crawl_async at
+    several concurrency levels, with the per-crawl request, byte and
+    parse-time counters.  Every run must produce the same index.
+    '''
+    with localserver.serve_directory(latency=args.latency) as server:
+        starting_url = server.url + "index.html"
+        modes = [("serial", None)] + [("async", c) for c in args.concurrency]
+        expected = None
+
+        print("{:<8} {:>11} {:>8} {:>9} {:>11} {:>8} {:>10} {:>9}".format(
+            "mode", "concurrency", "pages", "requests", "bytes", "parse s",
+            "seconds", "pages/s"))
+        for mode, concurrency in modes:
+            stats = crawler.CrawlStats()
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                if concurrency is None:
+                    index = crawler.crawl(args.pages, starting_url,
+                                          server.domain, stats=stats)
+                else:
+                    index = crawler.crawl_async(args.pages, starting_url,
+                                                server.domain,
+                                                concurrency=concurrency,
+                                                stats=stats)
+            elapsed = time.perf_counter() - start
+
+            if expected is None:
+                expected = index
+            assert index == expected, "{} crawl produced a different index" \
+                .format(mode)
+            print("{:<8} {:>11} {:>8} {:>9} {:>11} {:>8.3f} {:>10.3f} {:>9.1f}"
+                  .format(mode, concurrency or 1, stats.pages, stats.requests,
+                          stats.bytes_downloaded, stats.parse_time, elapsed,
+                          stats.pages / elapsed))
+
+
+def fixture_urls(base_url, root=localserver.FIXTURE_DIR):
+    '''
+    URLs of every page under the fixture directory.
+    '''
+    urls = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            if filename.endswith(".html"):
+                path = os.path.relpath(os.path.join(dirpath, filename), root)
+                urls.append(base_url + path.replace(os.sep, "/"))
+    return sorted(urls)
+
+
+def bench_pool(args):
+    '''
+    Requests per second with util.get_request (a new connection per
+    request) and with a pooled httppool.HttpSession.
+    '''
+    with localserver.serve_directory(latency=args.latency) as server:
+        urls = fixture_urls(server.url) * args.rounds
+
+        start = time.perf_counter()
+        for url in urls:
+            util.get_request(url)
+        elapsed = time.perf_counter() - start
+        print("util.get_request: {} requests in {:.3f}s ({:.1f} req/s)"
+              .format(len(urls), elapsed, len(urls) / elapsed))
+
+        with httppool.HttpSession() as session:
+            start = time.perf_counter()
+            for url in urls:
+                session.get_request(url)
+            elapsed = time.perf_counter() - start
+            print("HttpSession:      {} requests in {:.3f}s ({:.1f} req/s)"
+                  .format(len(urls), elapsed, len(urls) / elapsed))
+            print("                  " + str(session.metrics))
+
+
+def bench_cache(args):
+    '''
+    Crawl time with an empty cache, with a full cache that is
+    revalidated, and offline from the cache alone.
+    '''
+    with localserver.serve_directory(latency=args.latency) as server, \
+        tempfile.TemporaryDirectory() as cache_dir:
+        starting_url = server.url + "index.html"
+        runs = [("cold cache", httpcache.REVALIDATE),
+                ("revalidate", httpcache.REVALIDATE),
+                ("cache-only", httpcache.CACHE_ONLY)]
+        for name, mode in runs:
+            with httpcache.CachingSession(cache_dir, mode) as session:
+                start = time.perf_counter()
+                crawler.crawl(args.pages, starting_url, server.domain,
+                              session=session)
+                elapsed = time.perf_counter() - start
+                print("{:<11} {:>8.3f}s  {}".format(name, elapsed, session))
+
+
+def fixture_bodies(root=localserver.FIXTURE_DIR):
+    '''
+    Bodies of every page under the fixture directory.
+    '''
+    bodies = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            if filename.endswith(".html"):
+                with open(os.path.join(dirpath, filename), "rb") as f:
+                    bodies.append(f.read())
+    return bodies
+
+
+def bench_parse(args):
+    '''
+    Parse throughput (parse, then extract hrefs and course blocks) of
+    each parser backend over the fixture pages.
+    '''
+    bodies = fixture_bodies() * args.rounds
+    size = sum(len(body) for body in bodies)
+
+    print("{:<10} {:>7} {:>10} {:>9} {:>7}".format(
+        "parser", "pages", "seconds", "pages/s", "MB/s"))
+    for name, parser in sorted(parsers.PARSERS.items()):
+        start = time.perf_counter()
+        for body in bodies:
+            tree = parser.parse(body)
+            parser.hrefs(tree)
+            parser.course_blocks(tree)
+        elapsed = time.perf_counter() - start
+        print("{:<10} {:>7} {:>10.3f} {:>9.1f} {:>7.2f}".format(
+            name, len(bodies), elapsed, len(bodies) / elapsed,
+            size / elapsed / 1e6))
+
+
+def bench_scan(args):
+    '''
+    CPU time and peak memory of link discovery over the fixture pages,
+    for navigation pages and course pages separately: a full parse of
+    every page versus a streaming scan plus a full parse of only the
+    pages with course blocks.
+    '''
+    def full(parser, body):
+        tree = parser.parse(body)
+        return parser.hrefs(tree), parser.course_blocks(tree)
+
+    def scanned(parser, body):
+        hrefs, has_courses = linkscan.scan(body)
+        if has_courses:
+            return hrefs, parser.course_blocks(parser.parse(body))
+        return hrefs, []
+
+    kinds = {"navigation": [], "courses": []}
+    for body in fixture_bodies():
+        kinds["courses" if linkscan.scan(body).has_courses
+              else "navigation"].append(body)
+
+    print("{:<10} {:<11} {:<5} {:>7} {:>10} {:>9} {:>9}".format(
+        "parser", "pages", "mode", "pages", "seconds", "pages/s",
+        "peak KiB"))
+    for name, parser in sorted(parsers.PARSERS.items()):
+        for kind, bodies in sorted(kinds.items()):
+            for mode, extract in (("full", full), ("scan", scanned)):
+                start = time.perf_counter()
+                for _ in range(args.rounds):
+                    for body in bodies:
+                        extract(parser, body)
+                elapsed = time.perf_counter() - start
+                pages = len(bodies) * args.rounds
+
+                # Peak memory while handling a single page
+                peak = 0
+                for body in bodies:
+                    tracemalloc.start()
+                    extract(parser, body)
+                    peak = max(peak, tracemalloc.get_traced_memory()[1])
+                    tracemalloc.stop()
+                print("{:<10} {:<11} {:<5} {:>7} {:>10.3f} {:>9.1f} {:>9.1f}"
+                      .format(name, kind, mode, pages, elapsed,
+                              pages / elapsed, peak / 1024))
+
+
+def bench_pipeline(args):
+    '''
+    Pages per second for crawl_async with parsing in the fetcher threads
+    versus a pool of parser processes, with the mean and max depth of
+    each pipeline stage.  Every run must produce the same index.
+    '''
+    with localserver.serve_directory(latency=args.latency) as server:
+        starting_url = server.url + "index.html"
+        expected = None
+        for workers in [None] + args.workers:
+            stats = crawler.CrawlStats()
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                index = crawler.crawl_async(
+                    args.pages, starting_url, server.domain,
+                    concurrency=args.concurrency, stats=stats,
+                    parser=args.parser, scan_links=False, workers=workers)
+            elapsed = time.perf_counter() - start
+
+            if expected is None:
+                expected = index
+            assert index == expected, \
+                "workers={} produced a different index".format(workers)
+            print("workers {}: {} pages, {:.3f}s, {:.1f} pages/s, "
+                  "{:.3f}s parsing".format(workers or "-", stats.pages,
+                                           elapsed, stats.pages / elapsed,
+                                           stats.parse_time))
+            print(stats.queue_report())
+
+
+def catalog_url(i):
+    '''
+    A made-up catalog URL, about as long as the real ones.
+    '''
+    return ("http://www.classes.cs.uchicago.edu/archive/2015/winter/12200-1/"
+            "new.collegecatalog.uchicago.edu/thecollege/dept{}/page{}.html"
+            .format(i % 97, i))
+
+
+def bench_seen(args):
+    '''
+    Memory per URL, insert time and lookup time of each seen-URL store
+    at several sizes, and the false-positive rate of the Bloom filter.
+    '''
+    print("{:<12} {:>9} {:>10} {:>8} {:>10} {:>10} {:>9}".format(
+        "store", "urls", "MiB", "B/url", "add ns", "lookup ns", "false +"))
+    for size in args.sizes:
+        lookups = min(size, args.lookups)
+        present = [catalog_url(i) for i in range(0, size, size // lookups)]
+        absent = [catalog_url(size + i) for i in range(lookups)]
+        for name in seenurls.STORES:
+            store = seenurls.store_factory(name, size, args.error_rate)()
+            start = time.perf_counter()
+            for i in range(size):
+                store.add(catalog_url(i))
+            # Generating the URLs is not part of the cost of the store
+            gen_start = time.perf_counter()
+            for i in range(size):
+                catalog_url(i)
+            gen = time.perf_counter() - gen_start
+            add = max(gen_start - start - gen, 0.0)
+
+            start = time.perf_counter()
+            for url in present:
+                assert url in store
+            false_positives = sum(url in store for url in absent)
+            lookup = time.perf_counter() - start
+
+            nbytes = seenurls.store_nbytes(store)
+            print("{:<12} {:>9} {:>10.1f} {:>8.1f} {:>10.0f} {:>10.0f} {:>9.4%}"
+                  .format(name, size, nbytes / 2 ** 20, nbytes / size,
+                          add / size * 1e9,
+                          lookup / (len(present) + len(absent)) * 1e9,
+                          false_positives / len(absent)))
+            del store
+
+
+def bench_links(args):
+    '''
+    Cost per link of finding the links to follow on every fixture page:
+    the util functions one href at a time (what crawler.get_links used
+    to do) versus a LinkNormalizer with a cold and a warm cache.
+    '''
+    domain = "classes.cs.uchicago.edu"
+    base_url = ("http://www.classes.cs.uchicago.edu/archive/2015/winter"
+                "/12200-1/new.collegecatalog.uchicago.edu/")
+    pages = []
+    for url in fixture_urls(base_url):
+        path = os.path.join(localserver.FIXTURE_DIR, url[len(base_url):])
+        with open(path, "rb") as f:
+            pages.append((url, linkscan.scan(f.read()).hrefs))
+    num_links = sum(len(hrefs) for _, hrefs in pages) * args.rounds
+
+    def util_links(url, hrefs):
+        links = []
+        for href in hrefs:
+            new_url = util.remove_fragment(href)
+            if not util.is_absolute_url(new_url):
+                new_url = util.convert_if_relative_url(url, new_url)
+            if new_url is not None and \
+                util.is_url_ok_to_follow(new_url, domain):
+                links.append(new_url)
+        return links
+
+    normalizer = urlnorm.LinkNormalizer(domain)
+
+    def cold_links(url, hrefs):
+        normalizer.cache_clear()
+        return normalizer.normalize_links(url, hrefs)
+
+    expected = [util_links(url, hrefs) for url, hrefs in pages]
+    print("{:<8} {:>8} {:>10} {:>10}".format("mode", "links", "seconds",
+                                             "ns/link"))
+    for mode, links in (("util", util_links), ("cold", cold_links),
+                        ("warm", normalizer.normalize_links)):
+        assert [links(url, hrefs) for url, hrefs in pages] == expected
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            for url, hrefs in pages:
+                links(url, hrefs)
+        elapsed = time.perf_counter() - start
+        print("{:<8} {:>8} {:>10.3f} {:>10.0f}".format(
+            mode, num_links, elapsed, elapsed / num_links * 1e9))
+    print(normalizer.cache_info())
+
+
+def bench_tokens(args):
+    '''
+    Tokens per second of the token-at-a-time reference tokenizer and of
+    the batch tokenizer over the course text (titles and descriptions)
+    of every page under a directory (the fixture by default; point
+    --root at a saved copy of the catalog to cover all of it).
+    '''
+    texts = []
+    for body in fixture_bodies(args.root):
+        tree = parsers.LXML.parse(body)
+        for block in parsers.LXML.course_blocks(tree):
+            texts.append(tokenizer.title_text(block.title) + "\n" +
+                         block.desc)
+            texts.extend(tokenizer.title_text(title)
+                         for title in block.sequence)
+    num_tokens = sum(len(text.split()) for text in texts)
+
+    vocabularies = {}
+    print("{:<10} {:>6} {:>10} {:>10} {:>12}".format(
+        "tokenizer", "texts", "tokens", "seconds", "tokens/s"))
+    for name, words in (("reference", tokenizer.reference_words),
+                        ("batch", tokenizer.words)):
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            for text in texts:
+                words(text)
+        elapsed = time.perf_counter() - start
+        vocabularies[name] = [words(text) for text in texts]
+        print("{:<10} {:>6} {:>10} {:>10.3f} {:>12,.0f}".format(
+            name, len(texts), num_tokens * args.rounds, elapsed,
+            num_tokens * args.rounds / elapsed))
+    vocabulary = {word for text in vocabularies["batch"] for word in text}
+    print("{} distinct words; same words as the reference: {}".format(
+        len(vocabulary), vocabularies["batch"] == vocabularies["reference"]))
+
+
+def bench_synthetic(args):
+    '''
+    End-to-end crawl throughput and memory over synthetic catalogs of
+    each size, serially (concurrency 1) and with crawl_async.  Every
+    page of the catalog is crawled.  Memory is the index's own size and
+    the process's peak RSS so far (which only grows from one crawl to
+    the next); with --tracemalloc, also the peak Python heap of the
+    crawl (which makes it slower).
+    '''
+    header = "{:>7} {:>6} {:>9} {:>8} {:>7} {:>8} {:>9} {:>10} {:>8}"
+    row = "{:>7} {:>6} {:>9.2f} {:>8.1f} {:>7.2f} {:>8} {:>9} {:>10.1f} {:>8.0f}"
+    print(header.format("pages", "conc", "seconds", "pages/s", "MB/s",
+                        "words", "postings", "index MB", "RSS MB") +
+          ("  heap MB" if args.tracemalloc else ""))
+    for size in args.sizes:
+        catalog = catalog_generator.SyntheticCatalog(
+            size, args.departments, args.courses, args.links, args.depth,
+            seed=args.seed)
+        expected = None
+        with catalog_generator.serve_catalog(catalog, args.latency) as server:
+            starting_url = server.url + "index.html"
+            for concurrency in args.concurrency:
+                gc.collect()
+                if args.tracemalloc:
+                    tracemalloc.start()
+                stats = crawler.CrawlStats()
+                seen = seenurls.store_factory(args.seen, size)
+                start = time.perf_counter()
+                if concurrency == 1:
+                    index = crawler.crawl(size, starting_url, server.domain,
+                                          stats=stats, parser=args.parser,
+                                          seen=seen)
+                else:
+                    index = crawler.crawl_async(
+                        size, starting_url, server.domain,
+                        concurrency=concurrency, stats=stats,
+                        parser=args.parser, workers=args.workers, seen=seen)
+                elapsed = time.perf_counter() - start
+                heap = None
+                if args.tracemalloc:
+                    heap = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+
+                assert stats.pages == size, \
+                    "crawled {} of {} pages".format(stats.pages, size)
+                if expected is None:
+                    expected = index
+                assert index == expected, "crawls produced different indexes"
+                rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                line = row.format(size, concurrency, elapsed, size / elapsed,
+                                  stats.bytes_downloaded / elapsed / 1e6,
+                                  len(index), index.num_postings,
+                                  index.memory()[1] / 1e6, rss / 1024)
+                if heap is not None:
+                    line += " {:>8.1f}".format(heap / 1e6)
+                print(line)
+                del index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    p = subparsers.add_parser("crawl", help="serial vs. asyncio crawl")
+    p.add_argument("--latency", type=float, default=0.02,
+                   help="seconds the server waits before each response")
+    p.add_argument("--pages", type=int, default=1000,
+                   help="num_pages_to_crawl for each crawl")
+    p.add_argument("--rounds", type=int, default=5)
+    p.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    p.set_defaults(func=bench_crawl)
+
+    p = subparsers.add_parser("pool", help="pooled vs. unpooled requests")
+    p.add_argument("--latency", type=float, default=0.0)
+    p.add_argument("--rounds", type=int, default=50)
+    p.set_defaults(func=bench_pool)
+
+    p = subparsers.add_parser("cache", help="crawl with the response cache")
+    p.add_argument("--latency", type=float, default=0.02)
+    p.add_argument("--pages", type=int, default=1000)
+    p.set_defaults(func=bench_cache)
+
+    p = subparsers.add_parser("parse", help="parser backend throughput")
+    p.add_argument("--rounds", type=int, default=50)
+    p.set_defaults(func=bench_parse)
+
+    p = subparsers.add_parser("scan", help="streaming link scan")
+    p.add_argument("--rounds", type=int, default=50)
+    p.set_defaults(func=bench_scan)
+
+    p = subparsers.add_parser("pipeline",
+                              help="parsing in threads vs. processes")
+    p.add_argument("--latency", type=float, default=0.0)
+    p.add_argument("--pages", type=int, default=1000)
+    p.add_argument("--rounds", type=int, default=5)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--parser", choices=sorted(parsers.PARSERS),
+                   default=parsers.HTML5LIB.name)
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p.set_defaults(func=bench_pipeline)
+
+    p = subparsers.add_parser("seen", help="seen-URL stores")
+    p.add_argument("--sizes", type=int, nargs="+",
+                   default=[10 ** 5, 10 ** 6, 10 ** 7])
+    p.add_argument("--lookups", type=int, default=10 ** 5,
+                   help="present and absent URLs looked up at each size")
+    p.add_argument("--error-rate", type=float,
+                   default=seenurls.DEFAULT_ERROR_RATE)
+    p.set_defaults(func=bench_seen)
+
+    p = subparsers.add_parser("links", help="memoized link normalization")
+    p.add_argument("--rounds", type=int, default=200)
+    p.set_defaults(func=bench_links)
+
+    p = subparsers.add_parser("tokens", help="course text tokenizer")
+    p.add_argument("--rounds", type=int, default=200)
+    p.add_argument("--root", default=localserver.FIXTURE_DIR,
+                   help="directory of catalog pages")
+    p.set_defaults(func=bench_tokens)
+
+    p = subparsers.add_parser("synthetic",
+                              help="crawls of generated catalogs")
+    p.add_argument("--sizes", type=int, nargs="+",
+                   default=[10 ** 3, 10 ** 4, 10 ** 5],
+                   help="pages in each catalog")
+    p.add_argument("--concurrency", type=int, nargs="+", default=[1, 8],
+                   help="1 is the serial crawl")
+    p.add_argument("--workers", type=int,
+                   help="parser processes for the asyncio crawls")
+    p.add_argument("--parser", choices=sorted(parsers.PARSERS),
+                   default=parsers.LXML.name)
+    p.add_argument("--seen", choices=seenurls.STORES, default="set")
+    p.add_argument("--latency", type=float, default=0.0)
+    p.add_argument("--departments", type=int, default=20)
+    p.add_argument("--courses", type=int, default=5)
+    p.add_argument("--links", type=int, default=8)
+    p.add_argument("--depth", type=int, default=4)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--tracemalloc", action="store_true",
+                   help="also measure the peak Python heap")
+    p.set_defaults(func=bench_synthetic)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,440 @@
+"""
+Synthetic course catalog
+
+SyntheticCatalog generates a catalog site of any size in the shape of
+the real one (and of fixtures/catalog): a home page, a programs of
+study page listing the departments, and under each department a tree
+of course pages.  Each course page has "courseblock main" blocks, some
+followed by "courseblock subsequence" siblings, plus navigation links,
+links to other course pages and the links the crawler must not follow
+(mailto, other domains, fragments, PDFs, queries).
+
+Every page is generated from the seed and its path alone, so a catalog
+is the same on every run and pages can be generated as they are
+requested instead of being written out first:
+
+    catalog = catalog_generator.SyntheticCatalog(pages=10000)
+    with catalog_generator.serve_catalog(catalog) as server:
+        crawler.crawl(10000, server.url + "index.html", server.domain)
+    catalog.course_map()         course codes mapped to identifiers
+
+serve_catalog runs the server in a separate process, so generating
+pages neither competes with the crawler for the GIL nor counts towards
+its memory.
+
+    python3 catalog_generator.py DIR --pages 1000
+                                 writes the catalog to DIR instead
+"""
+# pylint: disable-msg=invalid-name
+
+import argparse
+import contextlib
+import html
+import multiprocessing
+import os
+import posixpath
+import random
+import string
+
+import localserver
+
+
+HOME = "index.html"
+COLLEGE = "thecollege/index.html"
+
+# Course numbers have five digits
+FIRST_COURSE_NUMBER = 10000
+COURSE_NUMBERS = 90000
+
+# Most subsequence blocks that follow a main block
+MAX_SEQUENCE = 3
+
+# Not followed by the crawler: other domain, mailto, PDF, query, fragment
+JUNK_LINKS = ('<a href="mailto:registrar@uchicago.edu">registrar</a>',
+              '<a href="http://www.uchicago.edu/">University of Chicago</a>',
+              '<a href="{root}catalog.pdf">Print version</a>',
+              '<a href="{root}search/?q=courses">Search</a>',
+              '<a href="#header">Back to top</a>')
+
+PAGE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title} &lt; University of Chicago</title>
+</head>
+<body>
+<div id="header"><a href="{root}index.html">Home</a></div>
+<div id="nav">
+<ul>
+{nav}
+</ul>
+</div>
+<div id="content">
+<h1>{title}</h1>
+{content}
+</div>
+<div id="footer">
+{footer}
+</div>
+</body>
+</html>
+'''
+
+BLOCK = '''<div class="courseblock {kind}">
+<p class="courseblocktitle"><strong>{code}.  {title}.  100 Units.</strong></p>
+<p class="courseblockdesc">
+{desc}
+</p>
+<p class="courseblockdetail">
+Terms Offered: Autumn<br>
+Note(s): Open to all students.
+</p>
+</div>'''
+
+
+def department_code(n):
+    '''
+    Four-letter code of the n-th course code prefix ("AAAA", "AAAB", ...).
+    '''
+    letters = []
+    for _ in range(4):
+        n, r = divmod(n, 26)
+        letters.append(string.ascii_uppercase[r])
+    return "".join(reversed(letters))
+
+
+def make_vocabulary(size, seed):
+    '''
+    size distinct pseudo-words built from syllables.
+    '''
+    rng = random.Random("{}:vocabulary".format(seed))
+    consonants = "bcdfghklmnprstvz"
+    vowels = "aeiou"
+    words = set()
+    while len(words) < size:
+        syllables = rng.randint(1, 4)
+        words.add("".join(rng.choice(consonants) + rng.choice(vowels)
+                          for _ in range(syllables)))
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+class SyntheticCatalog:
+    '''
+    A deterministic synthetic catalog (see the module docstring).
+    '''
+    def __init__(self, pages=1000, departments=10, courses=5, links=8,
+                 depth=3, sequences=0.2, words=5000, seed=0):
+        '''
+        Constructor of the SyntheticCatalog class.
+
+        Inputs:
+            pages (int): number of pages (at least 2 + departments)
+            departments (int): number of departments
+            courses (int): main course blocks on each course page
+            links (int): links from each course page to other course
+              pages, besides the links down its department's tree
+            depth (int): levels of each department's tree of pages
+            sequences (float): fraction of main blocks followed by
+              subsequence blocks
+            words (int): size of the vocabulary course text is drawn from
+            seed (int): seed of everything random
+        '''
+        if departments < 1 or pages < 2 + departments:
+            raise ValueError("a catalog needs at least 2 + departments pages")
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        self.pages = pages
+        self.departments = departments
+        self.courses = courses
+        self.links = links
+        self.depth = depth
+        self.sequences = sequences
+        self.seed = seed
+        self.vocabulary = make_vocabulary(words, seed)
+        # Zipf-like word frequencies
+        self._weights = []
+        total = 0.0
+        for i in range(len(self.vocabulary)):
+            total += 1.0 / (i + 1)
+            self._weights.append(total)
+
+        course_pages = pages - 2
+        base, extra = divmod(course_pages, departments)
+        self.department_sizes = [base + (d < extra)
+                                 for d in range(departments)]
+        self._department_start = []
+        start = 0
+        for size in self.department_sizes:
+            self._department_start.append(start)
+            start += size
+        largest = max(self.department_sizes)
+        self.branching = 1
+        while sum(self.branching ** k for k in range(depth)) < largest:
+            self.branching += 1
+        self._slots = courses * (1 + MAX_SEQUENCE)
+        self._pages_per_prefix = max(1, COURSE_NUMBERS // max(self._slots, 1))
+        self.department_names = ["dept" + department_code(d).lower()
+                                 for d in range(departments)]
+
+    def department_path(self, d, i):
+        '''
+        Path of the i-th page of department d (page 0 is its index).
+        '''
+        name = self.department_names[d]
+        if i == 0:
+            return "thecollege/{}/index.html".format(name)
+        return "thecollege/{}/p{}.html".format(name, i)
+
+    def paths(self):
+        '''
+        Paths of every page, home page first.
+        '''
+        yield HOME
+        yield COLLEGE
+        for d, size in enumerate(self.department_sizes):
+            for i in range(size):
+                yield self.department_path(d, i)
+
+    def _locate(self, path):
+        '''
+        (department, page) of a course page path, or None.
+        '''
+        parts = path.split("/")
+        if len(parts) != 3 or parts[0] != "thecollege":
+            return None
+        try:
+            d = self.department_names.index(parts[1])
+        except ValueError:
+            return None
+        if parts[2] == "index.html":
+            return d, 0
+        name = parts[2]
+        if not (name.startswith("p") and name.endswith(".html")):
+            return None
+        try:
+            i = int(name[1:-5])
+        except ValueError:
+            return None
+        if 0 < i < self.department_sizes[d] and name == "p{}.html".format(i):
+            return d, i
+        return None
+
+    def _blocks(self, d, i):
+        '''
+        Course codes of the blocks on a course page: a list of (main
+        code, [subsequence codes]).
+        '''
+        number = self._department_start[d] + i
+        prefix = department_code(number // self._pages_per_prefix)
+        next_number = FIRST_COURSE_NUMBER + \
+            (number % self._pages_per_prefix) * self._slots
+        rng = random.Random("{}:{}:{}:blocks".format(self.seed, d, i))
+        blocks = []
+        for _ in range(self.courses):
+            sequence = 0
+            if rng.random() < self.sequences:
+                sequence = rng.randint(2, MAX_SEQUENCE)
+            codes = ["{}\xa0{}".format(prefix, next_number + k)
+                     for k in range(sequence + 1)]
+            next_number += sequence + 1
+            blocks.append((codes[0], codes[1:]))
+        return blocks
+
+    def course_map(self):
+        '''
+        Every course code (with a regular space, as the crawler writes
+        it) mapped to an identifier, in page order.
+        '''
+        course_map = {}
+        for d, size in enumerate(self.department_sizes):
+            for i in range(size):
+                for main, sequence in self._blocks(d, i):
+                    for code in [main] + sequence:
+                        course_map[code.replace("\xa0", " ")] = \
+                            len(course_map)
+        return course_map
+
+    def _text(self, rng, low, high):
+        words = rng.choices(self.vocabulary, cum_weights=self._weights,
+                            k=rng.randint(low, high))
+        return words
+
+    def _title(self, rng):
+        return " ".join(word.capitalize() for word in self._text(rng, 2, 6))
+
+    def _desc(self, rng):
+        words = self._text(rng, 15, 60)
+        sentences = []
+        while words:
+            n = rng.randint(5, 15)
+            sentence, words = words[:n], words[n:]
+            sentence[0] = sentence[0].capitalize()
+            sentences.append(" ".join(sentence) + ".")
+        return " ".join(sentences)
+
+    def _link(self, page, target, text):
+        href = posixpath.relpath(target, posixpath.dirname(page) or ".")
+        return '<a href="{}">{}</a>'.format(html.escape(href), text)
+
+    def _nav(self, page):
+        '''
+        Navigation list: home, programs of study and the first
+        departments.
+        '''
+        items = [self._link(page, HOME, "Home"),
+                 self._link(page, COLLEGE, "The College")]
+        for d in range(min(self.departments, 8)):
+            items.append(self._link(page, self.department_path(d, 0),
+                                    self.department_names[d]))
+        return "\n".join("<li>{}</li>".format(item) for item in items)
+
+    def _render(self, page, title, content):
+        root = posixpath.relpath(".", posixpath.dirname(page) or ".")
+        root = "" if root == "." else root + "/"
+        footer = " |\n".join(link.format(root=root) for link in JUNK_LINKS)
+        return PAGE.format(title=html.escape(title), root=root,
+                           nav=self._nav(page), content=content,
+                           footer=footer).encode("utf-8")
+
+    def page(self, path):
+        '''
+        Body of the page at a path ("/thecollege/", "index.html", ...),
+        or None if there is no such page.
+        '''
+        path = path.lstrip("/")
+        if path == "" or path.endswith("/"):
+            path += "index.html"
+        if path == HOME:
+            content = "<p>The catalog lists every course offered in the " \
+                "College.</p>\n<p>{}</p>".format(
+                    self._link(HOME, COLLEGE, "Programs of study"))
+            return self._render(HOME, "College Catalog", content)
+        if path == COLLEGE:
+            items = [self._link(COLLEGE, self.department_path(d, 0),
+                                self.department_names[d])
+                     for d in range(self.departments)]
+            content = "<ul>\n{}\n</ul>".format(
+                "\n".join("<li>{}</li>".format(item) for item in items))
+            return self._render(COLLEGE, "Programs of Study", content)
+
+        located = self._locate(path)
+        if located is None:
+            return None
+        return self._course_page(path, *located)
+
+    def _course_page(self, path, d, i):
+        rng = random.Random("{}:{}:{}:text".format(self.seed, d, i))
+        blocks = []
+        for main, sequence in self._blocks(d, i):
+            kinds = [("main", main)] + [("subsequence", code)
+                                        for code in sequence]
+            for kind, code in kinds:
+                blocks.append(BLOCK.format(
+                    kind=kind, code=code.replace("\xa0", "&#160;"),
+                    title=self._title(rng), desc=self._desc(rng)))
+
+        links = []
+        size = self.department_sizes[d]
+        first_child = i * self.branching + 1
+        for child in range(first_child,
+                           min(first_child + self.branching, size)):
+            links.append(self._link(path, self.department_path(d, child),
+                                    "Page {}".format(child)))
+        for _ in range(self.links):
+            other = rng.randrange(self.departments)
+            j = rng.randrange(self.department_sizes[other])
+            links.append(self._link(path, self.department_path(other, j),
+                                    "See also"))
+
+        # No whitespace between blocks: util.find_sequence only walks
+        # over siblings that directly follow the main block
+        content = '<div class="courses">\n{}\n</div>\n<p>{}</p>'.format(
+            "".join(blocks), " |\n".join(links))
+        return self._render(path, self.department_names[d], content)
+
+    def write(self, root):
+        '''
+        Writes every page under a directory (to serve it with
+        localserver.serve_directory).
+        '''
+        for path in self.paths():
+            filename = os.path.join(root, *path.split("/"))
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename, "wb") as f:
+                f.write(self.page(path))
+
+
+def _serve_process(catalog, latency, conn):
+    '''
+    Server process of serve_catalog: sends the server's URL and domain,
+    then serves until told to stop.
+    '''
+    with localserver.serve_pages(catalog, latency) as server:
+        conn.send((server.url, server.domain))
+        conn.recv()
+
+
+class CatalogServer:
+    '''
+    Address of a catalog served by serve_catalog.
+    '''
+    def __init__(self, url, domain):
+        '''
+        Constructor of the CatalogServer class.
+        '''
+        self.url = url
+        self.domain = domain
+
+
+@contextlib.contextmanager
+def serve_catalog(catalog, latency=0.0, process=True):
+    '''
+    Serves a catalog on an ephemeral port for the duration of a with
+    block.
+    Inputs:
+        catalog (SyntheticCatalog): the catalog
+        latency (float): seconds to sleep before answering each request
+        process (bool): run the server in a separate process (otherwise
+          in a thread, see localserver.serve_pages)
+    Output:
+        server object with url and domain attributes
+    '''
+    if not process:
+        with localserver.serve_pages(catalog, latency) as server:
+            yield server
+        return
+
+    parent, child = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_serve_process,
+                                     args=(catalog, latency, child),
+                                     daemon=True)
+    server.start()
+    try:
+        url, domain = parent.recv()
+        yield CatalogServer(url, domain)
+    finally:
+        if server.is_alive():
+            parent.send("stop")
+        server.join(5)
+        if server.is_alive():
+            server.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="write a synthetic catalog to a directory")
+    parser.add_argument("root", help="directory to write the pages to")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--departments", type=int, default=10)
+    parser.add_argument("--courses", type=int, default=5,
+                        help="main course blocks per course page")
+    parser.add_argument("--links", type=int, default=8,
+                        help="links to other course pages per page")
+    parser.add_argument("--depth", type=int, default=3,
+                        help="levels of each department's tree of pages")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    SyntheticCatalog(args.pages, args.departments, args.courses, args.links,
+                     args.depth, seed=args.seed).write(args.root)
@@ -0,0 +1,222 @@
+"""
+Crawl checkpoints
+
+A checkpoint is everything crawl needs to carry on where it stopped:
+the BFS frontier and, for every page visited, in visit order, the
+SHA-256 of its body together with its link hrefs and postings (words
+mapped to course codes).  The visited and enqueued URLs and the
+partial index are not stored; crawler.start_state rebuilds them by
+replaying the visited pages in order, so they can be kept in any
+seen-URL store (see seenurls.py).
+
+Checkpoints are gzip-compressed JSON, written through a temporary file
+and os.replace so an interrupted save never leaves a partial file:
+
+    {"version": 3, "starting_url": ..., "limiting_domain": ...,
+     "frontier": [url, ...], "visited": [url, ...],
+     "pages": {url: [sha256, hrefs, [[word, course codes], ...]]}}
+
+Postings are stored as [word, course codes] pairs, in page order.
+
+The page records also make incremental crawls possible: a page whose
+body hashes the same as in the previous run reuses its recorded links
+and postings instead of being parsed again.
+"""
+# pylint: disable-msg=invalid-name
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+import invindex
+import scheduler as schedulers
+
+
+VERSION = 3
+
+# Pages visited between two checkpoints
+DEFAULT_EVERY = 100
+
+
+def content_hash(body):
+    '''
+    SHA-256 of a page body (bytes or str), as a hex string.
+    '''
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return hashlib.sha256(body).hexdigest()
+
+
+class CrawlState:
+    '''
+    The state of a crawl: frontier, visited and enqueued URLs, the
+    partial index and the record of each visited page.
+    '''
+    def __init__(self, starting_url, limiting_domain, seen=set,
+                 scheduler=None):
+        '''
+        Constructor of the CrawlState class.
+
+        Inputs:
+            starting_url (str): first page of the crawl
+            limiting_domain (str): domain the crawl must stay within
+            seen (function): makes the stores of visited and enqueued
+              URLs (see seenurls.store_factory)
+            scheduler (scheduler.Scheduler): frontier to use (emptied
+              first); a FIFO one if not given
+        '''
+        if scheduler is None:
+            scheduler = schedulers.Scheduler()
+        scheduler.clear()
+        scheduler.append(starting_url)
+        self.starting_url = starting_url
+        self.limiting_domain = limiting_domain
+        self.frontier = scheduler
+        self.q_tracker = seen()
+        self.urls_visited = seen()
+        self.visit_order = []
+        self.index = invindex.InvertedIndex()
+        self.pages = {} # url -> [content hash, hrefs, postings]
+
+    @property
+    def pages_visited(self):
+        '''
+        Number of pages visited so far.
+        '''
+        return len(self.visit_order)
+
+    def record_page(self, page):
+        '''
+        Records a page that process_page has just added to the crawl.
+        '''
+        self.visit_order.append(page.url)
+        self.pages[page.url] = [content_hash(page.body), page.hrefs,
+                                page.postings]
+
+    def unchanged(self, url, body):
+        '''
+        Recorded (hrefs, postings) of the page at url if body hashes the
+        same as when it was recorded, None otherwise.
+        '''
+        record = self.pages.get(url)
+        if record is None or record[0] != content_hash(body):
+            return None
+        return record[1], record[2]
+
+    def finish(self):
+        '''
+        Drops the records of pages this crawl did not visit.
+        '''
+        self.pages = {url: self.pages[url] for url in self.visit_order}
+
+    def to_json(self, pending=()):
+        '''
+        JSON-serializable form of the state.  pending are URLs taken
+        from the frontier but not yet processed; they are put back at
+        its front.
+        '''
+        return {"version": VERSION,
+                "starting_url": self.starting_url,
+                "limiting_domain": self.limiting_domain,
+                "frontier": list(pending) + list(self.frontier),
+                "visited": self.visit_order,
+                "pages": {url: [digest, hrefs, list(postings.items())]
+                          for url, (digest, hrefs, postings)
+                          in self.pages.items()}}
+
+    @classmethod
+    def from_json(cls, data, seen=set, scheduler=None):
+        '''
+        Rebuilds a state saved with to_json, with empty visited and
+        enqueued URL stores and an empty index (see the module
+        docstring).
+        '''
+        if data.get("version") != VERSION:
+            raise ValueError("unsupported checkpoint version: {}".format(
+                data.get("version")))
+        state = cls(data["starting_url"], data["limiting_domain"], seen,
+                    scheduler)
+        state.frontier.clear()
+        state.frontier.extend(data["frontier"])
+        state.visit_order = data["visited"]
+        state.pages = {url: [digest, hrefs, dict(postings)]
+                       for url, (digest, hrefs, postings)
+                       in data["pages"].items()}
+        return state
+
+
+class Checkpoint:
+    '''
+    A checkpoint file, and how a crawl should use it.
+    '''
+    def __init__(self, path, every=DEFAULT_EVERY, resume=False,
+                 incremental=False):
+        '''
+        Constructor of the Checkpoint class.
+
+        Inputs:
+            path (str): checkpoint file
+            every (int): pages visited between two saves (at least 1)
+            resume (bool): continue the crawl saved in path, if any
+            incremental (bool): start a new crawl, but reuse the links
+              and postings of pages that have not changed since the
+              crawl saved in path
+        '''
+        if every < 1:
+            raise ValueError("checkpoints must be at least 1 page apart")
+        self.path = path
+        self.every = every
+        self.resume = resume
+        self.incremental = incremental
+        self.saves = 0
+
+    def load(self, seen=set, scheduler=None):
+        '''
+        The state saved in the checkpoint file (see
+        CrawlState.from_json), or None if there is none.
+        '''
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                return CrawlState.from_json(json.load(f), seen, scheduler)
+        except FileNotFoundError:
+            return None
+
+    def save(self, state, pending=()):
+        '''
+        Saves state (see CrawlState.to_json for pending).
+        '''
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "wb") as raw, \
+            gzip.open(raw, "wt", encoding="utf-8") as f:
+            json.dump(state.to_json(pending), f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+        self.saves += 1
+
+    def due(self, state):
+        '''
+        Whether a save is due after the page just visited.
+        '''
+        return state.pages_visited % self.every == 0
+
+    def start(self, starting_url, limiting_domain, seen=set, scheduler=None):
+        '''
+        State to start a crawl from: the saved one when resuming, a new
+        one otherwise (carrying the saved page records when incremental).
+        '''
+        saved = None
+        if self.resume or self.incremental:
+            saved = self.load(seen, scheduler)
+        if saved is not None and (saved.starting_url != starting_url or
+                                  saved.limiting_domain != limiting_domain):
+            raise ValueError("checkpoint {} is for a crawl of {}".format(
+                self.path, saved.starting_url))
+
+        if self.resume and saved is not None:
+            return saved
+        state = CrawlState(starting_url, limiting_domain, seen, scheduler)
+        if self.incremental and saved is not None:
+            state.pages = saved.pages
+        return state
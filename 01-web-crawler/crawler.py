@@ -6,74 +6,684 @@ Gabriela Ayala
 # DO NOT REMOVE THESE LINES OF CODE
 # pylint: disable-msg=invalid-name, redefined-outer-name, unused-argument, unused-variable
 
-import queue
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import cProfile
+import pstats
 import json
-import sys
 import csv
-import re
-from this import d
-import bs4
+import threading
+import time
+import urllib.parse
+import checkpoint as checkpoints
+import httpcache
+import httppool
+import linkscan
+import parsers
+import scheduler as schedulers
+import seenurls
+import tokenizer
+import tracing
+import urlnorm
 import util
-import requests
 
 
-INDEX_IGNORE = set(['a', 'also', 'an', 'and', 'are', 'as', 'at', 'be',
-                    'but', 'by', 'course', 'for', 'from', 'how', 'i',
-                    'ii', 'iii', 'in', 'include', 'is', 'not', 'of',
-                    'on', 'or', 's', 'sequence', 'so', 'social', 'students',
-                    'such', 'that', 'the', 'their', 'this', 'through', 'to',
-                    'topics', 'units', 'we', 'were', 'which', 'will', 'with',
-                    'yet'])
+INDEX_IGNORE = tokenizer.INDEX_IGNORE
 
 
-def crawl(num_pages_to_crawl):
+STARTING_URL = ("http://www.classes.cs.uchicago.edu/archive/2015/winter"
+                "/12200-1/new.collegecatalog.uchicago.edu/index.html")
+LIMITING_DOMAIN = "classes.cs.uchicago.edu"
+
+
+Page = collections.namedtuple("Page", ["url", "request", "body", "soup",
+                                     "parser", "hrefs", "postings"])
+
+
+class CrawlStats:
+    '''
+    Counters for a single crawl: requests issued, bytes downloaded,
+    time spent scanning pages for links and parsing them, pages fully
+    parsed, pages visited, and pages whose links and postings were
+    reused because they had not changed since the checkpointed crawl.
+    Safe to update from the fetcher threads of crawl_async.
+
+    crawl_async also samples the depth of each stage of its pipeline
+    (see sample_queues) once per page it processes.  With a tracer, the
+    crawl also records where each page's time went (see tracing.py).
+    '''
+    def __init__(self, tracer=None):
+        '''
+        Constructor of the CrawlStats class.
+
+        Inputs:
+            tracer (tracing.Tracer): optional per-page tracer
+        '''
+        self.tracer = tracer
+        self.requests = 0
+        self.bytes_downloaded = 0
+        self.parse_time = 0.0
+        self.scan_time = 0.0
+        self.parsed = 0
+        self.pages = 0
+        self.unchanged = 0
+        self.queues = {} # stage -> [samples, total depth, max depth]
+        self._lock = threading.Lock()
+
+    def add(self, requests=0, bytes_downloaded=0, parse_time=0.0,
+            scan_time=0.0, parsed=0, pages=0, unchanged=0):
+        '''
+        Adds to the counters.
+        '''
+        with self._lock:
+            self.requests += requests
+            self.bytes_downloaded += bytes_downloaded
+            self.parse_time += parse_time
+            self.scan_time += scan_time
+            self.parsed += parsed
+            self.pages += pages
+            self.unchanged += unchanged
+
+    def sample_queues(self, **depths):
+        '''
+        Records the current depth of each named pipeline stage.
+        '''
+        with self._lock:
+            for stage, depth in depths.items():
+                sample = self.queues.setdefault(stage, [0, 0, 0])
+                sample[0] += 1
+                sample[1] += depth
+                sample[2] = max(sample[2], depth)
+
+    def queue_report(self):
+        '''
+        Mean and max depth of each sampled stage, one line per stage.
+        '''
+        lines = []
+        for stage, (samples, total, deepest) in self.queues.items():
+            lines.append("{:<10} mean {:>6.2f}  max {:>4}".format(
+                stage, total / samples, deepest))
+        return "\n".join(lines)
+
+    def __str__(self):
+        '''
+        One-line summary of the counters.
+        '''
+        return ("{} pages ({} parsed, {} unchanged), {} requests, "
+                "{} bytes downloaded, {:.3f}s scanning, {:.3f}s parsing").format(
+                    self.pages, self.parsed, self.unchanged, self.requests,
+                    self.bytes_downloaded, self.scan_time, self.parse_time)
+
+
+def crawl(num_pages_to_crawl, starting_url=STARTING_URL,
+          limiting_domain=LIMITING_DOMAIN, stats=None, session=None,
+          parser=parsers.HTML5LIB, scan_links=None, checkpoint=None,
+          seen=set, scheduler=None):
     '''
     Crawls links on a page from a starting url and generates an index
     of words and course codes.
+
+    With a checkpoint, the crawl state is saved every checkpoint.every
+    pages, when the crawl ends and when it is interrupted while fetching
+    a page, and the crawl can resume from it or reuse the pages it
+    recorded (see checkpoint.py).
     Inputs:
-        starting url
         n (int) : max number of pages to visit
+        starting_url (str): first page of the crawl
+        limiting_domain (str): domain the crawl must stay within
+        stats (CrawlStats): optional counters to update
+        session (HttpSession): connection pool to fetch with (if not
+          given, a new one is used for the crawl, see
+          httpcache.session_from_env)
+        parser: parser backend or its name (see parsers.PARSERS)
+        scan_links (bool): find links with a streaming scan and fully
+          parse only pages with course blocks (see fetch_page); None
+          uses the parser's scan_first
+        checkpoint (checkpoint.Checkpoint): optional checkpoint file
+        seen (function): makes the stores of visited and enqueued URLs
+          (see seenurls.py)
+        scheduler (scheduler.Scheduler): frontier with per-host pacing
+          and priorities (a FIFO if not given)
     Output: 
-        (dict): dictionary of words mapped to course codes
+        (InvertedIndex): words mapped to course codes (see invindex.py)
     '''
-    starting_url = ("http://www.classes.cs.uchicago.edu/archive/2015/winter"
-                    "/12200-1/new.collegecatalog.uchicago.edu/index.html")
-    limiting_domain = "classes.cs.uchicago.edu"
+    if session is None:
+        with httpcache.session_from_env() as session:
+            return crawl(num_pages_to_crawl, starting_url, limiting_domain,
+                         stats, session, parser, scan_links, checkpoint,
+                         seen, scheduler)
+    parser = parsers.get_parser(parser)
+    if scan_links is None:
+        scan_links = parser.scan_first
 
-    q = queue.Queue() 
-    q.put(starting_url)
-    num_page_visited = 0
-    urls_visited = set()
-    q_tracker = set()
-    index = {}
+    state, known = start_state(starting_url, limiting_domain, checkpoint,
+                               seen, scheduler)
+    q = state.frontier
+    fetching = None # URL taken from q and not yet fetched
 
-    while num_page_visited <= num_pages_to_crawl or q.empty():
-        url = q.get()
-   
-        if make_soup(url, limiting_domain) is not None:
-            true_url, soup = make_soup(url, limiting_domain)
-        else:
-            url = q.get()
-     
-        links = soup.find_all("a")
-        urls_visited.add(true_url)
-
-        for i in links:
-            if i.has_attr("href"):
-                new_url = util.remove_fragment(i.attrs["href"])
-                if not util.is_absolute_url(new_url):
-                    new_url = util.convert_if_relative_url(url, new_url) 
-            if util.is_url_ok_to_follow(new_url, limiting_domain) and \
-                new_url not in urls_visited:
-                if new_url not in q_tracker:
-                    q_tracker.add(new_url)
-                    q.put(new_url)
-        
-        temp = temp_index(soup) # Dictionary mapping words to course codes
-        index.update(temp)
-        num_page_visited += 1
-       
-    return index
+    try:
+        while state.pages_visited < num_pages_to_crawl and q:
+            url = fetching = q.popleft()
+            trace = tracing.start_trace(stats)
+            page = fetch_page(fetching, limiting_domain, stats, session,
+                              parser, scan_links, known, trace)
+            fetching = None
+            if page is None:
+                trace_page(stats, url, trace, False)
+                continue
+
+            new_urls = process_page(page, limiting_domain,
+                                    state.urls_visited, state.q_tracker,
+                                    state.index, trace)
+            trace_page(stats, url, trace, new_urls is not None)
+            if new_urls is None:
+                continue
+            q.extend(new_urls)
+            visit_page(state, page, stats, checkpoint)
+    except BaseException:
+        if checkpoint is not None and fetching is not None:
+            checkpoint.save(state, [fetching])
+        raise
+
+    return finish_state(state, num_pages_to_crawl, checkpoint)
+
+
+def start_state(starting_url, limiting_domain, checkpoint, seen=set,
+                scheduler=None):
+    '''
+    State for a new crawl, or the one to carry on from.  The visited and
+    enqueued URLs and the index of a resumed crawl are rebuilt by
+    processing its recorded pages again, in the order it visited them.
+    Inputs:
+        starting_url (str): first page of the crawl
+        limiting_domain (str): domain the crawl must stay within
+        checkpoint (checkpoint.Checkpoint): checkpoint file or None
+        seen (function): makes the stores of visited and enqueued URLs
+        scheduler (scheduler.Scheduler): frontier to use, or None
+    Output:
+        (tuple) the CrawlState, and the same state if fetch_page may
+        reuse its page records (None otherwise)
+    '''
+    if checkpoint is None:
+        return checkpoints.CrawlState(starting_url, limiting_domain,
+                                      seen, scheduler), None
+    state = checkpoint.start(starting_url, limiting_domain, seen, scheduler)
+    for url in state.visit_order:
+        _, hrefs, postings = state.pages[url]
+        process_page(Page(url, None, None, None, None, hrefs, postings),
+                     limiting_domain, state.urls_visited, state.q_tracker,
+                     state.index)
+    return state, state
+
+
+def trace_page(stats, url, trace, visited):
+    '''
+    Hands a page's trace to the crawl's tracer (if it is traced).
+    '''
+    if trace is not None:
+        stats.tracer.page(url, trace, visited=visited)
+
+
+def visit_page(state, page, stats, checkpoint):
+    '''
+    Counts a page process_page has added to the crawl, recording it and
+    saving a checkpoint when one is due.
+    '''
+    if stats is not None:
+        stats.add(pages=1)
+    if checkpoint is not None:
+        state.record_page(page)
+        if checkpoint.due(state):
+            checkpoint.save(state)
+
+
+def finish_state(state, num_pages_to_crawl, checkpoint):
+    '''
+    Saves the final checkpoint of a crawl that has stopped.
+    Output:
+        (InvertedIndex) the index
+    '''
+    if checkpoint is not None:
+        if not state.frontier:
+            # Every reachable page was visited: forget the rest
+            state.finish()
+        checkpoint.save(state)
+    return state.index
+
+
+def crawl_async(num_pages_to_crawl, starting_url=STARTING_URL,
+                limiting_domain=LIMITING_DOMAIN, concurrency=8,
+                per_host=None, queue_size=None, stats=None, session=None,
+                parser=parsers.HTML5LIB, scan_links=None, workers=None,
+                checkpoint=None, seen=set, scheduler=None):
+    '''
+    Crawls like crawl, but keeps up to concurrency requests in flight.
+    Pages are fetched ahead of time from the front of the BFS frontier
+    and then processed strictly in the order crawl would process them,
+    so the resulting index is identical to the serial one.
+
+    With workers, parsing runs in a pool of worker processes: fetchers
+    hand each page body to the pool and get back its links and postings
+    (see parse_page_worker), so parsing is not limited to one core.
+
+    Checkpoints work as they do for crawl; pages that were dispatched
+    to the fetchers but not yet processed are saved at the front of the
+    frontier.  With a scheduler, each fetcher waits for its URL's host
+    to be ready before fetching it.
+    Inputs:
+        n (int) : max number of pages to visit
+        starting_url (str): first page of the crawl
+        limiting_domain (str): domain the crawl must stay within
+        concurrency (int): number of fetcher tasks
+        per_host (int): max in-flight requests to a single host
+          (defaults to concurrency)
+        queue_size (int): max number of URLs handed to the fetchers
+          but not yet processed (defaults to 2 * concurrency)
+        stats (CrawlStats): optional counters to update
+        session (HttpSession): connection pool to fetch with (a new
+          one with per_host connections per host is used if not given,
+          see httpcache.session_from_env)
+        parser: parser backend or its name (see parsers.PARSERS)
+        scan_links (bool): find links with a streaming scan and fully
+          parse only pages with course blocks (see fetch_page); None
+          uses the parser's scan_first
+        workers (int): number of parser processes (None parses in
+          the fetcher threads)
+        checkpoint (checkpoint.Checkpoint): optional checkpoint file
+        seen (function): makes the stores of visited and enqueued URLs
+          (see seenurls.py)
+        scheduler (scheduler.Scheduler): frontier with per-host pacing
+          and priorities (a FIFO if not given)
+    Output: 
+        (InvertedIndex): words mapped to course codes (see invindex.py)
+    '''
+    if per_host is None:
+        per_host = concurrency
+    if queue_size is None:
+        queue_size = 2 * concurrency
+    if session is None:
+        with httpcache.session_from_env(pool_size=per_host) as session:
+            return crawl_async(num_pages_to_crawl, starting_url,
+                               limiting_domain, concurrency, per_host,
+                               queue_size, stats, session, parser,
+                               scan_links, workers, checkpoint, seen,
+                               scheduler)
+    parser = parsers.get_parser(parser)
+    if scan_links is None:
+        scan_links = parser.scan_first
+
+    return asyncio.run(_crawl_async(num_pages_to_crawl, starting_url,
+                                    limiting_domain, concurrency, per_host,
+                                    queue_size, stats, session, parser,
+                                    scan_links, workers, checkpoint, seen,
+                                    scheduler))
+
+
+async def _crawl_async(num_pages_to_crawl, starting_url, limiting_domain,
+                       concurrency, per_host, queue_size, stats, session,
+                       parser, scan_links, workers, checkpoint, seen,
+                       scheduler):
+    '''
+    Event loop side of crawl_async.
+    '''
+    loop = asyncio.get_running_loop()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+    pool = None
+    if workers:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    host_limits = collections.defaultdict(lambda: asyncio.Semaphore(per_host))
+    pending = asyncio.Queue(maxsize=queue_size)
+    depths = {"fetching": 0, "parsing": 0}
+
+    async def read_robots(urls):
+        # Fetch the robots.txt of new hosts in the executor, so that
+        # adding their URLs to the scheduler does not block the loop
+        if scheduler is None:
+            return
+        unknown = scheduler.unknown_hosts(urls)
+        delays = await asyncio.gather(*(
+            loop.run_in_executor(executor, schedulers.robots_crawl_delay,
+                                 url, scheduler.robots) for url in unknown))
+        for url, delay in zip(unknown, delays):
+            scheduler.set_crawl_delay(url, delay)
+
+    await read_robots([starting_url])
+    state, known = start_state(starting_url, limiting_domain, checkpoint,
+                               seen, scheduler)
+
+    async def fetch(url, trace):
+        host = urllib.parse.urlparse(url).netloc
+        async with host_limits[host]:
+            depths["fetching"] += 1
+            try:
+                if pool is None:
+                    return await loop.run_in_executor(
+                        executor, fetch_page, url, limiting_domain, stats,
+                        session, parser, scan_links, known, trace)
+                fetched = await loop.run_in_executor(
+                    executor, download_page, url, limiting_domain, stats,
+                    session, trace)
+            finally:
+                depths["fetching"] -= 1
+
+        if fetched is None:
+            return None
+        page = reuse_page(fetched, parser, known, stats, trace)
+        if page is not None:
+            return page
+        true_url, request, body = fetched
+        depths["parsing"] += 1
+        try:
+            hrefs, postings, timings = await loop.run_in_executor(
+                pool, parse_page_worker, body, parser.name, scan_links,
+                trace is not None)
+        finally:
+            depths["parsing"] -= 1
+        scan_time, parse_time, parsed, phases = timings
+        if stats is not None:
+            stats.add(scan_time=scan_time, parse_time=parse_time,
+                      parsed=parsed)
+        if trace is not None:
+            trace.update(phases)
+        return Page(true_url, request, body, None, parser, hrefs, postings)
+
+    async def fetcher():
+        while True:
+            url, not_before, fut, trace = await pending.get()
+            try:
+                delay = not_before - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                page = await fetch(url, trace)
+            except Exception as e:
+                fut.set_exception(e)
+            else:
+                fut.set_result(page)
+
+    frontier = state.frontier
+    # URLs, futures and traces of dispatched pages, BFS order
+    in_order = collections.deque()
+    waiting = None # URL whose page is being awaited
+    processing = False # True while the crawl state is being updated
+
+    fetchers = [asyncio.create_task(fetcher()) for _ in range(concurrency)]
+    try:
+        while state.pages_visited < num_pages_to_crawl and \
+            (frontier or in_order):
+            # Never look further ahead than the pages we may still visit
+            lookahead = min(queue_size,
+                            num_pages_to_crawl - state.pages_visited)
+            while frontier and len(in_order) < lookahead:
+                url, not_before = frontier.reserve()
+                fut = loop.create_future()
+                trace = tracing.start_trace(stats)
+                in_order.append((url, fut, trace))
+                await pending.put((url, not_before, fut, trace))
+
+            if stats is not None:
+                stats.sample_queues(
+                    frontier=len(frontier), fetch=pending.qsize(),
+                    fetching=depths["fetching"], parsing=depths["parsing"],
+                    ready=sum(1 for _, fut, _ in in_order if fut.done()))
+
+            waiting, fut, trace = in_order.popleft()
+            page = await fut
+            url, waiting = waiting, None
+            if page is None:
+                trace_page(stats, url, trace, False)
+                continue
+
+            processing = True
+            new_urls = process_page(page, limiting_domain,
+                                    state.urls_visited, state.q_tracker,
+                                    state.index, trace)
+            trace_page(stats, url, trace, new_urls is not None)
+            if new_urls is not None:
+                await read_robots(new_urls)
+                frontier.extend(new_urls)
+                visit_page(state, page, stats, checkpoint)
+            processing = False
+    except BaseException:
+        if checkpoint is not None and not processing:
+            pending_urls = [url for url, _, _ in in_order]
+            if waiting is not None:
+                pending_urls.insert(0, waiting)
+            checkpoint.save(state, pending_urls)
+        raise
+    finally:
+        for task in fetchers:
+            task.cancel()
+        await asyncio.gather(*fetchers, return_exceptions=True)
+        executor.shutdown(wait=False, cancel_futures=True)
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    pending_urls = [url for url, _, _ in in_order]
+    frontier.extendleft(reversed(pending_urls))
+    return finish_state(state, num_pages_to_crawl, checkpoint)
+
+
+def process_page(page, limiting_domain, urls_visited, q_tracker, index,
+                 trace=None):
+    '''
+    Records a fetched page in the crawl state: marks it visited, adds
+    its words to the index and collects the links to enqueue.
+    Inputs:
+        page (Page): fetched page
+        limiting_domain (str): domain the crawl must stay within
+        urls_visited (set): URLs already visited (updated in place)
+        q_tracker (set): URLs already enqueued (updated in place)
+        index (InvertedIndex): words mapped to course codes (updated in
+          place)
+        trace (dict): optional page trace (see tracing.py)
+    Output:
+        (list) new URLs to enqueue, in page order, or None if the page
+        had already been visited under another URL.
+    '''
+    if page.url in urls_visited:
+        return None
+    urls_visited.add(page.url)
+
+    new_urls = []
+    with tracing.timed(trace, "follow"):
+        for new_url in get_links(page.url, page.hrefs, limiting_domain):
+            if new_url not in urls_visited and new_url not in q_tracker:
+                q_tracker.add(new_url)
+                new_urls.append(new_url)
+
+    # Merge the page's words and course codes into the index
+    with tracing.timed(trace, "merge"):
+        index.add(page.postings)
+
+    return new_urls
+
+
+def get_links(url, hrefs, limiting_domain):
+    '''
+    Finds the links on a page that the crawler may follow: each href
+    without its fragment, made absolute, and kept if
+    util.is_url_ok_to_follow accepts it.  Verdicts are cached (see
+    urlnorm.py).
+    Inputs:
+        url (str): URL of the page, used to resolve relative links
+        hrefs (list): href values of the links on the page
+        limiting_domain (str): domain the crawl must stay within
+    Output:
+        (list) absolute URLs in page order (may contain duplicates)
+    '''
+    return urlnorm.normalizer(limiting_domain).normalize_links(url, hrefs)
+
+
+def fetch_page(url, limiting_domain, stats=None, session=None,
+               parser=parsers.HTML5LIB, scan_links=False, known=None,
+               trace=None):
+    '''
+    Fetches and parses a page, issuing exactly one request and parsing
+    the body at most once (see download_page and parse_page).  A page
+    that known (a CrawlState) recorded with the same body is not
+    parsed: its recorded links and postings are reused.
+    Inputs:
+        (str) a URL
+        (str) limiting domain
+        (CrawlStats) optional counters to update
+        (HttpSession) optional connection pool or CachingSession;
+          util.get_request is used without one
+        parser backend (see parsers.PARSERS)
+        (bool) scan_links
+        (CrawlState) optional record of previously visited pages
+        (dict) optional page trace (see tracing.py)
+    Output:
+        (Page) true URL, request object, body (as returned by
+        util.read_request), parsed page (or None), the parser backend,
+        the link hrefs and the page's postings if the URL is valid,
+        NoneType otherwise.
+    '''
+    fetched = download_page(url, limiting_domain, stats, session, trace)
+    if fetched is None:
+        return None
+    true_url, request, body = fetched
+
+    page = reuse_page(fetched, parser, known, stats, trace)
+    if page is not None:
+        return page
+
+    soup, hrefs, postings = parse_page(body, parser, scan_links, stats,
+                                       trace)
+    return Page(true_url, request, body, soup, parser, hrefs, postings)
+
+
+def reuse_page(fetched, parser, known, stats=None, trace=None):
+    '''
+    The page known recorded for a downloaded page, if its body has not
+    changed since.
+    Inputs:
+        (tuple) true URL, request object and body (see download_page)
+        parser backend (see parsers.PARSERS)
+        (CrawlState) record of previously visited pages, or None
+        (CrawlStats) optional counters to update
+        (dict) optional page trace (see tracing.py)
+    Output:
+        (Page) with no parsed page and the recorded links and postings,
+        or None
+    '''
+    if known is None:
+        return None
+    true_url, request, body = fetched
+    recorded = known.unchanged(true_url, body)
+    if recorded is None:
+        return None
+    if stats is not None:
+        stats.add(unchanged=1)
+    if trace is not None:
+        trace["unchanged"] = True
+    hrefs, postings = recorded
+    return Page(true_url, request, body, None, parser, hrefs, postings)
+
+
+def download_page(url, limiting_domain, stats=None, session=None,
+                  trace=None):
+    '''
+    Fetches a page with exactly one request.
+    Inputs:
+        (str) a URL
+        (str) limiting domain
+        (CrawlStats) optional counters to update
+        (HttpSession) optional connection pool or CachingSession;
+          util.get_request is used without one
+        (dict) optional page trace (see tracing.py)
+    Output:
+        (tuple) true URL, request object and body (as returned by
+        util.read_request) if the URL is valid, NoneType otherwise.
+    '''
+    if not util.is_url_ok_to_follow(url, limiting_domain):
+        return None
+
+    start = time.perf_counter()
+    if session is not None:
+        request = session.get_request(url)
+    else:
+        request = util.get_request(url)
+    tracing.record_response(trace, request, time.perf_counter() - start)
+    if stats is not None:
+        stats.add(requests=1)
+    if request is None:
+        return None
+    if stats is not None and not getattr(request, "from_cache", False):
+        stats.add(bytes_downloaded=len(request.content))
+
+    with tracing.timed(trace, "decode"):
+        body = util.read_request(request)
+    if body == "":
+        return None
+
+    return util.get_request_url(request), request, body
+
+
+def parse_page(body, parser=parsers.HTML5LIB, scan_links=False, stats=None,
+               trace=None):
+    '''
+    Parses a page body once and extracts its links and postings.
+
+    With scan_links, the links come from a streaming scan of the body
+    (see linkscan.py) and the page is only parsed if the scan found
+    course blocks; otherwise soup is None.
+    Inputs:
+        (bytes) page body
+        parser backend (see parsers.PARSERS)
+        (bool) scan_links
+        (CrawlStats) optional counters to update
+        (dict) optional page trace (see tracing.py)
+    Output:
+        (tuple) parsed page (or None), link hrefs, and a dictionary
+        mapping the page's words to course codes
+    '''
+    soup = None
+    hrefs = []
+    postings = {}
+    if scan_links:
+        start = time.perf_counter()
+        with tracing.timed(trace, "scan"):
+            hrefs, has_courses = linkscan.scan(body)
+        if stats is not None:
+            stats.add(scan_time=time.perf_counter() - start)
+    if not scan_links or has_courses:
+        start = time.perf_counter()
+        with tracing.timed(trace, "parse"):
+            soup = parser.parse(body)
+        if not scan_links:
+            with tracing.timed(trace, "links"):
+                hrefs = parser.hrefs(soup)
+        with tracing.timed(trace, "blocks"):
+            blocks = parser.course_blocks(soup)
+        with tracing.timed(trace, "tokenize"):
+            postings = index_course_blocks(blocks)
+        if stats is not None:
+            stats.add(parse_time=time.perf_counter() - start, parsed=1)
+
+    return soup, hrefs, postings
+
+
+def parse_page_worker(body, parser_name, scan_links, traced=False):
+    '''
+    Process-pool entry point for crawl_async: parse_page, returning
+    only what the crawl needs (the tree stays in the worker).
+    Inputs:
+        (bytes) page body
+        (str) name of the parser backend
+        (bool) scan_links
+        (bool) traced: also time the phases of parsing
+    Output:
+        (tuple) link hrefs, postings, and (scan time, parse time,
+        pages parsed, phase times (empty unless traced))
+    '''
+    stats = CrawlStats()
+    trace = {} if traced else None
+    _, hrefs, postings = parse_page(body, parsers.get_parser(parser_name),
+                                    scan_links, stats, trace)
+    return hrefs, postings, (stats.scan_time, stats.parse_time, stats.parsed,
+                             trace or {})
 
 
 def make_soup(url, limiting_domain):
@@ -86,38 +696,20 @@ def make_soup(url, limiting_domain):
         (tuple) true URL and soup object if URL passed in is 
         valid, NoneType otherwise.
     '''
-    if util.is_url_ok_to_follow(url, limiting_domain):
-        if util.get_request(url) is not None:
-            request = util.get_request(url)
-            true_url = util.get_request_url(request)
-            if util.read_request(request) != "":
-                s = util.read_request(request)
-                soup = bs4.BeautifulSoup(s, "html5lib")
-                return true_url, soup
-            else:
-                return None
-        else:
-            return None
-    else:
+    page = fetch_page(url, limiting_domain)
+    if page is None:
         return None
+    return page.url, page.soup
 
 
 def process_word(string):
     '''
     Proccesses a word.
     Input: (str) the word
-    Output: (str) processed words
+    Output: (str) processed word, or None if it is empty or ignored
     '''
+    return tokenizer.normalize_word(string)
 
-    if len(string) >= 1:
-        w = string.lower()
-        if w.endswith(("!", ".", ":")):
-            word = w[-1]
-        else:
-            word = w
-        if word not in INDEX_IGNORE:
-            return word
-          
 
 def temp_index(soup):
     '''
@@ -128,49 +720,53 @@ def temp_index(soup):
     Output: 
         (dict) dictionary mapping words to list of course codes.
     '''
+    return index_course_blocks(parsers.HTML5LIB.course_blocks(soup))
+
+
+def index_course_blocks(blocks):
+    '''
+    Maps words to a list of course codes where they appear in the 
+    course catalog.  Words are found with tokenizer.words, which
+    leaves out ignored words.
+    Input: 
+        (list) CourseBlocks from a parser backend
+    Output: 
+        (dict) dictionary mapping words to list of course codes.
+    '''
     index = {}
-    divs = soup.find_all("div", class_ = 'courseblock main')
-
-    for div in divs:
-        main_words = []
-        #Create set of words in Main Course Title and Description
-        main_title = div.find("p", class_ = 'courseblocktitle').text
-        course_code = (str(main_title.strip()[0:10])).replace(u'\xa0', u' ') #Main Course Code
-        main_title_text = main_title.strip()[10:].split() #Ignore Course Code from title text
-        for w in main_title_text:
-            word = process_word(w) 
-            main_words.append(word)
-        
-        main_desc = div.find("p", class_ = 'courseblockdesc').text.lower()
-        main_desc = main_desc.strip().split()
-        for w in main_desc:
-            word = process_word(w)
-            main_words.append(word)
-        #Dictionary mapping words to course code
-        for word in main_words:
-            index[word] = [course_code]
-        
-        #Create set of words in Sequence Course Title 
-        sequences = util.find_sequence(div) 
-        if sequences != []: 
-            for div in sequences:
-                seq_words = []
-                seq_title = div.find("p", class_ = 'courseblocktitle').text
-                seq_code = (str(seq_title.strip()[0:10])).replace(u'\xa0', u' ')
-                seq_title_text = seq_title.strip()[10:].split()
-                for w in seq_title_text:
-                    word = process_word(w) 
-                    seq_words.append(word)
-                #Updating dictionary with sequence words and code
-                for word in seq_words:
-                    if word not in index:
-                        index[word] = [seq_code]
-                    else:
-                        index[word].append(seq_code)
+
+    for block in blocks:
+        #Main course: words of its title (without the code) and description
+        course_code = tokenizer.course_code(block.title)
+        text = tokenizer.title_text(block.title) + "\n" + block.desc
+        for word in tokenizer.words(text):
+            add_posting(index, word, course_code)
+
+        #Sequence courses: words of their titles
+        for seq_title in block.sequence:
+            seq_code = tokenizer.course_code(seq_title)
+            for word in tokenizer.words(tokenizer.title_text(seq_title)):
+                add_posting(index, word, seq_code)
 
     return index 
 
-def go(num_pages_to_crawl, course_map_filename, index_filename):
+
+def add_posting(index, word, course_code):
+    '''
+    Adds course_code to the list of word in a page index, unless word is
+    None or the code is already the last one on the list.
+    '''
+    if word is None:
+        return
+    codes = index.setdefault(word, [])
+    if not codes or codes[-1] != course_code:
+        codes.append(course_code)
+
+
+def go(num_pages_to_crawl, course_map_filename, index_filename,
+       concurrency=None, stats=None, session=None, parser=parsers.HTML5LIB,
+       scan_links=None, workers=None, checkpoint=None, seen=set,
+       scheduler=None):
     '''
     Crawl the college catalog and generates a CSV file with an index.
 
@@ -179,45 +775,168 @@ def go(num_pages_to_crawl, course_map_filename, index_filename):
         course_map_filename: the name of a JSON file that contains the mapping
           course codes to course identifiers
         index_filename: the name for the CSV of the index.
+        concurrency: if set, crawl with crawl_async using this many
+          concurrent requests
+        stats: optional CrawlStats to update during the crawl
+        session: optional HttpSession or httpcache.CachingSession to
+          fetch pages with
+        parser: parser backend or its name (see parsers.PARSERS)
+        scan_links: find links with a streaming scan and fully parse
+          only pages with course blocks (None: the parser's default)
+        workers: if set, crawl with crawl_async and parse pages in this
+          many worker processes
+        checkpoint: optional checkpoint.Checkpoint to save the crawl to
+          (and resume it from)
+        seen: makes the stores of visited and enqueued URLs (see
+          seenurls.py)
+        scheduler: optional scheduler.Scheduler for per-host pacing
+          and priorities
 
     Outputs:
-        CSV file of the index index.
+        CSV file of the index index, with one identifier|word row for
+        every course a word appears in.  Returns the InvertedIndex.
     '''
 
     with open(course_map_filename) as fp:
         data = json.load(fp)
         
-    temp_index = crawl(num_pages_to_crawl)
-    final_index = {}
-
-    for word, course_lst in temp_index.items():
-        for course_code in course_lst:
-            identifier = data[course_code]
-            final_index[identifier] = word
-    
+    if concurrency or workers:
+        temp_index = crawl_async(num_pages_to_crawl,
+                                 concurrency=concurrency or 8, stats=stats,
+                                 session=session, parser=parser,
+                                 scan_links=scan_links, workers=workers,
+                                 checkpoint=checkpoint, seen=seen,
+                                 scheduler=scheduler)
+    else:
+        temp_index = crawl(num_pages_to_crawl, stats=stats, session=session,
+                           parser=parser, scan_links=scan_links,
+                           checkpoint=checkpoint, seen=seen,
+                           scheduler=scheduler)
+
     with open(index_filename, "w") as csvfile:
         spamwriter = csv.writer(csvfile, delimiter="|")
-        for code, word in final_index.items():
-            spamwriter.writerow([code, word])
+        spamwriter.writerows(temp_index.rows(data))
+
+    return temp_index
 
 ####
 
 if __name__ == "__main__":
     usage = "python3 crawl.py <number of pages to crawl>"
-    args_len = len(sys.argv)
+    parser = argparse.ArgumentParser(usage=usage + " [options]")
+    parser.add_argument("num_pages_to_crawl", type=int, nargs="?",
+                        default=1000)
+    parser.add_argument("--concurrency", type=int,
+                        help="crawl with this many requests in flight")
+    parser.add_argument("--workers", type=int,
+                        help="parse pages in this many worker processes")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="cache responses in DIR and revalidate them")
+    parser.add_argument("--cache-only", action="store_true",
+                        help="answer every request from --cache, offline")
+    parser.add_argument("--parser", choices=sorted(parsers.PARSERS),
+                        default=parsers.HTML5LIB.name,
+                        help="HTML parser backend")
+    parser.add_argument("--scan", dest="scan_links", action="store_true",
+                        default=None,
+                        help="scan pages for links and only fully parse "
+                             "pages with course blocks")
+    parser.add_argument("--no-scan", dest="scan_links", action="store_false",
+                        help="fully parse every page")
+    parser.add_argument("--checkpoint", metavar="FILE",
+                        help="save the crawl state to FILE as it goes")
+    parser.add_argument("--checkpoint-every", type=int, metavar="N",
+                        default=checkpoints.DEFAULT_EVERY,
+                        help="pages visited between two checkpoints")
+    parser.add_argument("--resume", action="store_true",
+                        help="carry on with the crawl saved in --checkpoint")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only re-index pages that changed since the "
+                             "crawl saved in --checkpoint")
+    parser.add_argument("--seen", choices=seenurls.STORES, default="set",
+                        help="how to store the visited and enqueued URLs")
+    parser.add_argument("--seen-capacity", type=int, metavar="N",
+                        help="URLs to size the seen-URL stores for")
+    parser.add_argument("--error-rate", type=float,
+                        default=seenurls.DEFAULT_ERROR_RATE,
+                        help="false-positive rate of --seen bloom")
+    parser.add_argument("--rate", type=float,
+                        help="most requests per second to any one host")
+    parser.add_argument("--burst", type=int, default=1,
+                        help="requests a host may get back to back")
+    parser.add_argument("--robots", action="store_true",
+                        help="honor the Crawl-delay of each host's "
+                             "robots.txt")
+    parser.add_argument("--departments-first", action="store_true",
+                        help="crawl pages under thecollege/ first")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="write a JSON line per page with its phase "
+                             "times to FILE and print their distribution")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run the crawl under cProfile and write the "
+                             "stats to FILE (worker processes are not "
+                             "profiled)")
+    args = parser.parse_args()
     course_map_filename = "course_map.json"
     index_filename = "catalog_index.csv"
-    if args_len == 1:
-        num_pages_to_crawl = 1000
-    elif args_len == 2:
-        try:
-            num_pages_to_crawl = int(sys.argv[1])
-        except ValueError:
-            print(usage)
-            sys.exit(0)
-    else:
-        print(usage)
-        sys.exit(0)
 
-    go(num_pages_to_crawl, course_map_filename, index_filename)
+    session = None
+    if args.cache:
+        mode = httpcache.CACHE_ONLY if args.cache_only else httpcache.REVALIDATE
+        session = httpcache.CachingSession(args.cache, mode)
+    elif args.cache_only:
+        parser.error("--cache-only requires --cache DIR")
+
+    if args.checkpoint_every < 1:
+        parser.error("--checkpoint-every must be at least 1")
+    if args.rate is not None and args.rate <= 0:
+        parser.error("--rate must be positive")
+    if args.burst < 1:
+        parser.error("--burst must be at least 1")
+    checkpoint = None
+    if args.checkpoint:
+        checkpoint = checkpoints.Checkpoint(args.checkpoint,
+                                            args.checkpoint_every,
+                                            args.resume, args.incremental)
+    elif args.resume or args.incremental:
+        parser.error("--resume and --incremental require --checkpoint FILE")
 
+    robots = None
+    if args.robots:
+        robots = httppool.HttpSession()
+    priority = None
+    if args.departments_first:
+        priority = schedulers.department_first
+    scheduler = schedulers.Scheduler(args.rate, args.burst, priority, robots)
+
+    tracer = None
+    if args.trace:
+        tracer = tracing.Tracer(args.trace)
+    stats = CrawlStats(tracer)
+    go_args = (args.num_pages_to_crawl, course_map_filename, index_filename,
+               args.concurrency, stats, session, args.parser,
+               args.scan_links, args.workers, checkpoint,
+               seenurls.store_factory(args.seen, args.seen_capacity,
+                                      args.error_rate),
+               scheduler)
+    if args.profile:
+        profiler = cProfile.Profile()
+        index = profiler.runcall(go, *go_args)
+        profiler.dump_stats(args.profile)
+    else:
+        index = go(*go_args)
+    print(stats)
+    print("index:", index)
+    if stats.queues:
+        print(stats.queue_report())
+    print(scheduler.report())
+    if tracer is not None:
+        tracer.close()
+        print(tracer.summary())
+    if args.profile:
+        pstats.Stats(args.profile).sort_stats("cumulative").print_stats(15)
+    if robots is not None:
+        robots.close()
+    if session is not None:
+        print(session)
+        session.close()
@@ -0,0 +1,287 @@
+"""
+On-disk HTTP response cache for the crawler
+
+Entries are stored under a cache directory and keyed by the SHA-256 of
+the normalized URL:
+
+    <dir>/urls/ab/ab12...json     final URL, status, encoding, headers
+                                  and the SHA-256 of the body
+    <dir>/bodies/cd/cd34...       response bodies, stored once per
+                                  distinct content
+
+CachingSession wraps an HttpSession and has the same get_request
+contract.  In "revalidate" mode cached entries are revalidated with
+If-None-Match / If-Modified-Since and a 304 is answered from disk (the
+entry takes the validators the 304 came with); in "cache-only" mode the
+network is never used and a miss returns None.
+When the network fails (no response at all), a cached copy is served
+stale; when the site answers 404 or 403, the entry is deleted.
+"""
+# pylint: disable-msg=invalid-name, broad-except
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import urllib.parse
+
+import requests
+import requests.structures
+
+import httppool
+
+
+REVALIDATE = "revalidate"
+CACHE_ONLY = "cache-only"
+MODES = (REVALIDATE, CACHE_ONLY)
+
+# Set these to make crawls use a cache without changing any code
+# (e.g. to run test_crawler.py offline from a previously filled cache)
+CACHE_DIR_ENV = "CRAWLER_CACHE_DIR"
+CACHE_MODE_ENV = "CRAWLER_CACHE_MODE"
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Headers of a 304 that replace those of the cached entry (RFC 9111,
+# section 4.3.4): the validators, and when the response was made
+REVALIDATED_HEADERS = ("Cache-Control", "Content-Location", "Date", "ETag",
+                       "Expires", "Last-Modified", "Vary")
+
+
+def normalize_url(url):
+    '''
+    Canonical form of a URL for use as a cache key: lowercase scheme
+    and host, no default port, no fragment, and "/" for an empty path.
+    '''
+    parsed = urllib.parse.urlsplit(url)
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or "").lower()
+    if parsed.port is not None and parsed.port != DEFAULT_PORTS.get(scheme):
+        host += ":" + str(parsed.port)
+    path = parsed.path or "/"
+    return urllib.parse.urlunsplit((scheme, host, path, parsed.query, ""))
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResponseCache:
+    '''
+    Directory of cached responses (see the module docstring for the
+    layout).  Writes go through a temporary file and os.replace, so
+    concurrent fetchers never see a partial entry.
+    '''
+    def __init__(self, directory):
+        '''
+        Constructor of the ResponseCache class.
+        '''
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, kind, digest):
+        return os.path.join(self.directory, kind, digest[:2], digest)
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, url):
+        '''
+        Cached response for url.
+        Output:
+            (Response) a requests.Response rebuilt from disk, or None
+        '''
+        path = self._path("urls", _sha256(normalize_url(url).encode()))
+        try:
+            with open(path + ".json") as f:
+                entry = json.load(f)
+            with open(self._path("bodies", entry["body"]), "rb") as f:
+                body = f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+        r = requests.Response()
+        r.status_code = entry["status"]
+        r.url = entry["final_url"]
+        r.encoding = entry["encoding"]
+        r.headers = requests.structures.CaseInsensitiveDict(entry["headers"])
+        r._content = body
+        r.from_cache = True
+        return r
+
+    def put(self, url, response):
+        '''
+        Stores response as the entry for url.
+        '''
+        body = response.content
+        digest = _sha256(body)
+        body_path = self._path("bodies", digest)
+        if not os.path.exists(body_path):
+            self._write(body_path, body)
+
+        entry = {"url": url,
+                 "final_url": response.url,
+                 "status": response.status_code,
+                 "encoding": response.encoding,
+                 "headers": dict(response.headers),
+                 "body": digest}
+        path = self._path("urls", _sha256(normalize_url(url).encode()))
+        self._write(path + ".json", json.dumps(entry).encode())
+
+    def update_headers(self, url, headers):
+        '''
+        Replaces the REVALIDATED_HEADERS of the entry for url with those
+        in headers (e.g. of a 304), if there is an entry.
+        Output:
+            (CaseInsensitiveDict) the entry's headers, or None
+        '''
+        path = self._path("urls", _sha256(normalize_url(url).encode()))
+        try:
+            with open(path + ".json") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        merged = requests.structures.CaseInsensitiveDict(entry["headers"])
+        for name in REVALIDATED_HEADERS:
+            if name in headers:
+                merged[name] = headers[name]
+        entry["headers"] = dict(merged)
+        self._write(path + ".json", json.dumps(entry).encode())
+        return merged
+
+    def delete(self, url):
+        '''
+        Removes the entry for url, if any (its body stays: other entries
+        may share it).
+        '''
+        path = self._path("urls", _sha256(normalize_url(url).encode()))
+        try:
+            os.remove(path + ".json")
+        except FileNotFoundError:
+            pass
+
+
+class CachingSession:
+    '''
+    Fetches through a ResponseCache, falling back to (and filling the
+    cache from) an HttpSession.
+    '''
+    def __init__(self, directory, mode=REVALIDATE, session=None):
+        '''
+        Constructor of the CachingSession class.
+
+        Inputs:
+            directory (str): cache directory
+            mode (str): REVALIDATE or CACHE_ONLY
+            session (HttpSession): used for network requests (a new one
+              is created if not given and the mode needs the network)
+        '''
+        if mode not in MODES:
+            raise ValueError("unknown cache mode: {}".format(mode))
+        self.cache = ResponseCache(directory)
+        self.mode = mode
+        if session is None and mode != CACHE_ONLY:
+            session = httppool.HttpSession()
+        self.session = session
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get_request(self, url):
+        '''
+        Open a connection to the specified URL, or answer from the cache,
+        and if successful read the data.
+
+        Inputs:
+            url: must be an absolute URL
+
+        Outputs:
+            request object or None
+        '''
+        cached = self.cache.get(url)
+        if self.mode == CACHE_ONLY:
+            self._count("hits" if cached is not None else "misses")
+            return cached
+
+        headers = {}
+        if cached is not None:
+            if "ETag" in cached.headers:
+                headers["If-None-Match"] = cached.headers["ETag"]
+            if "Last-Modified" in cached.headers:
+                headers["If-Modified-Since"] = cached.headers["Last-Modified"]
+
+        try:
+            r = self.session.fetch(url, headers=headers)
+            if r is not None and r.status_code == 304 and cached is None:
+                # Nothing cached to answer the 304 with: ask for the page
+                r = self.session.fetch(url)
+        except requests.RequestException:
+            # No response: serve a stale copy rather than lose the page
+            self._count("hits" if cached is not None else "misses")
+            return cached
+        except Exception:
+            # fail on any other kind of error
+            self._count("misses")
+            return None
+        if r is None or r.status_code == 404 or r.status_code == 403:
+            # The page is gone (or the URL is not absolute)
+            if cached is not None:
+                self.cache.delete(url)
+            self._count("misses")
+            return None
+        if r.status_code == 304 and cached is not None:
+            # The server may have sent new validators with the 304
+            self._count("revalidated")
+            headers = self.cache.update_headers(url, r.headers)
+            if headers is not None:
+                cached.headers = headers
+            cached.connect_time = getattr(r, "connect_time", 0.0)
+            return cached
+
+        self._count("misses")
+        if r.status_code == 200:
+            self.cache.put(url, r)
+        return r
+
+    def close(self):
+        '''
+        Closes the underlying session.
+        '''
+        if self.session is not None:
+            self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __str__(self):
+        '''
+        One-line summary of the cache counters.
+        '''
+        return "cache: {} hits, {} revalidated, {} misses".format(
+            self.hits, self.revalidated, self.misses)
+
+
+def session_from_env(pool_size=10):
+    '''
+    Session for a crawl: an HttpSession, wrapped in a CachingSession if
+    the CRAWLER_CACHE_DIR environment variable names a cache directory.
+    '''
+    session = httppool.HttpSession(pool_size=pool_size)
+    directory = os.environ.get(CACHE_DIR_ENV)
+    if not directory:
+        return session
+    mode = os.environ.get(CACHE_MODE_ENV, REVALIDATE)
+    return CachingSession(directory, mode, session)
@@ -0,0 +1,240 @@
+"""
+Pooled HTTP sessions for the crawler
+
+HttpSession keeps connections alive between requests (one pool per
+host), retries transient failures with exponential backoff and puts a
+timeout on every request.  Its get_request has the same contract as
+util.get_request.
+"""
+# pylint: disable-msg=invalid-name, broad-except
+
+import threading
+import time
+
+import requests
+import requests.adapters
+import urllib3.connection
+import urllib3.connectionpool
+from urllib3.util.retry import Retry
+
+import util
+
+
+# Seconds to wait for a connection, and for each read from the server
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+# Statuses worth retrying: the server may answer differently next time
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ConnectionMetrics:
+    '''
+    Connection counters for an HttpSession: HTTP exchanges, connections
+    opened, and the time spent opening connections versus the rest of
+    each request (sending it and reading the response).
+
+    If hook is given it is called after every request as
+    hook(url, seconds, connect_seconds, reused).
+    '''
+    def __init__(self, hook=None):
+        '''
+        Constructor of the ConnectionMetrics class.
+        '''
+        self.hook = hook
+        self.requests = 0
+        self.connections = 0
+        self.connect_time = 0.0
+        self.request_time = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def connection_opened(self, seconds):
+        '''
+        Records a new connection that took seconds to establish.
+        '''
+        with self._lock:
+            self.connections += 1
+            self.connect_time += seconds
+        self._local.connect_time = \
+            getattr(self._local, "connect_time", 0.0) + seconds
+
+    def start_request(self):
+        '''
+        Marks the start of a request on the current thread.
+        '''
+        self._local.connect_time = 0.0
+
+    def request_done(self, url, seconds, exchanges):
+        '''
+        Records a finished request (exchanges counts redirects).
+        Output:
+            (float) seconds the request spent opening connections
+        '''
+        connect = getattr(self._local, "connect_time", 0.0)
+        with self._lock:
+            self.requests += exchanges
+            self.request_time += seconds
+        if self.hook is not None:
+            self.hook(url, seconds, connect, connect == 0.0)
+        return connect
+
+    @property
+    def transfer_time(self):
+        '''
+        Time spent in requests other than opening connections.
+        '''
+        return max(self.request_time - self.connect_time, 0.0)
+
+    @property
+    def reuse_rate(self):
+        '''
+        Fraction of HTTP exchanges that reused an open connection.
+        '''
+        if self.requests == 0:
+            return 0.0
+        return max(self.requests - self.connections, 0) / self.requests
+
+    def __str__(self):
+        '''
+        One-line summary of the counters.
+        '''
+        return ("{} requests, {} connections ({:.1%} reused), "
+                "{:.3f}s connecting, {:.3f}s transferring").format(
+                    self.requests, self.connections, self.reuse_rate,
+                    self.connect_time, self.transfer_time)
+
+
+def _timed_connection_class(base, metrics):
+    '''
+    Subclass of a urllib3 connection class that reports how long each
+    connect() takes.
+    '''
+    def connect(self):
+        start = time.perf_counter()
+        base.connect(self)
+        metrics.connection_opened(time.perf_counter() - start)
+
+    return type("Timed" + base.__name__, (base,), {"connect": connect})
+
+
+class _PooledAdapter(requests.adapters.HTTPAdapter):
+    '''
+    HTTPAdapter whose connection pools report to a ConnectionMetrics.
+    '''
+    def __init__(self, metrics, **kwargs):
+        self.metrics = metrics
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        http_pool = type("_HTTPConnectionPool",
+                         (urllib3.connectionpool.HTTPConnectionPool,),
+                         {"ConnectionCls": _timed_connection_class(
+                             urllib3.connection.HTTPConnection,
+                             self.metrics)})
+        https_pool = type("_HTTPSConnectionPool",
+                          (urllib3.connectionpool.HTTPSConnectionPool,),
+                          {"ConnectionCls": _timed_connection_class(
+                              urllib3.connection.HTTPSConnection,
+                              self.metrics)})
+        self.poolmanager.pool_classes_by_scheme = {"http": http_pool,
+                                                   "https": https_pool}
+
+
+class HttpSession:
+    '''
+    A requests.Session with keep-alive connection pools, retries and
+    timeouts, used by the crawler instead of util.get_request.
+    '''
+    def __init__(self, pool_size=10, retries=3, backoff=0.5,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), metrics=None):
+        '''
+        Constructor of the HttpSession class.
+
+        Inputs:
+            pool_size (int): connections kept open per host
+            retries (int): retries for connection errors, read errors
+              and RETRY_STATUSES
+            backoff (float): backoff factor; retry n sleeps
+              backoff * 2 ** (n - 1) seconds
+            timeout: seconds, or (connect, read) pair of seconds
+            metrics (ConnectionMetrics): counters to update
+        '''
+        if metrics is None:
+            metrics = ConnectionMetrics()
+        self.metrics = metrics
+        self.timeout = timeout
+
+        retry = Retry(total=retries, backoff_factor=backoff,
+                      status_forcelist=RETRY_STATUSES,
+                      allowed_methods=frozenset(["GET", "HEAD"]),
+                      raise_on_status=False)
+        adapter = _PooledAdapter(
+            metrics, pool_connections=requests.adapters.DEFAULT_POOLSIZE,
+            pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch(self, url, headers=None):
+        '''
+        Like get_request, but returns the response whatever its status,
+        and raises requests.RequestException (connection errors,
+        timeouts, ...) when there is no response.
+
+        Inputs:
+            url: must be an absolute URL
+            headers: optional dict of extra request headers
+
+        Outputs:
+            request object (with the seconds spent opening connections
+            in its connect_time), or None if url is not absolute
+        '''
+        if not util.is_absolute_url(url):
+            return None
+
+        self.metrics.start_request()
+        start = time.perf_counter()
+        exchanges = 1
+        try:
+            r = self.session.get(url, headers=headers, timeout=self.timeout)
+            exchanges = len(r.history) + 1
+        finally:
+            connect = self.metrics.request_done(
+                url, time.perf_counter() - start, exchanges)
+        r.connect_time = connect
+        return r
+
+    def get_request(self, url, headers=None):
+        '''
+        Open a connection to the specified URL (reusing a pooled one if
+        possible) and if successful read the data.
+
+        Inputs:
+            url: must be an absolute URL
+            headers: optional dict of extra request headers
+
+        Outputs:
+            request object or None
+        '''
+        try:
+            r = self.fetch(url, headers)
+        except Exception:
+            # fail on any kind of error
+            return None
+        if r is not None and (r.status_code == 404 or r.status_code == 403):
+            r = None
+        return r
+
+    def close(self):
+        '''
+        Closes all pooled connections.
+        '''
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,202 @@
+"""
+Inverted index for the crawler
+
+InvertedIndex maps each word to the courses it appears in.  Course
+codes are interned as small integer IDs (in the order the crawl first
+sees them) and each word's postings are a sorted, duplicate-free array
+of IDs, so adding a page merges its postings into the index instead of
+overwriting them:
+
+    index = invindex.InvertedIndex()
+    index.add({"history": ["HIST 10101", "HIST 10102"], ...})
+    index["history"]                 course codes, in ID order
+    index.rows(course_map)           (identifier, word) rows for the CSV
+
+Merging a page costs O(postings of the words on the page); since new
+courses get the largest IDs, most merges are appends.
+"""
+# pylint: disable-msg=invalid-name
+
+import array
+import sys
+
+
+# Type code of the postings arrays (unsigned int: at least 2 ** 32 IDs)
+ID_TYPE = "I"
+
+
+def merge_postings(old, new):
+    '''
+    Merges two sorted, duplicate-free arrays of IDs.
+    Inputs:
+        old (array): postings
+        new (array): postings to add
+    Output:
+        (array) the union, sorted and duplicate-free (old itself if
+        nothing had to be added)
+    '''
+    if not new:
+        return old
+    if not old or new[0] > old[-1]:
+        old.extend(new)
+        return old
+
+    merged = array.array(ID_TYPE)
+    i = j = 0
+    while i < len(old) and j < len(new):
+        if old[i] < new[j]:
+            merged.append(old[i])
+            i += 1
+        elif new[j] < old[i]:
+            merged.append(new[j])
+            j += 1
+        else:
+            merged.append(old[i])
+            i += 1
+            j += 1
+    merged.extend(old[i:])
+    merged.extend(new[j:])
+    return merged
+
+
+class InvertedIndex:
+    '''
+    Words mapped to sorted, duplicate-free postings of course IDs.
+    '''
+    def __init__(self):
+        '''
+        Constructor of the InvertedIndex class.
+        '''
+        self.course_ids = {} # course code -> ID
+        self.course_codes = [] # ID -> course code
+        self.postings = {} # word -> array of IDs
+        self.num_postings = 0
+
+    def course_id(self, code):
+        '''
+        Interned ID of a course code.
+        '''
+        course_id = self.course_ids.get(code)
+        if course_id is None:
+            course_id = self.course_ids[code] = len(self.course_codes)
+            self.course_codes.append(code)
+        return course_id
+
+    def add(self, page_postings):
+        '''
+        Merges a page's postings into the index.
+        Input:
+            (dict) words mapped to lists of course codes (see
+            crawler.index_course_blocks)
+        '''
+        for word, codes in page_postings.items():
+            if word is None:
+                continue
+            new = array.array(ID_TYPE, sorted({self.course_id(code)
+                                               for code in codes}))
+            old = self.postings.get(word)
+            if old is None:
+                self.postings[word] = new
+                self.num_postings += len(new)
+            else:
+                before = len(old)
+                merged = merge_postings(old, new)
+                self.postings[word] = merged
+                self.num_postings += len(merged) - before
+
+    def update(self, other):
+        '''
+        Merges another InvertedIndex into this one.
+        '''
+        for word, ids in other.postings.items():
+            self.add({word: [other.course_codes[i] for i in ids]})
+
+    def __getitem__(self, word):
+        '''
+        Course codes of a word, in ID order.
+        '''
+        return [self.course_codes[i] for i in self.postings[word]]
+
+    def get(self, word, default=None):
+        '''
+        Course codes of a word, or default if it is not indexed.
+        '''
+        if word not in self.postings:
+            return default
+        return self[word]
+
+    def __contains__(self, word):
+        return word in self.postings
+
+    def __iter__(self):
+        return iter(self.postings)
+
+    def __len__(self):
+        return len(self.postings)
+
+    def items(self):
+        '''
+        (word, course codes) pairs.
+        '''
+        for word in self.postings:
+            yield word, self[word]
+
+    def to_dict(self):
+        '''
+        The index as a plain dict of words mapped to sorted course codes
+        (independent of the order IDs were handed out in).
+        '''
+        return {word: sorted(codes) for word, codes in self.items()}
+
+    def __eq__(self, other):
+        if not isinstance(other, InvertedIndex):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def rows(self, course_map):
+        '''
+        The (course identifier, word) pairs of the index, sorted.
+        Input:
+            (dict) course codes mapped to course identifiers
+        Output:
+            (list) of (identifier, word) tuples
+        Raises KeyError, naming them, if course codes of the index are
+        missing from course_map.
+        '''
+        missing = [code for code in self.course_codes
+                   if code not in course_map]
+        if missing:
+            raise KeyError("course codes not in the course map: " +
+                           ", ".join(missing))
+        identifiers = [course_map[code] for code in self.course_codes]
+        rows = []
+        for word, ids in self.postings.items():
+            for i in ids:
+                rows.append((identifiers[i], word))
+        rows.sort()
+        return rows
+
+    def memory(self):
+        '''
+        Bytes used by the postings arrays, and by the whole index
+        (postings, word table and course table).
+        '''
+        postings = sum(sys.getsizeof(ids) for ids in self.postings.values())
+        total = postings + sys.getsizeof(self.postings) + \
+            sum(sys.getsizeof(word) for word in self.postings) + \
+            sys.getsizeof(self.course_ids) + \
+            sys.getsizeof(self.course_codes) + \
+            sum(sys.getsizeof(code) for code in self.course_codes)
+        return postings, total
+
+    def __str__(self):
+        '''
+        One-line summary of the index size.
+        '''
+        postings, total = self.memory()
+        per_posting = max(self.num_postings, 1)
+        return ("{} words, {} courses, {} postings; {} bytes of postings "
+                "({:.1f}/posting), {} bytes in all ({:.1f}/posting)").format(
+                    len(self.postings), len(self.course_codes),
+                    self.num_postings, postings, postings / per_posting,
+                    total, total / per_posting)
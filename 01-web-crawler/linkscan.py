@@ -0,0 +1,95 @@
+"""
+Streaming link scan
+
+Most pages the crawler visits are navigation pages: it needs their
+links but not their content.  scan makes one pass over the page's
+start tags, without building a tree, collecting the hrefs of the links
+and noting whether the page has any "courseblock main" divs; only
+those pages need a full parse.
+
+The scan uses lxml's parser-target interface (tags are streamed to a
+callback and no tree is built) and falls back to html.parser when lxml
+is not installed.
+"""
+# pylint: disable-msg=invalid-name
+
+import collections
+import html.parser
+
+import parsers
+
+try:
+    import lxml.etree
+except ImportError:
+    lxml = None
+
+
+LinkScan = collections.namedtuple("LinkScan", ["hrefs", "has_courses"])
+
+
+def _is_course_block(class_):
+    return class_ is not None and " ".join(class_.split()) == "courseblock main"
+
+
+class _LinkTarget:
+    '''
+    lxml parser target: receives start tags only.
+    '''
+    def __init__(self):
+        self.hrefs = []
+        self.has_courses = False
+
+    def start(self, tag, attrib):
+        if tag == "a":
+            href = attrib.get("href")
+            if href is not None:
+                self.hrefs.append(href)
+        elif tag == "div" and not self.has_courses:
+            self.has_courses = _is_course_block(attrib.get("class"))
+
+    def close(self):
+        return LinkScan(self.hrefs, self.has_courses)
+
+
+class _LinkHTMLParser(html.parser.HTMLParser):
+    '''
+    html.parser version of _LinkTarget.
+    '''
+    def __init__(self):
+        super().__init__()
+        self.hrefs = []
+        self.has_courses = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            for name, value in attrs:
+                # Like html5lib, the first of repeated attributes wins
+                if name == "href":
+                    self.hrefs.append(value or "")
+                    break
+        elif tag == "div" and not self.has_courses:
+            for name, value in attrs:
+                if name == "class":
+                    self.has_courses = _is_course_block(value)
+                    break
+
+
+def scan(body):
+    '''
+    Scans a page for links and course blocks in one pass.
+    Input:
+        (bytes or str) page body
+    Output:
+        (LinkScan) hrefs of the links in page order, and whether the
+        page has a "courseblock main" div
+    '''
+    text = parsers.decode_body(body)
+    if lxml is not None:
+        parser = lxml.etree.HTMLParser(target=_LinkTarget())
+        parser.feed(text)
+        return parser.close()
+
+    parser = _LinkHTMLParser()
+    parser.feed(text)
+    parser.close()
+    return LinkScan(parser.hrefs, parser.has_courses)
@@ -0,0 +1,124 @@
+"""
+Local HTTP server for offline crawls
+
+Serves a directory of catalog pages (for example fixtures/catalog), or
+pages generated on the fly (see catalog_generator.py), on 127.0.0.1 so
+the crawler can be tested and benchmarked without network access.
+"""
+# pylint: disable-msg=invalid-name
+
+import contextlib
+import functools
+import http.server
+import os
+import threading
+import time
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "fixtures", "catalog")
+
+
+class CatalogHandler(http.server.SimpleHTTPRequestHandler):
+    '''
+    Static file handler that speaks HTTP/1.1 (so keep-alive works),
+    does not log every request, and can add a fixed delay to each
+    response to imitate the round trip to a remote server.
+
+    Nagle's algorithm is disabled: headers and body are written
+    separately, and on a kept-alive connection Nagle plus delayed ACKs
+    would add ~40ms to every response.
+    '''
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        super().do_GET()
+
+    def log_request(self, code="-", size="-"):
+        self.server.requests_served += 1
+        if code == 200:
+            self.server.pages_served.add(self.path)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PageHandler(CatalogHandler):
+    '''
+    CatalogHandler that answers from the server's pages object (anything
+    with a page(path) method returning bytes, or None for a 404) instead
+    of from a directory.
+    '''
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.path.split("?", 1)[0].split("#", 1)[0]
+        body = self.server.pages.page(path)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@contextlib.contextmanager
+def _serve(handler):
+    '''
+    Runs a ThreadingHTTPServer with the given handler on an ephemeral
+    port for the duration of a with block (see serve_directory).
+    '''
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    host, port = server.server_address[:2]
+    server.domain = "{}:{}".format(host, port)
+    server.url = "http://{}/".format(server.domain)
+    server.requests_served = 0
+    server.pages_served = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+@contextlib.contextmanager
+def serve_directory(root=FIXTURE_DIR, latency=0.0):
+    '''
+    Serve a directory on an ephemeral port for the duration of a
+    with block.
+
+    Inputs:
+        root (str): directory to serve
+        latency (float): seconds to sleep before answering each request
+
+    Output:
+        (ThreadingHTTPServer) the running server.  server.url is its base
+        URL (e.g. "http://127.0.0.1:54321/"), server.domain the matching
+        limiting domain, server.requests_served counts every request and
+        server.pages_served holds the paths answered with a 200.
+    '''
+    handler = type("_Handler", (CatalogHandler,), {"latency": latency})
+    with _serve(functools.partial(handler, directory=root)) as server:
+        yield server
+
+
+@contextlib.contextmanager
+def serve_pages(pages, latency=0.0):
+    '''
+    Like serve_directory, but answers every request with pages.page(path)
+    (see PageHandler).
+    '''
+    handler = type("_Handler", (PageHandler,), {"latency": latency})
+    with _serve(handler) as server:
+        server.pages = pages
+        yield server
@@ -0,0 +1,347 @@
+"""
+Crawl frontier scheduler
+
+Scheduler replaces the crawl's FIFO frontier with one queue per host.
+Each host has a token bucket that paces requests to it (and, if asked,
+the Crawl-delay of its robots.txt), and URLs can be given priorities:
+the next URL is taken from a host that may be fetched now, highest
+priority (lowest number) first, then in the order the URLs were added.
+Without rates or priorities it hands URLs out exactly like a FIFO, so
+the crawl is the same as with a plain queue.
+
+The scheduler is used from the crawl loop only; it is not thread-safe.
+With robots, a host's robots.txt is fetched when its first URL is
+added; a caller that must not block there (crawl_async's event loop)
+fetches it beforehand for the hosts unknown_hosts gives, off the loop,
+and passes the delays to set_crawl_delay.
+
+    frontier = scheduler.Scheduler(rate=2,
+                                   priority=scheduler.department_first)
+    frontier.extend(urls)
+    url = frontier.popleft()        waits until url's host may be fetched
+    url, not_before = frontier.reserve()
+                                    the same, but returns the time.monotonic
+                                    time to wait until instead of waiting
+"""
+# pylint: disable-msg=invalid-name, broad-except
+
+import heapq
+import math
+import time
+import urllib.parse
+import urllib.robotparser
+
+import requests.utils
+
+
+# The agent whose robots.txt rules apply to the crawler
+USER_AGENT = requests.utils.default_user_agent()
+
+
+class TokenBucket:
+    '''
+    Token bucket holding up to burst tokens and refilled at rate tokens
+    per second.  Taking a token from an empty bucket reserves the next
+    one: the bucket goes into debt and the caller is told how long to
+    wait for it.
+    '''
+    def __init__(self, rate, burst=1):
+        '''
+        Constructor of the TokenBucket class.
+
+        Inputs:
+            rate (float): tokens per second
+            burst (int): most tokens that can be taken at once
+        '''
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def ready_at(self, now):
+        '''
+        When the next token is available.
+        '''
+        self._refill(now)
+        if self.tokens >= 1:
+            return now
+        return now + (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        '''
+        Takes a token.
+        Output:
+            (float) seconds to wait before using it
+        '''
+        self._refill(now)
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class HostQueue:
+    '''
+    The queued URLs of one host, its token bucket (None when it is not
+    paced) and its wait counters.
+    '''
+    def __init__(self, bucket=None):
+        '''
+        Constructor of the HostQueue class.
+        '''
+        self.heap = [] # (priority, sequence number, url, time added)
+        self.bucket = bucket
+        self.dispatched = 0
+        self.queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.delay = 0.0
+        self.max_delay = 0.0
+
+    def ready_at(self, now):
+        '''
+        When this host may be fetched again.
+        '''
+        if self.bucket is None:
+            return now
+        return self.bucket.ready_at(now)
+
+
+def department_first(url):
+    '''
+    Priority that visits department pages (anything under thecollege/)
+    before the rest of the catalog.
+    '''
+    path = urllib.parse.urlsplit(url).path
+    return 0 if "/thecollege/" in path else 1
+
+
+def host_name(url):
+    '''
+    Host (and port) a URL is queued under.
+    '''
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+
+def robots_crawl_delay(url, session):
+    '''
+    Crawl-delay the robots.txt of url's host asks of the crawler
+    (urllib.robotparser only reads whole seconds).
+    Inputs:
+        url (str): any URL on the host
+        session: object with a get_request method (e.g. HttpSession)
+    Output:
+        (float) seconds, or None if robots.txt has no delay for us (or
+        cannot be fetched)
+    '''
+    parts = urllib.parse.urlsplit(url)
+    robots_url = urllib.parse.urlunsplit((parts.scheme, parts.netloc,
+                                          "/robots.txt", "", ""))
+    try:
+        request = session.get_request(robots_url)
+    except Exception:
+        request = None
+    if request is None or request.status_code != 200:
+        return None
+    parser = urllib.robotparser.RobotFileParser()
+    parser.parse(request.text.splitlines())
+    delay = parser.crawl_delay(USER_AGENT)
+    if delay is None:
+        return None
+    return float(delay)
+
+
+class Scheduler:
+    '''
+    Per-host crawl frontier (see the module docstring).
+    '''
+    def __init__(self, rate=None, burst=1, priority=None, robots=None):
+        '''
+        Constructor of the Scheduler class.
+
+        Inputs:
+            rate (float): most requests per second to any one host
+              (None: no limit)
+            burst (int): requests a host may get back to back
+            priority (function): maps a URL to a number; lower numbers
+              are fetched first (None: all URLs are equal)
+            robots: if given, a session (object with get_request) used
+              to fetch each host's robots.txt, whose Crawl-delay then
+              caps the host's rate
+        '''
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be positive")
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.priority = priority
+        self.robots = robots
+        self.hosts = {}
+        self.crawl_delays = {}
+        self._back = 0
+        self._front = 0
+        self._len = 0
+
+    def unknown_hosts(self, urls):
+        '''
+        One URL for each host of urls whose robots.txt has not been read
+        yet (none without robots).
+        '''
+        if self.robots is None:
+            return []
+        found = {}
+        for url in urls:
+            host = host_name(url)
+            if host not in self.crawl_delays:
+                found.setdefault(host, url)
+        return list(found.values())
+
+    def set_crawl_delay(self, url, delay):
+        '''
+        Records the Crawl-delay of url's host (as robots_crawl_delay
+        gives it), so adding its URLs does not fetch robots.txt.
+        '''
+        self.crawl_delays.setdefault(host_name(url), delay)
+
+    def _host(self, url):
+        host = host_name(url)
+        queue = self.hosts.get(host)
+        if queue is None:
+            rate, burst = self.rate, self.burst
+            if self.robots is not None:
+                if host not in self.crawl_delays:
+                    self.crawl_delays[host] = robots_crawl_delay(url,
+                                                                 self.robots)
+                delay = self.crawl_delays[host]
+                if delay:
+                    rate, burst = min(rate or math.inf, 1 / delay), 1
+            bucket = None
+            if rate is not None:
+                bucket = TokenBucket(rate, burst)
+            queue = self.hosts[host] = HostQueue(bucket)
+        return queue
+
+    def _push(self, url, sequence):
+        priority = 0 if self.priority is None else self.priority(url)
+        heapq.heappush(self._host(url).heap,
+                       (priority, sequence, url, time.monotonic()))
+        self._len += 1
+
+    def append(self, url):
+        '''
+        Adds a URL behind the queued URLs of the same priority.
+        '''
+        self._back += 1
+        self._push(url, self._back)
+
+    def appendleft(self, url):
+        '''
+        Adds a URL ahead of the queued URLs of the same priority.
+        '''
+        self._front -= 1
+        self._push(url, self._front)
+
+    def extend(self, urls):
+        '''
+        Appends URLs in order.
+        '''
+        for url in urls:
+            self.append(url)
+
+    def extendleft(self, urls):
+        '''
+        Appendlefts URLs in order (so they end up reversed, as with
+        collections.deque.extendleft).
+        '''
+        for url in urls:
+            self.appendleft(url)
+
+    def reserve(self):
+        '''
+        Takes the next URL from the frontier.
+        Output:
+            (tuple) URL, and the time.monotonic() time its host may be
+            fetched at
+        '''
+        if self._len == 0:
+            raise IndexError("reserve from an empty scheduler")
+        now = time.monotonic()
+        best = None
+        for queue in self.hosts.values():
+            if queue.heap:
+                ready_at = queue.ready_at(now)
+                priority, sequence = queue.heap[0][:2]
+                key = (ready_at > now, priority, sequence, ready_at)
+                if best is None or key < best[0]:
+                    best = (key, queue)
+        queue = best[1]
+
+        _, _, url, added = heapq.heappop(queue.heap)
+        self._len -= 1
+        delay = 0.0
+        if queue.bucket is not None:
+            delay = queue.bucket.take(now)
+        waited = now - added
+        queue.dispatched += 1
+        queue.queue_wait += waited
+        queue.max_queue_wait = max(queue.max_queue_wait, waited)
+        queue.delay += delay
+        queue.max_delay = max(queue.max_delay, delay)
+        return url, now + delay
+
+    def popleft(self):
+        '''
+        Takes the next URL from the frontier, waiting until its host may
+        be fetched.
+        '''
+        url, not_before = self.reserve()
+        delay = not_before - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return url
+
+    def clear(self):
+        '''
+        Empties every host queue (the counters are kept).
+        '''
+        for queue in self.hosts.values():
+            queue.heap.clear()
+        self._len = 0
+
+    def __iter__(self):
+        '''
+        The queued URLs, in priority order.
+        '''
+        entries = [entry for queue in self.hosts.values()
+                   for entry in queue.heap]
+        return iter([url for _, _, url, _ in sorted(entries)])
+
+    def __len__(self):
+        return self._len
+
+    def report(self):
+        '''
+        URLs dispatched, mean and max time URLs waited in the queue, and
+        mean and max rate-limit delay, one line per host.
+        '''
+        lines = []
+        for host, queue in sorted(self.hosts.items()):
+            n = max(queue.dispatched, 1)
+            line = ("{:<30} {:>6} dispatched, queued {:.3f}s mean "
+                    "{:.3f}s max, delayed {:.3f}s mean {:.3f}s max").format(
+                        host, queue.dispatched, queue.queue_wait / n,
+                        queue.max_queue_wait, queue.delay / n,
+                        queue.max_delay)
+            if self.crawl_delays.get(host):
+                line += ", crawl-delay {:g}s".format(self.crawl_delays[host])
+            lines.append(line)
+        return "\n".join(lines)
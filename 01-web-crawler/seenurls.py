@@ -0,0 +1,200 @@
+"""
+Seen-URL stores
+
+crawl keeps two collections of URLs: the pages it has visited and the
+URLs it has enqueued.  It only ever adds URLs to them and asks whether
+a URL is in them, so any object with add and __contains__ will do:
+
+    "set"          a Python set of the URL strings (exact; the default)
+    "fingerprint"  FingerprintSet: 64-bit fingerprints of the URLs in an
+                   open-addressing hash table backed by an array (exact
+                   up to fingerprint collisions, 16 to 32 bytes per URL)
+    "bloom"        BloomFilter: a Bloom filter sized for a capacity and
+                   false-positive rate (about 1.2 bytes per URL at 1%)
+
+A false positive makes the crawler treat a new URL as seen, so with the
+Bloom filter a small fraction of pages may be skipped.
+"""
+# pylint: disable-msg=invalid-name
+
+import array
+import hashlib
+import math
+import sys
+
+
+STORES = ("set", "fingerprint", "bloom")
+
+DEFAULT_CAPACITY = 1000000
+DEFAULT_ERROR_RATE = 0.01
+
+
+def fingerprint(url):
+    '''
+    64-bit fingerprint of a URL (never 0, which marks an empty slot).
+    '''
+    digest = hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+
+class FingerprintSet:
+    '''
+    Set of URLs stored as 64-bit fingerprints in a linear-probing hash
+    table.  The table doubles when it is half full.
+    '''
+    def __init__(self, capacity=1024):
+        '''
+        Constructor of the FingerprintSet class.
+
+        Inputs:
+            capacity (int): number of URLs to make room for up front
+        '''
+        size = 1
+        while size < 2 * capacity:
+            size *= 2
+        self._slots = array.array("Q", bytes(8 * size))
+        self._mask = size - 1
+        self._len = 0
+
+    def _find(self, fp):
+        '''
+        Index of the slot holding fp, or of the empty slot where it
+        would go.
+        '''
+        slots = self._slots
+        mask = self._mask
+        i = fp & mask
+        while slots[i] != 0 and slots[i] != fp:
+            i = (i + 1) & mask
+        return i
+
+    def add(self, url):
+        '''
+        Adds a URL to the set.
+        '''
+        fp = fingerprint(url)
+        i = self._find(fp)
+        if self._slots[i] == 0:
+            self._slots[i] = fp
+            self._len += 1
+            if 2 * self._len > len(self._slots):
+                self._grow()
+
+    def _grow(self):
+        old = self._slots
+        self._slots = array.array("Q", bytes(16 * len(old)))
+        self._mask = len(self._slots) - 1
+        for fp in old:
+            if fp != 0:
+                self._slots[self._find(fp)] = fp
+
+    def __contains__(self, url):
+        return self._slots[self._find(fingerprint(url))] != 0
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def nbytes(self):
+        '''
+        Memory used by the table.
+        '''
+        return self._slots.itemsize * len(self._slots)
+
+
+class BloomFilter:
+    '''
+    Bloom filter over URLs.  Past capacity URLs the false-positive rate
+    rises above error_rate.
+    '''
+    def __init__(self, capacity=DEFAULT_CAPACITY,
+                 error_rate=DEFAULT_ERROR_RATE):
+        '''
+        Constructor of the BloomFilter class.
+
+        Inputs:
+            capacity (int): number of URLs the filter is sized for
+            error_rate (float): false-positive rate at capacity
+        '''
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity *
+                                       math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._len = 0
+
+    def _positions(self, url):
+        '''
+        Bit positions of a URL (double hashing of one 128-bit digest).
+        '''
+        digest = hashlib.blake2b(url.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        m = self.num_bits
+        return [(h1 + i * h2) % m for i in range(self.num_hashes)]
+
+    def add(self, url):
+        '''
+        Adds a URL to the filter.
+        '''
+        bits = self._bits
+        new = False
+        for pos in self._positions(url):
+            byte, mask = pos >> 3, 1 << (pos & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                new = True
+        if new:
+            self._len += 1
+
+    def __contains__(self, url):
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7))
+                   for pos in self._positions(url))
+
+    def __len__(self):
+        '''
+        Number of URLs added that were not already (apparently) present.
+        '''
+        return self._len
+
+    @property
+    def nbytes(self):
+        '''
+        Memory used by the bit array.
+        '''
+        return len(self._bits)
+
+
+def store_factory(name, capacity=None, error_rate=DEFAULT_ERROR_RATE):
+    '''
+    Function that makes a new, empty store of the named kind.
+    Inputs:
+        name (str): one of STORES
+        capacity (int): URLs to size the store for (a FingerprintSet
+          starts small and grows; a Bloom filter defaults to
+          DEFAULT_CAPACITY)
+        error_rate (float): false-positive rate of a Bloom filter
+    Output:
+        (function) taking no arguments
+    '''
+    if name == "set":
+        return set
+    if name == "fingerprint":
+        return lambda: FingerprintSet(capacity or 1024)
+    if name == "bloom":
+        return lambda: BloomFilter(capacity or DEFAULT_CAPACITY, error_rate)
+    raise ValueError("unknown seen-URL store: {}".format(name))
+
+
+def store_nbytes(store):
+    '''
+    Memory used by a store, counting the URL strings held by a set.
+    '''
+    if isinstance(store, (set, frozenset)):
+        return sys.getsizeof(store) + sum(sys.getsizeof(url) for url in store)
+    return store.nbytes
@@ -0,0 +1,758 @@
+'''
+Offline crawler tests: crawls the pages in fixtures/catalog through a
+local HTTP server.
+
+These tests cover the crawler's infrastructure, not the graded crawl
+output: grader.py puts all of them in their own [test-points] category
+of pytest.ini (matched by this file's name, worth no points), so their
+names must not contain "csv" or "results".
+'''
+# pylint: skip-file
+
+import json
+import os
+import shutil
+import threading
+import time
+
+import pytest
+import requests
+
+import catalog_generator
+import checkpoint as checkpoints
+import crawler
+import httpcache
+import httppool
+import invindex
+import linkscan
+import localserver
+import parsers
+import scheduler
+import seenurls
+import tokenizer
+import tracing
+import urlnorm
+import util
+
+
+FIXTURE_PAGES = sorted(
+    os.path.relpath(os.path.join(dirpath, f), localserver.FIXTURE_DIR)
+    for dirpath, _, filenames in os.walk(localserver.FIXTURE_DIR)
+    for f in filenames if f.endswith(".html"))
+
+
+@pytest.fixture(scope="module")
+def server():
+    with localserver.serve_directory() as server:
+        yield server
+
+
+@pytest.fixture(scope="module")
+def serial_results(server):
+    starting_url = server.url + "index.html"
+    return {n: crawler.crawl(n, starting_url, server.domain)
+            for n in (1, 4, 100)}
+
+
+@pytest.mark.parametrize("num_pages", [1, 4, 100])
+@pytest.mark.parametrize("concurrency", [1, 3, 8])
+def test_async_crawl_matches_serial(server, serial_results, num_pages, concurrency):
+    '''
+    crawl_async must build exactly the index the serial crawl builds.
+    '''
+    actual = crawler.crawl_async(num_pages, server.url + "index.html",
+                                 server.domain, concurrency=concurrency)
+    assert actual == serial_results[num_pages]
+
+
+def test_async_crawl_per_host_limit(server, serial_results):
+    actual = crawler.crawl_async(100, server.url + "index.html",
+                                 server.domain, concurrency=8, per_host=2,
+                                 queue_size=3)
+    assert actual
+    assert actual == serial_results[100]
+
+
+def test_fetch_page_single_request(server):
+    '''
+    fetch_page issues one request per page and counts what it downloads.
+    '''
+    stats = crawler.CrawlStats()
+    before = server.requests_served
+    page = crawler.fetch_page(server.url + "thecollege/history/index.html",
+                              server.domain, stats)
+    assert server.requests_served - before == 1
+    assert stats.requests == 1
+    assert stats.bytes_downloaded == len(page.request.content)
+    assert page.soup.find("div", class_="courseblock main") is not None
+
+
+def test_pooled_session_reuses_connections(server):
+    '''
+    HttpSession keeps one connection alive across requests to a host.
+    '''
+    with httppool.HttpSession() as session:
+        for _ in range(5):
+            assert session.get_request(server.url + "about.html") is not None
+        assert session.get_request(server.url + "missing.html") is None
+        assert session.metrics.requests == 6
+        assert session.metrics.connections == 1
+        assert session.metrics.reuse_rate == pytest.approx(5 / 6)
+
+
+def test_session_timeout():
+    '''
+    A server that never answers in time makes get_request fail quickly
+    instead of stalling the crawl.
+    '''
+    with localserver.serve_directory(latency=2.0) as slow:
+        with httppool.HttpSession(retries=0, timeout=0.2) as session:
+            start = time.perf_counter()
+            assert session.get_request(slow.url + "index.html") is None
+            assert time.perf_counter() - start < 1.5
+
+
+def test_cached_crawl(server, serial_results, tmp_path):
+    '''
+    A crawl through the cache revalidates (304s) on the second run and
+    can be repeated offline from the cache alone.
+    '''
+    starting_url = server.url + "index.html"
+    cache_dir = str(tmp_path / "cache")
+
+    with httpcache.CachingSession(cache_dir) as session:
+        first = crawler.crawl(100, starting_url, server.domain,
+                              session=session)
+        assert session.misses > 0 and session.revalidated == 0
+    with httpcache.CachingSession(cache_dir) as session:
+        second = crawler.crawl(100, starting_url, server.domain,
+                               session=session)
+        assert session.misses == 0 and session.revalidated > 0
+    with httpcache.CachingSession(cache_dir, httpcache.CACHE_ONLY) as session:
+        assert session.session is None # No way to reach the network
+        offline = crawler.crawl(100, starting_url, server.domain,
+                                session=session)
+        assert session.misses == 0 and session.hits > 0
+
+    assert first == second == offline == serial_results[100]
+
+
+class _ScriptedSession:
+    '''
+    Stands in for an HttpSession: each fetch returns the next scripted
+    status, or (status, headers) pair, as a response, or raises the next
+    scripted exception.  The request headers are kept in sent.
+    '''
+    def __init__(self, *script):
+        self.script = list(script)
+        self.sent = []
+
+    def fetch(self, url, headers=None):
+        self.sent.append(dict(headers or {}))
+        step = self.script.pop(0)
+        if isinstance(step, Exception):
+            raise step
+        status, response_headers = step if isinstance(step, tuple) \
+            else (step, {})
+        r = requests.Response()
+        r.status_code = status
+        r.url = url
+        r.encoding = "utf-8"
+        r.headers = requests.structures.CaseInsensitiveDict(response_headers)
+        r._content = b"" if status == 304 else b"<html>page</html>"
+        return r
+
+    def close(self):
+        pass
+
+
+def test_cache_stale_only_without_response(tmp_path):
+    '''
+    A cached page is served stale when the network fails, but a page
+    the site answers 404 or 403 for is dropped from the cache.
+    '''
+    url = "http://example.edu/page.html"
+    for gone in (404, 403):
+        cache_dir = str(tmp_path / str(gone))
+        session = httpcache.CachingSession(cache_dir, session=_ScriptedSession(
+            200, requests.ConnectionError("down"), requests.Timeout("slow"),
+            gone, 200))
+        assert session.get_request(url).status_code == 200
+        assert session.get_request(url).content == b"<html>page</html>"
+        assert session.get_request(url).content == b"<html>page</html>"
+        assert session.get_request(url) is None
+        assert session.cache.get(url) is None
+        assert session.get_request(url).status_code == 200
+        assert session.cache.get(url) is not None
+
+
+def test_cache_takes_validators_of_304(tmp_path):
+    '''
+    A 304 answers from the cache and updates the entry's validators,
+    which the next revalidation sends; a 304 with nothing cached is
+    followed by an unconditional request instead of becoming an empty
+    page.
+    '''
+    url = "http://example.edu/page.html"
+    scripted = _ScriptedSession((200, {"ETag": '"a"', "Date": "Mon"}),
+                                (304, {"etag": '"b"', "Date": "Tue"}),
+                                304)
+    session = httpcache.CachingSession(str(tmp_path / "cache"),
+                                       session=scripted)
+    session.get_request(url)
+    revalidated = session.get_request(url)
+    assert revalidated.content == b"<html>page</html>"
+    assert revalidated.headers["ETag"] == '"b"'
+    assert session.cache.get(url).headers["Date"] == "Tue"
+    session.get_request(url)
+    assert [sent.get("If-None-Match") for sent in scripted.sent] == \
+        [None, '"a"', '"b"']
+
+    scripted = _ScriptedSession(304, 200)
+    session = httpcache.CachingSession(str(tmp_path / "empty"),
+                                       session=scripted)
+    assert session.get_request(url).content == b"<html>page</html>"
+    assert scripted.sent == [{}, {}]
+    assert session.cache.get(url) is not None
+
+
+@pytest.mark.parametrize("page", FIXTURE_PAGES)
+def test_parser_parity(page):
+    '''
+    The lxml backend finds the same links and course blocks (including
+    sequences) as the html5lib backend.
+    '''
+    with open(os.path.join(localserver.FIXTURE_DIR, page), "rb") as f:
+        body = f.read()
+    expected = parsers.HTML5LIB.parse(body)
+    actual = parsers.LXML.parse(body)
+    assert parsers.LXML.hrefs(actual) == parsers.HTML5LIB.hrefs(expected)
+    assert parsers.LXML.course_blocks(actual) == \
+        parsers.HTML5LIB.course_blocks(expected)
+
+
+def test_parser_sequence_walk():
+    '''
+    Like util.find_sequence, only subsequence blocks that directly
+    follow the main block belong to its sequence.
+    '''
+    body = (b'<div class="courseblock main"><p class="courseblocktitle">'
+            b'A</p></div><div class="courseblock subsequence">'
+            b'<p class="courseblocktitle">B</p></div>'
+            b'<div class="courseblock subsequence">'
+            b'<p class="courseblocktitle">C</p></div>\n'
+            b'<div class="courseblock subsequence">'
+            b'<p class="courseblocktitle">D</p></div>'
+            b'<div class="courseblock main"><p class="courseblocktitle">'
+            b'E</p><p class="courseblockdesc">e</p></div>\n'
+            b'<div class="courseblock subsequence">'
+            b'<p class="courseblocktitle">F</p></div>')
+    expected = [parsers.CourseBlock("A", "", ["B", "C"]),
+                parsers.CourseBlock("E", "e", [])]
+    for parser in parsers.PARSERS.values():
+        assert parser.course_blocks(parser.parse(body)) == expected
+
+
+def test_lxml_crawl(server, serial_results):
+    actual = crawler.crawl(100, server.url + "index.html", server.domain,
+                           parser="lxml")
+    assert actual == serial_results[100]
+
+
+@pytest.mark.parametrize("page", FIXTURE_PAGES)
+def test_scan_parity(page):
+    '''
+    The streaming scan finds the same links as a full parse, and finds
+    course blocks exactly when the full parse does.
+    '''
+    with open(os.path.join(localserver.FIXTURE_DIR, page), "rb") as f:
+        body = f.read()
+    soup = parsers.HTML5LIB.parse(body)
+    hrefs, has_courses = linkscan.scan(body)
+    assert hrefs == parsers.HTML5LIB.hrefs(soup)
+    assert has_courses == bool(parsers.HTML5LIB.course_blocks(soup))
+
+
+@pytest.mark.parametrize("parser", sorted(parsers.PARSERS))
+def test_unscanned_crawl(server, serial_results, parser):
+    '''
+    Crawling with and without the link scan gives the same index, and
+    the scan skips the full parse of navigation pages.
+    '''
+    stats = crawler.CrawlStats()
+    actual = crawler.crawl(100, server.url + "index.html", server.domain,
+                           parser=parser, scan_links=False, stats=stats)
+    assert actual == serial_results[100]
+    assert stats.parsed >= stats.pages
+
+    stats = crawler.CrawlStats()
+    actual = crawler.crawl(100, server.url + "index.html", server.domain,
+                           parser=parser, scan_links=True, stats=stats)
+    assert actual == serial_results[100]
+    assert stats.parsed < stats.pages
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_worker_crawl(server, serial_results, workers):
+    '''
+    Parsing in worker processes gives the same index as the serial crawl,
+    and every pipeline stage is sampled once per page processed.
+    '''
+    stats = crawler.CrawlStats()
+    actual = crawler.crawl_async(100, server.url + "index.html",
+                                 server.domain, concurrency=4, stats=stats,
+                                 workers=workers)
+    assert actual == serial_results[100]
+    assert stats.parsed > 0
+    assert set(stats.queues) == {"frontier", "fetch", "fetching", "parsing",
+                                 "ready"}
+    assert all(samples >= stats.pages
+               for samples, _, _ in stats.queues.values())
+
+
+class _InterruptingSession(httppool.HttpSession):
+    '''
+    HttpSession that raises KeyboardInterrupt on its limit-th request.
+    '''
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+
+    def get_request(self, url, headers=None):
+        self.limit -= 1
+        if self.limit == 0:
+            raise KeyboardInterrupt
+        return super().get_request(url, headers)
+
+
+@pytest.mark.parametrize("concurrency", [None, 4])
+def test_resumed_crawl(server, serial_results, tmp_path, concurrency):
+    '''
+    A crawl interrupted while fetching resumes from its checkpoint,
+    without fetching the pages it had already visited, and ends with
+    the serial index.
+    '''
+    def run(session, checkpoint, stats=None):
+        if concurrency is None:
+            return crawler.crawl(100, server.url + "index.html",
+                                 server.domain, stats=stats, session=session,
+                                 checkpoint=checkpoint)
+        return crawler.crawl_async(100, server.url + "index.html",
+                                   server.domain, concurrency=concurrency,
+                                   stats=stats, session=session,
+                                   checkpoint=checkpoint)
+
+    full = crawler.CrawlStats()
+    with httppool.HttpSession() as session:
+        run(session, None, full)
+
+    path = str(tmp_path / "crawl.json.gz")
+    with _InterruptingSession(8) as session:
+        with pytest.raises(KeyboardInterrupt):
+            run(session, checkpoints.Checkpoint(path, every=3))
+    saved = checkpoints.Checkpoint(path).load()
+    assert 0 < saved.pages_visited < 8
+
+    stats = crawler.CrawlStats()
+    with httppool.HttpSession() as session:
+        actual = run(session, checkpoints.Checkpoint(path, resume=True),
+                     stats)
+    assert actual == serial_results[100]
+    assert stats.pages == full.pages - saved.pages_visited
+
+    with pytest.raises(ValueError):
+        checkpoints.Checkpoint(path, every=0)
+
+
+def test_incremental_crawl(tmp_path):
+    '''
+    An incremental crawl only parses the pages that changed since the
+    checkpointed crawl, and gives the same index as a full crawl.
+    '''
+    root = tmp_path / "catalog"
+    shutil.copytree(localserver.FIXTURE_DIR, root)
+    path = str(tmp_path / "crawl.json.gz")
+    with localserver.serve_directory(str(root)) as server:
+        starting_url = server.url + "index.html"
+        crawler.crawl(100, starting_url, server.domain,
+                      checkpoint=checkpoints.Checkpoint(path))
+
+        page = root / "thecollege" / "history" / "index.html"
+        page.write_bytes(page.read_bytes().replace(b"Europe", b"Eurasia"))
+        expected = crawler.crawl(100, starting_url, server.domain)
+
+        stats = crawler.CrawlStats()
+        actual = crawler.crawl(100, starting_url, server.domain, stats=stats,
+                               checkpoint=checkpoints.Checkpoint(
+                                   path, incremental=True))
+    assert actual == expected
+    changed = [url for url in checkpoints.Checkpoint(path).load().visit_order
+               if "/history/" in url]
+    assert stats.parsed == len(changed)
+    assert stats.unchanged >= stats.pages - len(changed)
+
+
+@pytest.mark.parametrize("store", seenurls.STORES)
+def test_seen_store_crawl(server, serial_results, tmp_path, store):
+    '''
+    The compact seen-URL stores give the same crawl as sets of URLs,
+    including when resuming from a checkpoint.
+    '''
+    seen = seenurls.store_factory(store, 16)
+    actual = crawler.crawl(100, server.url + "index.html", server.domain,
+                           seen=seen)
+    assert actual == serial_results[100]
+
+    path = str(tmp_path / "crawl.json.gz")
+    crawler.crawl(5, server.url + "index.html", server.domain, seen=seen,
+                  checkpoint=checkpoints.Checkpoint(path))
+    actual = crawler.crawl(100, server.url + "index.html", server.domain,
+                           seen=seen, checkpoint=checkpoints.Checkpoint(
+                               path, resume=True))
+    assert actual == serial_results[100]
+
+
+def test_seen_store_membership():
+    '''
+    FingerprintSet grows and stays exact; a Bloom filter has no false
+    negatives and about the false-positive rate it was sized for.
+    '''
+    urls = ["http://example.edu/page{}.html".format(i) for i in range(20000)]
+    others = ["http://example.edu/other{}.html".format(i)
+              for i in range(20000)]
+
+    fingerprints = seenurls.FingerprintSet(4)
+    bloom = seenurls.BloomFilter(len(urls), 0.01)
+    for url in urls:
+        fingerprints.add(url)
+        fingerprints.add(url)
+        bloom.add(url)
+    assert len(fingerprints) == len(urls)
+    assert all(url in fingerprints for url in urls)
+    assert not any(url in fingerprints for url in others)
+    assert all(url in bloom for url in urls)
+    assert sum(url in bloom for url in others) / len(others) < 0.02
+
+
+def _util_link(url, href, limiting_domain):
+    '''
+    What crawler.get_links did with an href before urlnorm.py.
+    '''
+    new_url = util.remove_fragment(href)
+    if not util.is_absolute_url(new_url):
+        new_url = util.convert_if_relative_url(url, new_url)
+    if new_url is not None and \
+        util.is_url_ok_to_follow(new_url, limiting_domain):
+        return new_url
+    return None
+
+
+ODD_HREFS = ["", "#", "#top", "?q=1", "index.html#x", "../", "./a/b/",
+             "../../thecollege/history/", "/", "/thecollege/", "/a/b.pdf",
+             "/a/b.html?x=1#y", "//other.edu/x.html", "//example.edu/x",
+             "mailto:someone@uchicago.edu", "javascript:void(0)",
+             "http://www.classes.cs.uchicago.edu/archive/2015/winter/12200-1/"
+             "new.collegecatalog.uchicago.edu/thecollege/archives/",
+             "https://classes.cs.uchicago.edu/x.html",
+             "http://evil.com/classes.cs.uchicago.edu/", "foo.edu/pa.html",
+             "cs.uchicago.edu", "http://classes.cs.uchicago.edu:80/a",
+             "HTTP://classes.cs.uchicago.edu/a", "a b.html", "a.HTML",
+             "http://user@classes.cs.uchicago.edu/"]
+
+
+@pytest.mark.parametrize("domain", ["127.0.0.1:8000", "cs.uchicago.edu"])
+def test_link_normalizer(domain):
+    '''
+    LinkNormalizer keeps exactly the links the util functions keep, for
+    every href in the fixture pages and some odd ones, on cold and warm
+    caches.
+    '''
+    hrefs = list(ODD_HREFS)
+    for page in FIXTURE_PAGES:
+        with open(os.path.join(localserver.FIXTURE_DIR, page), "rb") as f:
+            hrefs.extend(linkscan.scan(f.read()).hrefs)
+    bases = ["http://{}/index.html".format(domain),
+             "http://{}/thecollege/history/".format(domain),
+             "https://www.classes.cs.uchicago.edu/a/b/c.html?q#f",
+             "relative/base.html", ""]
+
+    normalizer = urlnorm.LinkNormalizer(domain, maxsize=64)
+    for _ in range(2):
+        for base in bases:
+            expected = [_util_link(base, href, domain) for href in hrefs]
+            assert [normalizer.normalize(base, href)
+                    for href in hrefs] == expected
+            assert normalizer.normalize_links(base, hrefs) == \
+                [url for url in expected if url is not None]
+    assert normalizer.cache_info().hits > 0
+
+    # util.convert_if_relative_url fails on these, and so must we
+    with pytest.raises(NameError):
+        _util_link(bases[0], "www.example.io/x", domain)
+    with pytest.raises(NameError):
+        normalizer.normalize(bases[0], "www.example.io/x")
+
+
+@pytest.mark.parametrize("concurrency", [None, 4])
+def test_rate_limited_crawl(server, serial_results, concurrency):
+    '''
+    A rate-limited crawl gives the serial index and never requests
+    pages from the host faster than its rate.
+    '''
+    rate = 50
+    frontier = scheduler.Scheduler(rate=rate)
+    stats = crawler.CrawlStats()
+    start = time.perf_counter()
+    if concurrency is None:
+        actual = crawler.crawl(100, server.url + "index.html", server.domain,
+                               stats=stats, scheduler=frontier)
+    else:
+        actual = crawler.crawl_async(100, server.url + "index.html",
+                                     server.domain, concurrency=concurrency,
+                                     stats=stats, scheduler=frontier)
+    elapsed = time.perf_counter() - start
+    assert actual == serial_results[100]
+
+    host = frontier.hosts[server.domain]
+    assert host.dispatched == stats.requests
+    assert elapsed >= (stats.requests - 1) / rate
+    assert host.max_delay > 0
+    assert server.domain in frontier.report()
+
+
+def test_scheduler_priority():
+    '''
+    URLs are handed out by priority, then in the order they were added,
+    with appendleft putting a URL ahead of its priority class.
+    '''
+    base = "http://127.0.0.1/"
+    frontier = scheduler.Scheduler(priority=scheduler.department_first)
+    frontier.extend([base + "about.html", base + "thecollege/history/",
+                     base + "index.html", base + "thecollege/anthropology/"])
+    frontier.appendleft(base + "thecollege/")
+    expected = [base + "thecollege/", base + "thecollege/history/",
+                base + "thecollege/anthropology/", base + "about.html",
+                base + "index.html"]
+    assert list(frontier) == expected
+    assert [frontier.popleft() for _ in expected] == expected
+    assert not frontier
+
+
+@pytest.mark.parametrize("rate, burst", [(0, 1), (-2, 1), (5, 0)])
+def test_scheduler_rejects_bad_rates(rate, burst):
+    '''
+    A rate that is not positive, or a burst below one, is rejected
+    before any URL is queued.
+    '''
+    with pytest.raises(ValueError):
+        scheduler.TokenBucket(rate, burst)
+    with pytest.raises(ValueError):
+        scheduler.Scheduler(rate=rate, burst=burst)
+
+
+def test_robots_crawl_delay(serial_results, tmp_path):
+    '''
+    With robots, the Crawl-delay of the host's robots.txt paces the
+    crawl.
+    '''
+    root = tmp_path / "catalog"
+    shutil.copytree(localserver.FIXTURE_DIR, root)
+    (root / "robots.txt").write_text("User-agent: *\nCrawl-delay: 1\n")
+    with localserver.serve_directory(str(root)) as server, \
+        httppool.HttpSession() as robots:
+        frontier = scheduler.Scheduler(robots=robots)
+        stats = crawler.CrawlStats()
+        start = time.perf_counter()
+        actual = crawler.crawl(4, server.url + "index.html", server.domain,
+                               stats=stats, scheduler=frontier)
+        elapsed = time.perf_counter() - start
+    assert actual == serial_results[4]
+    assert frontier.crawl_delays[server.domain] == 1
+    assert elapsed >= stats.requests - 1
+
+
+def test_async_crawl_reads_robots_in_threads(serial_results, tmp_path):
+    '''
+    crawl_async reads robots.txt off the event loop, once per host, and
+    gets the same Crawl-delay as crawl.
+    '''
+    root = tmp_path / "catalog"
+    shutil.copytree(localserver.FIXTURE_DIR, root)
+    (root / "robots.txt").write_text("User-agent: *\nCrawl-delay: 1\n")
+    threads = []
+
+    class RecordingSession(httppool.HttpSession):
+        '''
+        HttpSession that records the threads that fetched with it.
+        '''
+        def get_request(self, url, headers=None):
+            threads.append(threading.current_thread())
+            return super().get_request(url, headers)
+
+    with localserver.serve_directory(str(root)) as server, \
+        RecordingSession() as robots:
+        frontier = scheduler.Scheduler(robots=robots)
+        actual = crawler.crawl_async(4, server.url + "index.html",
+                                     server.domain, concurrency=2,
+                                     scheduler=frontier)
+    assert actual == serial_results[4]
+    assert frontier.crawl_delays[server.domain] == 1
+    assert len(threads) == 1
+    assert threads[0] is not threading.main_thread()
+
+
+def test_inverted_index(serial_results):
+    '''
+    Postings from different pages and courses are merged, not
+    overwritten, and kept sorted and duplicate-free.
+    '''
+    index = invindex.InvertedIndex()
+    index.add({"history": ["HIST 10101", "HIST 10102", "HIST 10101"],
+               "poetry": ["ENGL 10100"]})
+    index.add({"history": ["ANTH 20000", "HIST 10102"], None: ["X"]})
+    index.add({"history": ["ENGL 10100"]})
+    assert index["history"] == ["HIST 10101", "HIST 10102", "ENGL 10100",
+                                "ANTH 20000"]
+    assert list(index.postings["history"]) == [0, 1, 2, 3]
+    assert index.num_postings == 5
+    assert None not in index
+    course_map = {"HIST 10101": 7, "ENGL 10100": 3, "ANTH 20000": 1}
+    with pytest.raises(KeyError, match="HIST 10102"):
+        index.rows(course_map)
+    course_map["HIST 10102"] = 8
+    assert index.rows(course_map) == [(1, "history"), (3, "history"),
+                                      (3, "poetry"), (7, "history"),
+                                      (8, "history")]
+
+    # Words on several department pages keep all their courses
+    crawled = serial_results[100]
+    assert {code[:4] for code in crawled["introduction"]} == \
+        {"ANTH", "CMSC", "HIST", "PORT"}
+    for word in crawled:
+        ids = list(crawled.postings[word])
+        assert ids == sorted(set(ids))
+    postings, total = crawled.memory()
+    assert 0 < postings < total
+
+
+ODD_TEXTS = ["Computer Science I.", "Hello! World: of TOPICS.", ".", "!:",
+             "a.. b:: c!!", "CMSC\xa012200\u202fand\u2009more", "x.\ny:\tz",
+             "", "  Œuvres   complètes.  "]
+
+
+def test_tokenizer():
+    '''
+    The batch tokenizer gives the same words as the token-at-a-time
+    reference on every course block of the fixture, and the trailing
+    punctuation fix keeps the word rather than its last character.
+    '''
+    texts = list(ODD_TEXTS)
+    for page in FIXTURE_PAGES:
+        with open(os.path.join(localserver.FIXTURE_DIR, page), "rb") as f:
+            tree = parsers.LXML.parse(f.read())
+        for block in parsers.LXML.course_blocks(tree):
+            texts.append(tokenizer.title_text(block.title))
+            texts.append(block.desc)
+            texts.extend(tokenizer.title_text(title)
+                         for title in block.sequence)
+    for text in texts:
+        assert tokenizer.words(text) == tokenizer.reference_words(text)
+
+    assert crawler.process_word("Science.") == "science"
+    assert crawler.process_word("The") is None
+    assert crawler.process_word(".") is None
+    assert tokenizer.words(ODD_TEXTS[1]) == ["hello", "world"]
+    assert tokenizer.words(ODD_TEXTS[4]) == ["a.", "b:", "c!"]
+    assert tokenizer.words(ODD_TEXTS[5]) == ["cmsc", "12200", "more"]
+    assert tokenizer.course_code("CMSC\xa012200.  Intro") == "CMSC 12200"
+    assert tokenizer.course_code("CMSC\u202f12200.  Intro") == "CMSC 12200"
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_traced_crawl(server, serial_results, tmp_path, workers):
+    '''
+    Tracing does not change the index; every page fetched gets one JSON
+    line, visited pages have their fetch and index phases timed, and the
+    summary covers every phase that was timed.
+    '''
+    path = str(tmp_path / "trace.jsonl")
+    with tracing.Tracer(path) as tracer:
+        stats = crawler.CrawlStats(tracer)
+        if workers is None:
+            actual = crawler.crawl(100, server.url + "index.html",
+                                   server.domain, stats=stats)
+        else:
+            actual = crawler.crawl_async(100, server.url + "index.html",
+                                         server.domain, concurrency=4,
+                                         stats=stats, workers=workers)
+    assert actual == serial_results[100]
+
+    with open(path) as f:
+        events = [json.loads(line) for line in f]
+    assert len(events) == tracer.pages == stats.requests
+    visited = [event for event in events if event["visited"]]
+    assert len(visited) == tracer.visited == stats.pages
+    for event in visited:
+        assert event["status"] == 200 and event["bytes"] > 0
+        assert {"request", "transfer", "decode", "follow",
+                "merge"} <= set(event["seconds"])
+    assert sum("blocks" in event["seconds"] for event in events) == \
+        stats.parsed
+    connected = [event for event in events if "connect" in event["seconds"]]
+    assert 1 <= len(connected) <= 4
+    assert [event["t"] for event in events] == \
+        sorted(event["t"] for event in events)
+
+    summary = tracer.summary()
+    for phase in ("connect", "request", "parse", "blocks", "tokenize",
+                  "merge"):
+        assert phase in summary
+    assert sum(tracing.histogram(tracer.phases["parse"])) == stats.parsed
+
+
+def test_synthetic_catalog(tmp_path):
+    '''
+    A synthetic catalog is deterministic, has main blocks with their
+    subsequences, and crawls to the same index whether it is generated
+    on request (in a server process or thread) or written to disk.
+    Every page is reached and every course in course_map is indexed.
+    '''
+    catalog = catalog_generator.SyntheticCatalog(pages=60, departments=3,
+                                                 courses=3, links=3,
+                                                 depth=3, sequences=0.5)
+    again = catalog_generator.SyntheticCatalog(pages=60, departments=3,
+                                               courses=3, links=3, depth=3,
+                                               sequences=0.5)
+    paths = list(catalog.paths())
+    assert len(paths) == len(set(paths)) == 60
+    assert all(catalog.page(path) == again.page(path) for path in paths)
+    assert catalog.page("/thecollege/") == \
+        catalog.page(catalog_generator.COLLEGE)
+    assert catalog.page("thecollege/nodept/index.html") is None
+    assert catalog.page(paths[-1].replace(".html", "0.html")) is None
+
+    blocks = [block for path in paths[2:] for block in
+              parsers.LXML.course_blocks(parsers.LXML.parse(
+                  catalog.page(path)))]
+    assert len(blocks) == 58 * 3
+    assert any(block.sequence for block in blocks)
+    page = catalog.page(paths[5])
+    assert parsers.HTML5LIB.course_blocks(parsers.HTML5LIB.parse(page)) == \
+        parsers.LXML.course_blocks(parsers.LXML.parse(page))
+
+    indexes = []
+    for process in (True, False):
+        with catalog_generator.serve_catalog(catalog, process=process) \
+            as server:
+            stats = crawler.CrawlStats()
+            indexes.append(crawler.crawl_async(
+                1000, server.url + "index.html", server.domain,
+                concurrency=4, stats=stats, parser="lxml"))
+            assert stats.pages == 60
+    catalog.write(str(tmp_path))
+    with localserver.serve_directory(str(tmp_path)) as server:
+        indexes.append(crawler.crawl(1000, server.url + "index.html",
+                                     server.domain))
+        assert server.pages_served == {"/" + path for path in paths}
+    assert indexes[0] == indexes[1] == indexes[2]
+    assert set(indexes[0].course_codes) == set(catalog.course_map())
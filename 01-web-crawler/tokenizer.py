@@ -0,0 +1,95 @@
+"""
+Course text tokenizer
+
+The index is built from the words of each course's title and
+description.  A word is a whitespace-separated token (any Unicode
+whitespace, so non-breaking spaces separate words too), lowercased,
+with one trailing "!", "." or ":" removed; empty words and the words in
+INDEX_IGNORE are left out.
+
+normalize_word and reference_words apply these rules one token at a
+time, as crawler.process_word always has.  words applies them to a
+whole text in one call: one lower(), one split() and one comprehension,
+instead of a function call and a lower() per token.  Both give the same
+words in the same order.
+
+    tokenizer.words("Introduction to Computer Science I.")
+                            ["introduction", "computer", "science"]
+    tokenizer.course_code("CMSC\xa012200.  Computer Science")
+                            "CMSC 12200"
+"""
+# pylint: disable-msg=invalid-name
+
+import re
+
+
+INDEX_IGNORE = set(['a', 'also', 'an', 'and', 'are', 'as', 'at', 'be',
+                    'but', 'by', 'course', 'for', 'from', 'how', 'i',
+                    'ii', 'iii', 'in', 'include', 'is', 'not', 'of',
+                    'on', 'or', 's', 'sequence', 'so', 'social', 'students',
+                    'such', 'that', 'the', 'their', 'this', 'through', 'to',
+                    'topics', 'units', 'we', 'were', 'which', 'will', 'with',
+                    'yet'])
+
+# Characters removed from the end of a word
+TRAILING_PUNCTUATION = "!.:"
+
+# Course codes are the first CODE_LENGTH characters of a course title
+CODE_LENGTH = 10
+
+_SPACE = re.compile(r"\s")
+
+
+def normalize_word(string):
+    '''
+    Lowercases a token and removes one trailing "!", "." or ":".
+    Input: (str) the token
+    Output: (str) the word, or None if it is empty or ignored
+    '''
+    word = string.lower()
+    if word[-1:] and word[-1] in TRAILING_PUNCTUATION:
+        word = word[:-1]
+    if word and word not in INDEX_IGNORE:
+        return word
+    return None
+
+
+def reference_words(text):
+    '''
+    The words of a text, one token at a time (see normalize_word).
+    '''
+    words_ = []
+    for token in text.split():
+        word = normalize_word(token)
+        if word is not None:
+            words_.append(word)
+    return words_
+
+
+def words(text):
+    '''
+    The words of a text, in order (the same as reference_words).
+    Input: (str) course title or description text
+    Output: (list) of words
+    '''
+    ignore = INDEX_IGNORE
+    punctuation = TRAILING_PUNCTUATION
+    return [word for word in
+            (token[:-1] if token[-1] in punctuation else token
+             for token in text.lower().split())
+            if word and word not in ignore]
+
+
+def course_code(title):
+    '''
+    Course code at the start of a course title, with any whitespace in
+    it (such as a non-breaking space) replaced by a space.
+    '''
+    return _SPACE.sub(" ", title.strip()[:CODE_LENGTH])
+
+
+def title_text(title):
+    '''
+    A course title without its course code.
+    '''
+    return title.strip()[CODE_LENGTH:]
@@ -0,0 +1,265 @@
+"""
+Crawl tracing
+
+An opt-in record of where a crawl spends its time.  Give the crawl's
+CrawlStats a Tracer and every page the crawl fetches produces one trace:
+the seconds spent in each phase of fetching and processing it, plus its
+HTTP status, size and whether it came from the cache, was unchanged or
+was visited.  The tracer writes each trace as a JSON line (if it has a
+file) and keeps the phase times, so summary() can show their
+distribution at the end of the run:
+
+    with tracing.Tracer("trace.jsonl") as tracer:
+        stats = crawler.CrawlStats(tracer=tracer)
+        crawler.crawl(100, stats=stats)
+        print(tracer.summary())
+
+The phases, in the order a page goes through them:
+
+    connect     DNS lookup and opening the connection, when the pool
+                has to open one (HttpSession only)
+    request     sending the request until the response headers arrive
+                (without connect)
+    transfer    reading the response body
+    decode      util.read_request
+    scan        the streaming link scan (linkscan.py)
+    parse       building the tree
+    links       finding the hrefs in the tree
+    blocks      finding the course blocks and their sequences (the
+                util.find_sequence walk)
+    tokenize    turning the course blocks into postings
+    follow      normalizing the links and picking the new ones
+    merge       merging the postings into the index
+
+HttpSession times the connections its pool opens and gives each
+response their seconds (its connect_time).  Without it (util.get_request)
+there is no connect phase and request includes any connecting; a page
+served from the cache without a request has neither.
+"""
+# pylint: disable-msg=invalid-name
+
+import array
+import bisect
+import contextlib
+import json
+import math
+import threading
+import time
+
+
+PHASES = ("connect", "request", "transfer", "decode", "scan", "parse", "links",
+          "blocks", "tokenize", "follow", "merge")
+
+# Upper edges of the histogram buckets, in seconds (the last bucket
+# holds everything slower)
+BUCKETS = (1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2,
+           0.1, 0.25, 0.5, 1.0)
+
+
+def start_trace(stats):
+    '''
+    A new, empty trace for a page, or None if the crawl is not traced.
+    Input:
+        (CrawlStats) the crawl's counters, or None
+    '''
+    if stats is None or getattr(stats, "tracer", None) is None:
+        return None
+    return {}
+
+
+@contextlib.contextmanager
+def timed(trace, phase):
+    '''
+    Adds the seconds spent in the with block to a phase of a trace
+    (does nothing if the trace is None).
+
+        with tracing.timed(trace, "parse"):
+            soup = parser.parse(body)
+    '''
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace[phase] = trace.get(phase, 0.0) + time.perf_counter() - start
+
+
+def record_response(trace, request, seconds):
+    '''
+    Records a request in a trace: its status, size and whether it came
+    from the cache, and its seconds split into connect (the response's
+    connect_time, set by HttpSession), request (until the headers
+    arrived, requests' Response.elapsed, less connect) and transfer.
+    Inputs:
+        trace (dict): the page's trace, or None
+        request: response object, or None if the request failed
+        seconds (float): time taken by the whole request
+    '''
+    if trace is None:
+        return
+    if request is None:
+        trace["status"] = None
+        trace["request"] = seconds
+        return
+    elapsed = getattr(request, "elapsed", None)
+    waited = seconds if elapsed is None else \
+        min(elapsed.total_seconds(), seconds)
+    connect = min(getattr(request, "connect_time", 0.0), waited)
+    if connect > 0:
+        trace["connect"] = connect
+    trace["request"] = waited - connect
+    trace["transfer"] = seconds - waited
+    trace["status"] = request.status_code
+    trace["bytes"] = len(request.content)
+    trace["cached"] = bool(getattr(request, "from_cache", False))
+
+
+def percentile(values, fraction):
+    '''
+    The value below which a fraction of the sorted values fall
+    (nearest rank).
+    '''
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(values)))
+    return values[rank - 1]
+
+
+def histogram(values):
+    '''
+    Number of values in each of BUCKETS (plus one for slower values).
+    '''
+    counts = [0] * (len(BUCKETS) + 1)
+    for value in values:
+        counts[bisect.bisect_left(BUCKETS, value)] += 1
+    return counts
+
+
+def format_seconds(seconds):
+    '''
+    Short human-readable duration.
+    '''
+    if seconds < 1e-3:
+        return "{:.3g}us".format(seconds * 1e6)
+    if seconds < 1:
+        return "{:.3g}ms".format(seconds * 1e3)
+    return "{:.3g}s".format(seconds)
+
+
+class Tracer:
+    '''
+    Collects page traces, writes them as JSON lines and summarizes them.
+    Safe to use from the fetcher threads of crawl_async.
+    '''
+    def __init__(self, path=None):
+        '''
+        Constructor of the Tracer class.
+
+        Inputs:
+            path (str): JSONL file to write the traces to (None: keep
+              only the summary)
+        '''
+        self.path = path
+        self._file = None
+        if path is not None:
+            self._file = open(path, "w", encoding="utf-8")
+        self.start = time.perf_counter()
+        self.pages = 0
+        self.visited = 0
+        self.bytes = 0
+        self.phases = {phase: array.array("d") for phase in PHASES}
+        self.sizes = array.array("d")
+        self._lock = threading.Lock()
+
+    def page(self, url, trace, **fields):
+        '''
+        Records the trace of a page.
+        Inputs:
+            url (str): URL the page was requested at
+            trace (dict): phase seconds and page facts (see the module
+              docstring); None is ignored
+            fields: more facts about the page (e.g. visited=True)
+        '''
+        if trace is None:
+            return
+        event = {"t": round(time.perf_counter() - self.start, 6),
+                 "url": url}
+        event.update(fields)
+        seconds = {}
+        for key, value in trace.items():
+            if key in self.phases:
+                seconds[key] = round(value, 6)
+            else:
+                event[key] = value
+        event["seconds"] = seconds
+
+        with self._lock:
+            self.pages += 1
+            if event.get("visited"):
+                self.visited += 1
+            if "bytes" in event:
+                self.bytes += event["bytes"]
+                self.sizes.append(event["bytes"])
+            for phase, value in trace.items():
+                if phase in self.phases:
+                    self.phases[phase].append(value)
+            if self._file is not None:
+                self._file.write(json.dumps(event, separators=(",", ":")))
+                self._file.write("\n")
+
+    def summary(self):
+        '''
+        Per phase: pages, total, mean, median, 95th percentile and max
+        time, and a histogram of the times; then the page sizes.
+        '''
+        lines = ["{} pages traced ({} visited), {} bytes, {:.2f}s".format(
+            self.pages, self.visited, self.bytes,
+            time.perf_counter() - self.start)]
+        lines.append("{:<9} {:>6} {:>9} {:>8} {:>8} {:>8} {:>8}".format(
+            "phase", "pages", "total", "mean", "p50", "p95", "max"))
+        for phase in PHASES:
+            values = sorted(self.phases[phase])
+            if not values:
+                continue
+            lines.append("{:<9} {:>6} {:>9} {:>8} {:>8} {:>8} {:>8}".format(
+                phase, len(values), format_seconds(sum(values)),
+                format_seconds(sum(values) / len(values)),
+                format_seconds(percentile(values, 0.5)),
+                format_seconds(percentile(values, 0.95)),
+                format_seconds(values[-1])))
+
+        edges = ["<=" + format_seconds(edge) for edge in BUCKETS] + \
+            [">" + format_seconds(BUCKETS[-1])]
+        lines.append("")
+        lines.append("{:<9} ".format("phase") +
+                     " ".join("{:>7}".format(edge) for edge in edges))
+        for phase in PHASES:
+            if self.phases[phase]:
+                lines.append("{:<9} ".format(phase) + " ".join(
+                    "{:>7}".format(count or ".")
+                    for count in histogram(self.phases[phase])))
+
+        if self.sizes:
+            sizes = sorted(self.sizes)
+            lines.append("")
+            lines.append("page bytes: mean {:.0f}, p50 {:.0f}, p95 {:.0f}, "
+                         "max {:.0f}".format(
+                             sum(sizes) / len(sizes), percentile(sizes, 0.5),
+                             percentile(sizes, 0.95), sizes[-1]))
+        return "\n".join(lines)
+
+    def close(self):
+        '''
+        Closes the JSONL file.
+        '''
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,182 @@
+"""
+Memoized link normalization
+
+crawler.get_links sends every href of every page through
+util.remove_fragment, util.is_absolute_url, util.convert_if_relative_url
+and util.is_url_ok_to_follow, each of which parses the URL again, and
+catalog pages repeat the same navigation links on every page.
+
+LinkNormalizer gives the same answers, but parses each href once (plus
+once more for the absolute URL a relative href resolves to) and keeps
+the verdict for each (base URL, href) pair in an LRU cache.  Hrefs with
+an absolute path ("/thecollege/...") only depend on the scheme and host
+of the base URL, so they are cached per host rather than per page.
+
+    normalizer = urlnorm.normalizer(limiting_domain)
+    normalizer.normalize(base_url, href)   absolute URL to follow, or None
+    normalizer.normalize_links(base_url, hrefs)
+                                           all of a page's links at once
+"""
+# pylint: disable-msg=invalid-name
+
+import functools
+import os
+import threading
+import urllib.parse
+
+import util
+
+
+DEFAULT_MAXSIZE = 65536
+
+# The hosts util.convert_if_relative_url recognizes in a relative URL
+HOST_EXTENSIONS = (".edu", ".org", ".com", ".net")
+
+
+class LinkNormalizer:
+    '''
+    crawler.get_links for one limiting domain, with an LRU cache of
+    verdicts.  Safe to share between threads.
+    '''
+    def __init__(self, limiting_domain, maxsize=DEFAULT_MAXSIZE):
+        '''
+        Constructor of the LinkNormalizer class.
+
+        Inputs:
+            limiting_domain (str): domain the crawl must stay within
+            maxsize (int): (base URL, href) verdicts to keep
+        '''
+        self.limiting_domain = limiting_domain
+        self._cached = functools.lru_cache(maxsize=maxsize)(self._normalize)
+        self._origins = {}
+        self._lock = threading.Lock()
+
+    def _origin(self, base):
+        '''
+        Scheme and host of a base URL ("" unless it has both).
+        '''
+        origin = self._origins.get(base)
+        if origin is None:
+            parsed = urllib.parse.urlparse(base)
+            origin = ""
+            if parsed.scheme != "" and parsed.netloc != "":
+                origin = parsed.scheme + "://" + parsed.netloc + "/"
+            with self._lock:
+                if len(self._origins) >= DEFAULT_MAXSIZE:
+                    self._origins.clear()
+                self._origins[base] = origin
+        return origin
+
+    def normalize(self, base, href):
+        '''
+        The absolute URL a link leads to, if the crawler may follow it.
+        Inputs:
+            base (str): URL of the page the link is on
+            href (str): value of the link's href attribute
+        Output:
+            (str) absolute URL, or None
+        '''
+        if href[:1] == "/" and href[:2] != "//":
+            origin = self._origin(base)
+            if origin:
+                base = origin
+        return self._cached(base, href)
+
+    def normalize_links(self, base, hrefs):
+        '''
+        Normalizes all the links of a page.
+        Inputs:
+            base (str): URL of the page
+            hrefs (list): href values of the links on the page
+        Output:
+            (list) absolute URLs to follow, in page order (may contain
+            duplicates)
+        '''
+        normalize = self.normalize
+        links = []
+        for href in hrefs:
+            new_url = normalize(base, href)
+            if new_url is not None:
+                links.append(new_url)
+        return links
+
+    def _normalize(self, base, href):
+        '''
+        Uncached normalize: the same steps as crawler.get_links, sharing
+        one parse of the href between them.
+        '''
+        new_url = href
+        parsed = urllib.parse.urlparse(href)
+        if "#" in href:
+            # util.remove_fragment
+            new_url = urllib.parse.urlunparse(parsed[:5] + ("",))
+            parsed = urllib.parse.urlparse(new_url)
+
+        if new_url == "" or parsed.netloc == "":
+            # util.convert_if_relative_url on a relative URL
+            if new_url == "" or not util.is_absolute_url(base):
+                return None
+            first = parsed.path.split("/")[0]
+            if first[-4:] in HOST_EXTENSIONS or new_url[:3] == "www":
+                new_url = util.convert_if_relative_url(base, new_url)
+            else:
+                new_url = urllib.parse.urljoin(base, new_url)
+            if new_url is None:
+                return None
+            parsed = urllib.parse.urlparse(new_url)
+
+        if not self._ok_to_follow(new_url, parsed):
+            return None
+        return new_url
+
+    def _ok_to_follow(self, url, parsed):
+        '''
+        util.is_url_ok_to_follow, given the parse of url.
+        '''
+        if "mailto:" in url or "@" in url:
+            return False
+        if url[:util.LEN_ARCHIVES] == util.ARCHIVES or \
+            url[:util.LEN_ARCHIVES_HTTP] == util.ARCHIVES_HTTP:
+            return False
+        if parsed.scheme not in ("http", "https"):
+            return False
+        if parsed.netloc == "" or parsed.fragment != "" or parsed.query != "":
+            return False
+
+        loc = parsed.netloc
+        trunc_loc = loc[-(len(self.limiting_domain) + 1):]
+        if not (self.limiting_domain == loc or
+                trunc_loc == "." + self.limiting_domain):
+            return False
+
+        ext = os.path.splitext(parsed.path)[1]
+        return ext == "" or ext == ".html"
+
+    def cache_info(self):
+        '''
+        Hits, misses and size of the verdict cache (functools.lru_cache
+        statistics).
+        '''
+        return self._cached.cache_info()
+
+    def cache_clear(self):
+        '''
+        Empties the verdict cache.
+        '''
+        self._cached.cache_clear()
+        with self._lock:
+            self._origins.clear()
+
+
+_normalizers = {}
+_normalizers_lock = threading.Lock()
+
+
+def normalizer(limiting_domain):
+    '''
+    The shared LinkNormalizer for a limiting domain.
+    '''
+    with _normalizers_lock:
+        if limiting_domain not in _normalizers:
+            _normalizers[limiting_domain] = LinkNormalizer(limiting_domain)
+        return _normalizers[limiting_domain]
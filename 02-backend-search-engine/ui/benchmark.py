@@ -0,0 +1,410 @@
+'''
+Course search engine: benchmarks
+
+Searches are the inputs of find_courses_tests.json, run over and over,
+against the course database or a copy of it (--database; for example
+one migrated with schema_indexes.py).
+
+    python3 benchmark.py pool [--threads N ...] [--seconds S] [--rounds N]
+    python3 benchmark.py queries [--rounds N] [--size N]
+    python3 benchmark.py walking [--rounds N] [--dept DEPT] [--campuses N]
+    python3 benchmark.py haversine [--sizes N ...]
+    python3 benchmark.py buildings [--sizes N ...] [--minutes M]
+    python3 benchmark.py results [--rounds N] [--size N]
+
+Only the results benchmark uses the result cache (result_cache.py): the
+others would otherwise time cache hits.
+'''
+# pylint: disable-msg=invalid-name
+
+import argparse
+import json
+import math
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import building_index
+import courses
+import distances
+import schema_indexes
+import walking_times
+
+
+TESTS_FILENAME = os.path.join(courses.DATA_DIR, 'find_courses_tests.json')
+
+
+def search_inputs(path=TESTS_FILENAME):
+    '''
+    The non-empty find_courses inputs of a tests file.
+    '''
+    with open(path) as f:
+        return [t["input"] for t in json.load(f) if t["input"]]
+
+
+def percentile(values, fraction):
+    '''
+    The value below which a fraction of the sorted values fall
+    (nearest rank).
+    '''
+    if not values:
+        return 0.0
+    return values[max(1, math.ceil(fraction * len(values))) - 1]
+
+
+def run_load(inputs, threads, seconds):
+    '''
+    Runs searches from several threads for a number of seconds.
+    Inputs:
+        inputs (list): find_courses inputs, searched in turn
+        threads (int): concurrent searchers
+        seconds (float): length of the run
+    Output:
+        (list) of the seconds each search took, sorted
+    '''
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def searcher(offset):
+        mine = []
+        i = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            courses.find_courses(inputs[i % len(inputs)])
+            mine.append(time.perf_counter() - start)
+            i += 1
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=searcher, args=(n,))
+               for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sorted(latencies)
+
+
+def open_files():
+    '''
+    Number of open file descriptors of this process (None if unknown).
+    '''
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def bench_pool(args):
+    '''
+    Searches per second and latency with a connection per search
+    (pool size 0) and with pooled connections, at several thread counts.
+    '''
+    pool = courses.get_connection_pool()
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        pool.open_connection().close()
+    connect = (time.perf_counter() - start) / args.rounds
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        with pool.connection():
+            pass
+    borrow = (time.perf_counter() - start) / args.rounds
+    print("connection setup {:.1f}us, borrowing from the pool {:.1f}us".format(
+        connect * 1e6, borrow * 1e6))
+
+    inputs = search_inputs()
+    print("{:<8} {:>7} {:>9} {:>10} {:>9} {:>9} {:>7} {:>6}".format(
+        "mode", "threads", "searches", "searches/s", "p50 ms", "p95 ms",
+        "opened", "files"))
+    for mode, size in (("connect", 0), ("pool", args.size)):
+        courses.POOL_SIZE = size
+        courses.close_connection_pools()
+        for threads in args.threads:
+            latencies = run_load(inputs, threads, args.seconds)
+            pool = courses.get_connection_pool()
+            print("{:<8} {:>7} {:>9} {:>10.0f} {:>9.2f} {:>9.2f} {:>7} "
+                  "{:>6}".format(
+                      mode, threads, len(latencies),
+                      len(latencies) / args.seconds,
+                      percentile(latencies, 0.5) * 1e3,
+                      percentile(latencies, 0.95) * 1e3,
+                      pool.opened, open_files()))
+            courses.close_connection_pools()
+
+
+def bench_queries(args):
+    '''
+    Searches per second building and preparing every statement (cache
+    size 0) and with the query cache, then the cache's per-shape report.
+    '''
+    inputs = search_inputs()
+    print("{:<8} {:>9} {:>10} {:>10} {:>9}".format(
+        "cache", "searches", "seconds", "searches/s", "build us"))
+    for size in (0, args.size):
+        courses.QUERY_CACHE_SIZE = size
+        courses.close_connection_pools()
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            for search in inputs:
+                courses.build_query(search)
+        build = (time.perf_counter() - start) / (args.rounds * len(inputs))
+        courses.get_query_cache().clear()
+
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            for search in inputs:
+                courses.find_courses(search)
+        seconds = time.perf_counter() - start
+        searches = args.rounds * len(inputs)
+        print("{:<8} {:>9} {:>10.2f} {:>10.0f} {:>9.1f}".format(
+            size, searches, seconds, searches / seconds, build * 1e6))
+    print()
+    print(courses.get_query_cache().report())
+
+
+def bench_results(args):
+    '''
+    Searches per second and latency running every search (cache size
+    0) and with the result cache, then the cache's report.
+    '''
+    inputs = search_inputs()
+    print("{:<8} {:>9} {:>10} {:>10} {:>9} {:>9}".format(
+        "cache", "searches", "seconds", "searches/s", "p50 us", "p95 us"))
+    for size in (0, args.size):
+        courses.RESULT_CACHE_SIZE = size
+        courses.get_result_cache().clear()
+        latencies = []
+        for _ in range(args.rounds):
+            for search in inputs:
+                start = time.perf_counter()
+                courses.find_courses(search)
+                latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        seconds = sum(latencies)
+        print("{:<8} {:>9} {:>10.2f} {:>10.0f} {:>9.1f} {:>9.1f}".format(
+            size, len(latencies), seconds, len(latencies) / seconds,
+            percentile(latencies, 0.5) * 1e6,
+            percentile(latencies, 0.95) * 1e6))
+    print()
+    print(courses.get_result_cache().report())
+
+
+def walking_inputs(database, dept=None, minutes=(0, 5, 10, 20)):
+    '''
+    A walking time search from every building in gps, at several walking
+    times, narrowed to one department if dept is given.
+    '''
+    connection = sqlite3.connect(database)
+    buildings = [code for code, in connection.execute(
+        "SELECT building_code FROM gps ORDER BY building_code")]
+    connection.close()
+    inputs = [{"building_code": building, "walking_time": walk}
+              for building in buildings for walk in minutes]
+    if dept:
+        for search in inputs:
+            search["dept"] = dept
+    return inputs
+
+
+def add_campuses(database, campuses, spacing=0.5):
+    '''
+    Copies every building of gps, and every section, to campuses - 1
+    more campuses spacing degrees of longitude apart (building codes get
+    a "~N" suffix).  Searches return the same rows: the copies are far
+    beyond walking distance of the original buildings.
+    '''
+    connection = sqlite3.connect(database)
+    with connection:
+        for n in range(1, campuses):
+            connection.execute(
+                "INSERT INTO gps SELECT building_code || '~{0}', "
+                "lat, lon + {1} FROM gps WHERE building_code NOT LIKE "
+                "'%~%'".format(n, n * spacing))
+            connection.execute(
+                "INSERT INTO sections SELECT section_id + {0}, course_id, "
+                "section_num, meeting_pattern_id, building_code || '~{1}', "
+                "enrollment FROM sections WHERE building_code NOT LIKE "
+                "'%~%'".format(n * 10 ** 7, n))
+    connection.close()
+
+
+def bench_walking(args):
+    '''
+    Walking time searches with time_between and with the walking_times
+    table, on copies of the database (both migrated with
+    schema_indexes.py unless --unindexed).
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        databases = []
+        for mode in ("function", "table"):
+            path = os.path.join(directory, mode + ".sqlite3")
+            shutil.copy(args.database, path)
+            add_campuses(path, args.campuses)
+            if not args.unindexed:
+                schema_indexes.migrate(path)
+            if mode == "table":
+                walking_times.refresh(path)
+            databases.append((mode, path))
+
+        inputs = walking_inputs(args.database, args.dept)
+        print("{:<9} {:>9} {:>8} {:>10} {:>10}".format(
+            "mode", "searches", "rows", "seconds", "searches/s"))
+        for mode, path in databases:
+            courses.DATABASE_FILENAME = path
+            courses.close_connection_pools()
+            rows = 0
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                for search in inputs:
+                    rows += len(courses.find_courses(search)[1])
+            seconds = time.perf_counter() - start
+            searches = args.rounds * len(inputs)
+            print("{:<9} {:>9} {:>8} {:>10.2f} {:>10.0f}".format(
+                mode, searches, rows, seconds, searches / seconds))
+        courses.close_connection_pools()
+
+
+def bench_haversine(args):
+    '''
+    Walking minutes for random pairs of points around campus: one
+    compute_time_between call per pair vs. distances.walking_minutes.
+    '''
+    rng = np.random.default_rng(args.seed)
+    print("{:>9} {:>11} {:>11} {:>9} {:>6}".format(
+        "pairs", "scalar s", "array s", "speedup", "same"))
+    for size in args.sizes:
+        points = [rng.uniform(-87.62, -87.58, size),
+                  rng.uniform(41.77, 41.81, size),
+                  rng.uniform(-87.62, -87.58, size),
+                  rng.uniform(41.77, 41.81, size)]
+        pairs = list(zip(*(p.tolist() for p in points)))
+        start = time.perf_counter()
+        scalar = [courses.compute_time_between(*pair) for pair in pairs]
+        scalar_time = time.perf_counter() - start
+        start = time.perf_counter()
+        array = distances.walking_minutes(*points)
+        array_time = time.perf_counter() - start
+        print("{:>9} {:>11.4f} {:>11.4f} {:>8.0f}x {:>6}".format(
+            size, scalar_time, array_time,
+            scalar_time / max(array_time, 1e-9), str(array.tolist() == scalar)))
+
+
+def bench_buildings(args):
+    '''
+    "Buildings within M minutes" on generated multi-campus building sets:
+    timing every building with distances.walking_minutes vs. the
+    building index.
+    '''
+    rng = np.random.default_rng(args.seed)
+    print("{:>9} {:>9} {:>11} {:>11} {:>12} {:>9}".format(
+        "buildings", "build s", "scan us", "index us", "candidates",
+        "found"))
+    for size in args.sizes:
+        centers = rng.uniform([-120, 25], [-70, 50], (args.campuses, 2))
+        campus = rng.integers(0, args.campuses, size)
+        lons = rng.normal(centers[campus, 0], 0.02)
+        lats = rng.normal(centers[campus, 1], 0.02)
+        start = time.perf_counter()
+        index = building_index.BuildingIndex(
+            ["B{}".format(i) for i in range(size)], lons, lats)
+        build_time = time.perf_counter() - start
+
+        queries = rng.integers(0, size, args.queries).tolist()
+        start = time.perf_counter()
+        for i in queries:
+            scanned = np.flatnonzero(distances.walking_minutes(
+                lons, lats, lons[i], lats[i]) <= args.minutes)
+        scan_time = (time.perf_counter() - start) / len(queries)
+        candidates = found = 0
+        start = time.perf_counter()
+        for i in queries:
+            found += len(index.near_point(lons[i], lats[i], args.minutes))
+        index_time = (time.perf_counter() - start) / len(queries)
+        for i in queries:
+            candidates += len(index.candidates(lons[i], lats[i],
+                                               args.minutes))
+        assert index.near_point(lons[queries[-1]], lats[queries[-1]],
+                                args.minutes).tolist() == scanned.tolist()
+        print("{:>9} {:>9.2f} {:>11.1f} {:>11.1f} {:>12.0f} {:>9.0f}".format(
+            size, build_time, scan_time * 1e6, index_time * 1e6,
+            candidates / len(queries), found / len(queries)))
+
+
+def go():
+    '''
+    Runs a benchmark from the command line.
+    '''
+    parser = argparse.ArgumentParser(description="course search benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    p = subparsers.add_parser("pool", help="pooled vs. per-search "
+                              "connections")
+    p.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    p.add_argument("--seconds", type=float, default=5.0)
+    p.add_argument("--rounds", type=int, default=1000,
+                   help="connections opened to time the setup")
+    p.add_argument("--size", type=int, default=courses.POOL_SIZE,
+                   help="connections in the pool")
+    p.set_defaults(func=bench_pool)
+
+    p = subparsers.add_parser("queries", help="compiled query cache")
+    p.add_argument("--rounds", type=int, default=50)
+    p.add_argument("--size", type=int, default=courses.QUERY_CACHE_SIZE,
+                   help="query shapes cached")
+    p.set_defaults(func=bench_queries)
+
+    p = subparsers.add_parser("walking", help="walking times: function "
+                              "vs. table")
+    p.add_argument("--rounds", type=int, default=5)
+    p.add_argument("--dept", default="MATH",
+                   help="department the searches are narrowed to "
+                   "('' for none)")
+    p.add_argument("--campuses", type=int, default=1,
+                   help="copies of the campus (see add_campuses)")
+    p.add_argument("--unindexed", action="store_true",
+                   help="do not add the schema_indexes.py indexes")
+    p.set_defaults(func=bench_walking)
+
+    p = subparsers.add_parser("haversine",
+                              help="scalar vs. array walking times")
+    p.add_argument("--sizes", type=int, nargs="+",
+                   default=[10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6])
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_haversine)
+
+    p = subparsers.add_parser("buildings",
+                              help="buildings within a walk: scan vs. index")
+    p.add_argument("--sizes", type=int, nargs="+",
+                   default=[10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6])
+    p.add_argument("--campuses", type=int, default=100)
+    p.add_argument("--minutes", type=int, default=10)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_buildings)
+
+    p = subparsers.add_parser("results", help="search result cache")
+    p.add_argument("--rounds", type=int, default=50)
+    p.add_argument("--size", type=int, default=courses.RESULT_CACHE_SIZE,
+                   help="results cached")
+    p.set_defaults(func=bench_results)
+
+    for p in subparsers.choices.values():
+        p.add_argument("--database", default=courses.DATABASE_FILENAME,
+                       help="course database (default: %(default)s)")
+
+    args = parser.parse_args()
+    courses.DATABASE_FILENAME = args.database
+    if args.benchmark != "results":
+        courses.RESULT_CACHE_SIZE = 0
+    args.func(args)
+
+
+if __name__ == "__main__":
+    go()
@@ -0,0 +1,177 @@
+'''
+Course search engine: spatial index of buildings
+
+Answers "which buildings are within M minutes' walk of building B"
+without measuring the walk to every building.  The buildings of gps
+are bucketed in a grid of cells of cell_degrees latitude by
+cell_degrees longitude.  A query:
+
+    1. turns M minutes into the largest distance that still rounds to
+       at most M minutes, and that distance into a latitude/longitude
+       box around B (slightly enlarged, so it never misses a building);
+    2. collects the buildings of the cells that overlap the box;
+    3. keeps those at most M minutes away, measured exactly as
+       find_courses measures them (distances.walking_minutes).
+
+Only the cells near B are visited, so the time depends on how many
+buildings are nearby, not on how many there are.  Boxes that reach a
+pole or the antimeridian fall back to measuring every building.
+
+find_courses passes the result to SQL as a list of building codes, so
+only sections in those buildings are joined and timed.
+
+    index = building_index.load_index("course_information.sqlite3")
+    index.within("RY", 10)                  # ["BSLC", "CRER", ...]
+'''
+# pylint: disable-msg=invalid-name
+
+import math
+import sqlite3
+
+import numpy as np
+
+import distances
+
+
+# Side of a grid cell, in degrees (about 1.1 km of latitude)
+DEFAULT_CELL_DEGREES = 0.01
+
+# Relative enlargement of the search box
+BOX_MARGIN = 1e-3
+
+# (building, minutes) answers remembered by an index
+WITHIN_CACHE_SIZE = 4096
+
+
+class BuildingIndex:
+    '''
+    Grid index of building locations.
+    '''
+    def __init__(self, codes, lons, lats, cell_degrees=DEFAULT_CELL_DEGREES):
+        '''
+        Constructor of the BuildingIndex class.
+
+        Inputs:
+            codes (list): building codes (a code may appear more than
+              once: each of its locations counts)
+            lons, lats (lists): longitude and latitude of each building,
+              in decimal degrees
+            cell_degrees (float): side of a grid cell, in degrees
+        '''
+        self.codes = list(codes)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.cell_degrees = cell_degrees
+
+        self._points = {}
+        for i, code in enumerate(self.codes):
+            self._points.setdefault(code, []).append(i)
+
+        cells = {}
+        rows = np.floor(self.lats / cell_degrees).astype(np.int64)
+        columns = np.floor(self.lons / cell_degrees).astype(np.int64)
+        for i, cell in enumerate(zip(rows.tolist(), columns.tolist())):
+            cells.setdefault(cell, []).append(i)
+        self._cells = {cell: np.array(points, dtype=np.int64)
+                       for cell, points in cells.items()}
+        self._within = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self._points
+
+    def _box(self, lon, lat, minutes):
+        '''
+        (south, north, west, east) bounds in degrees of the points that
+        can be at most minutes away from (lon, lat), or None if the box
+        reaches a pole or the antimeridian.
+        '''
+        # ceil(meters / (speed * 60)) <= minutes exactly when
+        # meters <= minutes * speed * 60
+        meters = max(minutes, 0) * distances.WALK_SPEED_M_PER_SEC * 60
+        angle = meters / (distances.EARTH_RADIUS_KM * 1000)
+        angle = angle * (1 + BOX_MARGIN) + 1e-12
+        dlat = math.degrees(angle)
+        if abs(lat) + dlat >= 90 or angle >= math.pi / 2:
+            return None
+        # widest longitude difference at distance angle from latitude lat
+        dlon = math.degrees(math.asin(min(
+            1.0, math.sin(angle) / math.cos(math.radians(abs(lat) + dlat)))))
+        dlon = dlon * (1 + BOX_MARGIN)
+        if lon - dlon < -180 or lon + dlon > 180:
+            return None
+        return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+    def candidates(self, lon, lat, minutes):
+        '''
+        Indexes of the buildings in the cells that overlap the search
+        box (every building if there is no box).
+        '''
+        box = self._box(lon, lat, minutes)
+        if box is None:
+            return np.arange(len(self.codes))
+        south, north, west, east = box
+        size = self.cell_degrees
+        rows = range(math.floor(south / size), math.floor(north / size) + 1)
+        columns = range(math.floor(west / size), math.floor(east / size) + 1)
+
+        if len(rows) * len(columns) <= len(self._cells):
+            found = [self._cells[cell] for cell in
+                     ((row, column) for row in rows for column in columns)
+                     if cell in self._cells]
+        else:
+            found = [points for (row, column), points in self._cells.items()
+                     if row in rows and column in columns]
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(found)
+
+    def near_point(self, lon, lat, minutes):
+        '''
+        Indexes of the buildings at most minutes away from a point,
+        sorted.
+        '''
+        points = self.candidates(lon, lat, minutes)
+        if len(points) == 0:
+            return points
+        times = distances.walking_minutes(self.lons[points],
+                                          self.lats[points], lon, lat)
+        return np.sort(points[times <= minutes])
+
+    def within(self, code, minutes):
+        '''
+        Codes of the buildings at most minutes' walk from a building, as
+        find_courses measures it (compute_time_between), sorted.  Empty
+        if the building is not indexed.  Answers are remembered (up to
+        WITHIN_CACHE_SIZE of them).
+        '''
+        key = (code, minutes)
+        codes = self._within.get(key)
+        if codes is None:
+            found = set()
+            for i in self._points.get(code, []):
+                for j in self.near_point(self.lons[i], self.lats[i],
+                                         minutes).tolist():
+                    found.add(self.codes[j])
+            codes = sorted(found)
+            if len(self._within) >= WITHIN_CACHE_SIZE:
+                self._within.clear()
+            self._within[key] = codes
+        return list(codes)
+
+
+def load_index(database, cell_degrees=DEFAULT_CELL_DEGREES):
+    '''
+    BuildingIndex of the gps table of a database.
+    '''
+    connection = sqlite3.connect(database)
+    try:
+        rows = connection.execute(
+            "SELECT building_code, lon, lat FROM gps").fetchall()
+    finally:
+        connection.close()
+    return BuildingIndex([code for code, _, _ in rows],
+                         [lon for _, lon, _ in rows],
+                         [lat for _, _, lat in rows], cell_degrees)
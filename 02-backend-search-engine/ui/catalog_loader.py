@@ -0,0 +1,241 @@
+'''
+Course search engine: bulk loader for the catalog index
+
+Loads the identifier|word rows the crawler writes (catalog_index.csv)
+into the catalog_index table of the course database:
+
+    1. the rows are streamed into a staging table, catalog_index_load,
+       with executemany, BATCH_SIZE rows per transaction, and without
+       indexes;
+    2. the old table's indexes are built on the staging table, under
+       other names (SQLite cannot rename an index, so each load
+       alternates between an index's name and that name with
+       INDEX_SUFFIX; see index_base_name);
+    3. in one short transaction, the old table is dropped and the
+       staging table renamed to catalog_index (and the catalog_version
+       number incremented, so cached search results are dropped, see
+       result_cache.py).
+
+Searches keep seeing the old table, with its indexes, until step 3
+commits, and never see a partly loaded one; if any step fails the
+staging table is dropped.  If the binary catalog index
+(catalog_postings.py) exists, a new one is written from the staging
+table before step 3 and renamed over the old one as soon as step 3
+commits, so the table and the binary index are out of step only for the
+time of a rename.
+
+    python3 catalog_loader.py ../../01-web-crawler/catalog_index.csv
+    python3 catalog_loader.py - < catalog_index.csv
+'''
+# pylint: disable-msg=invalid-name
+
+import argparse
+import itertools
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import catalog_postings
+import courses
+import result_cache
+
+
+TABLE = "catalog_index"
+STAGING_TABLE = "catalog_index_load"
+
+# Rows inserted per transaction
+BATCH_SIZE = 200000
+
+# Added to (or removed from) the names of the indexes built on the
+# staging table
+INDEX_SUFFIX = "_load"
+
+# Name and table of a CREATE INDEX statement as SQLite stores it
+CREATE_INDEX = re.compile(r"^(CREATE\s+(?:UNIQUE\s+)?INDEX\s+)\S+(\s+ON\s+)"
+                          r"\S+?(\s*\()", re.IGNORECASE)
+
+CREATE_TABLE = '''
+CREATE TABLE {}
+(
+    course_id integer,      -- course ID
+    word varchar(100)       -- word found in course title or description
+)'''
+
+
+class LoadReport:
+    '''
+    Rows loaded and time taken by each step of a load.
+    '''
+    def __init__(self):
+        '''
+        Constructor of the LoadReport class.
+        '''
+        self.rows = 0
+        self.batches = 0
+        self.load_time = 0.0
+        self.index_time = 0.0
+        self.swap_time = 0.0
+        self.binary_time = 0.0
+
+    @property
+    def total_time(self):
+        '''
+        Seconds taken by the whole load.
+        '''
+        return self.load_time + self.index_time + self.swap_time + \
+            self.binary_time
+
+    def __str__(self):
+        return ("{} rows in {} batches: loaded in {:.2f}s ({:,.0f} rows/s), "
+                "indexed in {:.2f}s, swapped in {:.2f}s, binary index "
+                "{:.2f}s; {:,.0f} rows/s overall").format(
+                    self.rows, self.batches, self.load_time,
+                    self.rows / max(self.load_time, 1e-9), self.index_time,
+                    self.swap_time, self.binary_time,
+                    self.rows / max(self.total_time, 1e-9))
+
+
+def table_indexes(connection, table):
+    '''
+    Name and CREATE INDEX statement of each explicit index on a table.
+    '''
+    return connection.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+        "AND tbl_name = ? AND sql IS NOT NULL", (table,)).fetchall()
+
+
+def index_base_name(name):
+    '''
+    Name of an index without the INDEX_SUFFIX a load may have given it.
+    '''
+    if name.endswith(INDEX_SUFFIX):
+        return name[:-len(INDEX_SUFFIX)]
+    return name
+
+
+def staging_index_sql(name, sql):
+    '''
+    CREATE INDEX statement that builds a copy of an index of the table
+    on the staging table: INDEX_SUFFIX is added to its name, or removed
+    if the name has it.
+    '''
+    new_name = index_base_name(name)
+    if new_name == name:
+        new_name += INDEX_SUFFIX
+    return CREATE_INDEX.sub(
+        lambda match: '{}"{}"{}{}{}'.format(match.group(1), new_name,
+                                            match.group(2), STAGING_TABLE,
+                                            match.group(3)), sql, count=1)
+
+
+def load_rows(rows, database=courses.DATABASE_FILENAME,
+              binary=courses.CATALOG_INDEX_FILENAME, batch_size=BATCH_SIZE):
+    '''
+    Replaces the catalog_index table of a database with rows.
+    Inputs:
+        rows (iterable): (course ID, word) pairs
+        database (str): course database
+        binary (str): binary catalog index to rebuild if it exists
+          (None: leave it alone)
+        batch_size (int): rows inserted per transaction
+    Output:
+        (LoadReport) rows loaded and timings
+    '''
+    report = LoadReport()
+    connection = sqlite3.connect(database, isolation_level=None)
+    new_binary = None
+    try:
+        start = time.perf_counter()
+        connection.execute("DROP TABLE IF EXISTS " + STAGING_TABLE)
+        connection.execute(CREATE_TABLE.format(STAGING_TABLE))
+        insert = "INSERT INTO {} VALUES (?, ?)".format(STAGING_TABLE)
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            connection.execute("BEGIN")
+            connection.executemany(insert, batch)
+            connection.execute("COMMIT")
+            report.rows += len(batch)
+            report.batches += 1
+        report.load_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for name, sql in table_indexes(connection, TABLE):
+            connection.execute(staging_index_sql(name, sql))
+        report.index_time = time.perf_counter() - start
+
+        # The new binary index is written next to the old one before the
+        # swap and renamed over it as soon as the swap commits
+        if binary is not None and os.path.exists(binary):
+            start = time.perf_counter()
+            new_binary = binary + ".new"
+            catalog_postings.write_index(catalog_postings.read_database_rows(
+                database, STAGING_TABLE), new_binary)
+            report.binary_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        connection.execute("BEGIN IMMEDIATE")
+        connection.execute("DROP TABLE IF EXISTS " + TABLE)
+        connection.execute("ALTER TABLE {} RENAME TO {}".format(
+            STAGING_TABLE, TABLE))
+        result_cache.bump_version(connection)
+        connection.execute("COMMIT")
+        if new_binary is not None:
+            os.replace(new_binary, binary)
+            new_binary = None
+        report.swap_time = time.perf_counter() - start
+    except BaseException:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        connection.execute("DROP TABLE IF EXISTS " + STAGING_TABLE)
+        raise
+    finally:
+        connection.close()
+        if new_binary is not None and os.path.exists(new_binary):
+            os.remove(new_binary)
+
+    return report
+
+
+def load_csv(csv_path, database=courses.DATABASE_FILENAME,
+             binary=courses.CATALOG_INDEX_FILENAME, batch_size=BATCH_SIZE):
+    '''
+    Replaces the catalog_index table of a database with the rows of a
+    catalog_index.csv written by the crawler (see load_rows).
+    '''
+    return load_rows(catalog_postings.read_csv_rows(csv_path), database,
+                     binary, batch_size)
+
+
+def go():
+    '''
+    Loads a catalog index from the command line.
+    '''
+    parser = argparse.ArgumentParser(
+        description="load catalog_index.csv into the course database")
+    parser.add_argument("csv", help="catalog_index.csv written by the "
+                        "crawler ('-' for standard input)")
+    parser.add_argument("--database", default=courses.DATABASE_FILENAME,
+                        help="course database (default: %(default)s)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="rows per transaction (default: %(default)s)")
+    parser.add_argument("--binary", default=courses.CATALOG_INDEX_FILENAME,
+                        help="binary catalog index to rebuild if it exists "
+                        "(default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.csv == "-":
+        report = load_rows(catalog_postings.csv_rows(sys.stdin),
+                           args.database, args.binary, args.batch_size)
+    else:
+        report = load_csv(args.csv, args.database, args.binary,
+                          args.batch_size)
+    print(report)
+
+
+if __name__ == "__main__":
+    go()
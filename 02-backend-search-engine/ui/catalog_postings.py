@@ -0,0 +1,326 @@
+'''
+Course search engine: binary catalog index
+
+The crawler writes the catalog index as a pipe-delimited CSV of
+identifier|word rows (catalog_index.csv).  This module converts it to a
+compact binary file that find_courses can read postings from through
+mmap, without loading the whole index:
+
+    header       magic, version, number of terms, number of rows, and
+                 the offsets of the three sections below
+    entries      one fixed-size entry per term, sorted by term, plus a
+                 sentinel: (term offset, postings offset, postings length)
+    terms        the UTF-8 bytes of every term, in entry order
+    postings     for each term, its sorted course IDs as deltas from the
+                 previous ID, each a LEB128 varint
+
+Looking a term up is a binary search over the entries, comparing against
+the term bytes in the map, and decodes only that term's postings.
+
+    python3 catalog_postings.py catalog_index.csv catalog_index.bin
+    python3 catalog_postings.py --sqlite course_information.sqlite3 \\
+        catalog_index.bin
+'''
+# pylint: disable-msg=invalid-name
+
+import argparse
+import csv
+import mmap
+import os
+import sqlite3
+import struct
+import tempfile
+
+
+MAGIC = b"CIDX"
+VERSION = 1
+
+# magic, version, terms, rows, entries offset, terms offset,
+# postings offset, file size
+HEADER = struct.Struct("<4sIIQQQQQ")
+
+# term offset, postings offset, number of course IDs
+ENTRY = struct.Struct("<QQI")
+
+
+def encode_varint(n, out):
+    '''
+    Appends the LEB128 encoding of a non-negative integer to a bytearray.
+    '''
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def encode_postings(course_ids):
+    '''
+    Delta and varint encoding of sorted, duplicate-free course IDs.
+    '''
+    out = bytearray()
+    previous = 0
+    for course_id in course_ids:
+        encode_varint(course_id - previous, out)
+        previous = course_id
+    return bytes(out)
+
+
+def decode_postings(buf, start, count):
+    '''
+    Decodes count delta-encoded course IDs starting at buf[start].
+    Inputs:
+        buf (bytes-like): index file contents (or an mmap of it)
+        start (int): offset of the first varint
+        count (int): number of course IDs
+    Output:
+        (list) of course IDs, sorted
+    '''
+    ids = []
+    pos = start
+    current = 0
+    for _ in range(count):
+        shift = 0
+        delta = 0
+        while True:
+            byte = buf[pos]
+            pos += 1
+            delta |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        current += delta
+        ids.append(current)
+    return ids
+
+
+def build_postings(rows):
+    '''
+    Groups (course ID, word) rows into postings.
+    Input:
+        rows (iterable): (course ID, word) pairs; repeated pairs are
+          counted once
+    Output:
+        (dict) words mapped to sorted lists of course IDs, and the
+        number of distinct rows
+    '''
+    postings = {}
+    for course_id, word in rows:
+        postings.setdefault(word, set()).add(int(course_id))
+    num_rows = sum(len(ids) for ids in postings.values())
+    return {word: sorted(ids) for word, ids in postings.items()}, num_rows
+
+
+def write_index(rows, path):
+    '''
+    Writes the binary index of (course ID, word) rows to path
+    (atomically: through a temporary file and os.replace).
+    Output:
+        (int) size of the file in bytes
+    '''
+    postings, num_rows = build_postings(rows)
+    words = sorted(postings, key=lambda word: word.encode("utf-8"))
+
+    entries = bytearray()
+    terms = bytearray()
+    blob = bytearray()
+    for word in words:
+        entries += ENTRY.pack(len(terms), len(blob), len(postings[word]))
+        terms += word.encode("utf-8")
+        blob += encode_postings(postings[word])
+    entries += ENTRY.pack(len(terms), len(blob), 0)
+
+    entries_offset = HEADER.size
+    terms_offset = entries_offset + len(entries)
+    postings_offset = terms_offset + len(terms)
+    size = postings_offset + len(blob)
+    header = HEADER.pack(MAGIC, VERSION, len(words), num_rows,
+                         entries_offset, terms_offset, postings_offset, size)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        f.write(header)
+        f.write(entries)
+        f.write(terms)
+        f.write(blob)
+    os.replace(tmp, path)
+    return size
+
+
+def csv_rows(f):
+    '''
+    (course ID, word) rows of an open catalog_index.csv.
+    '''
+    for row in csv.reader(f, delimiter="|"):
+        if row:
+            yield int(row[0]), row[1]
+
+
+def read_csv_rows(path):
+    '''
+    (course ID, word) rows of a catalog_index.csv written by the crawler.
+    '''
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv_rows(f)
+
+
+def read_database_rows(path, table="catalog_index"):
+    '''
+    (course ID, word) rows of the catalog_index table (or of another
+    table with the same columns) of a database.
+    '''
+    connection = sqlite3.connect(path)
+    try:
+        yield from connection.execute(
+            "SELECT course_id, word FROM " + table)
+    finally:
+        connection.close()
+
+
+def convert_csv(csv_path, path):
+    '''
+    Converts a catalog_index.csv to the binary format.
+    Output:
+        (int) size of the binary file in bytes
+    '''
+    return write_index(read_csv_rows(csv_path), path)
+
+
+class PostingsReader:
+    '''
+    Read-only view of a binary index file through mmap.
+    '''
+    def __init__(self, path):
+        '''
+        Constructor of the PostingsReader class.
+
+        Inputs:
+            path (str): binary index file
+        '''
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise ValueError("{} is not a catalog index".format(path))
+        (magic, version, self.num_terms, self.num_rows, self._entries,
+         self._terms, self._postings, size) = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION or size != len(self._map):
+            self.close()
+            raise ValueError("{} is not a version {} catalog index".format(
+                path, VERSION))
+
+    def _entry(self, i):
+        return ENTRY.unpack_from(self._map, self._entries + i * ENTRY.size)
+
+    def _term(self, i):
+        start = self._entry(i)[0]
+        end = self._entry(i + 1)[0]
+        return self._map[self._terms + start:self._terms + end]
+
+    def _find(self, word):
+        '''
+        Entry number of word, or None.
+        '''
+        key = word.encode("utf-8")
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.num_terms and self._term(lo) == key:
+            return lo
+        return None
+
+    def get(self, word, default=None):
+        '''
+        Sorted course IDs of a word, or default if it is not indexed.
+        '''
+        i = self._find(word)
+        if i is None:
+            return default
+        _, start, count = self._entry(i)
+        return decode_postings(self._map, self._postings + start, count)
+
+    def __getitem__(self, word):
+        ids = self.get(word)
+        if ids is None:
+            raise KeyError(word)
+        return ids
+
+    def __contains__(self, word):
+        return self._find(word) is not None
+
+    def __len__(self):
+        return self.num_terms
+
+    def terms(self):
+        '''
+        The indexed words, in sorted (UTF-8 byte) order.
+        '''
+        for i in range(self.num_terms):
+            yield self._term(i).decode("utf-8")
+
+    def matching(self, words):
+        '''
+        Course IDs indexed under every one of words.
+        Input:
+            words (list): of strings
+        Output:
+            (list) of course IDs, sorted
+        '''
+        postings = []
+        for word in set(words):
+            ids = self.get(word)
+            if not ids:
+                return []
+            postings.append(ids)
+        postings.sort(key=len)
+        result = set(postings[0])
+        for ids in postings[1:]:
+            result.intersection_update(ids)
+            if not result:
+                break
+        return sorted(result)
+
+    def close(self):
+        '''
+        Unmaps the file.
+        '''
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def go():
+    '''
+    Converts a catalog index from the command line.
+    '''
+    parser = argparse.ArgumentParser(
+        description="convert catalog_index.csv to the binary index format")
+    parser.add_argument("source", help="catalog_index.csv (or a database "
+                        "with --sqlite)")
+    parser.add_argument("output", help="binary index file to write")
+    parser.add_argument("--sqlite", action="store_true",
+                        help="read the catalog_index table of a database")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        size = write_index(read_database_rows(args.source), args.output)
+    else:
+        size = convert_csv(args.source, args.output)
+    with PostingsReader(args.output) as reader:
+        print("{}: {} terms, {} rows, {} bytes ({:.2f}/row), source {} "
+              "bytes".format(args.output, reader.num_terms, reader.num_rows,
+                             size, size / max(reader.num_rows, 1),
+                             os.path.getsize(args.source)))
+
+
+if __name__ == "__main__":
+    go()
@@ -0,0 +1,29 @@
+'''
+Fixtures shared by the backend tests
+'''
+
+import shutil
+import pytest
+
+import courses
+
+
+@pytest.fixture
+def copy_course_database(tmp_path):
+    '''
+    Function that copies the course database into the test's temporary
+    directory, under a file name, and returns the copy's path.
+    '''
+    def copy(name="course_information.sqlite3"):
+        path = str(tmp_path / name)
+        shutil.copy(courses.DATABASE_FILENAME, path)
+        return path
+    return copy
+
+
+@pytest.fixture
+def course_database(copy_course_database):
+    '''
+    Copy of the course database.
+    '''
+    return copy_course_database()
@@ -0,0 +1,275 @@
+'''
+Course search engine: pooled read-only database connections
+
+find_courses used to open a new connection to the course database on
+every search, register time_between on it and never close it.  A
+ConnectionPool opens at most size connections, each set up once:
+
+    - opened read-only (mode=ro), and usable from any thread;
+    - the READ_ONLY_PRAGMAS applied: query_only, and a larger page cache
+      and memory map so repeated searches read from memory;
+    - the SQL functions (time_between) registered.
+
+A thread borrows a connection for one search and gives it back;
+connections are never used by two threads at once.  If all of them are
+borrowed, the next search waits up to timeout seconds for one.
+
+    pool = connection_pool.ConnectionPool(
+        "course_information.sqlite3",
+        functions={"time_between": (4, compute_time_between)})
+    with pool.connection() as connection:
+        rows = connection.execute(query, params).fetchall()
+
+A pool of size 0 does not pool: every search opens, sets up and closes
+its own connection.
+
+WAL journal mode is a property of the database file, not of a
+connection, and read-only connections cannot change it.  enable_wal (or
+ConnectionPool(..., wal=True)) converts the database once, so searches
+keep reading while catalog_loader.py replaces the catalog index.
+'''
+# pylint: disable-msg=invalid-name
+
+import collections
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+import urllib.request
+
+
+# Connections kept per pool
+DEFAULT_SIZE = 8
+
+# Seconds a search waits for a connection when all are in use
+DEFAULT_TIMEOUT = 10.0
+
+# Prepared statements kept per connection (the sqlite3 default)
+DEFAULT_STATEMENTS = 128
+
+# Pragmas applied to every pooled connection
+READ_ONLY_PRAGMAS = {
+    "query_only": "ON",
+    "mmap_size": 64 * 1024 * 1024,      # bytes
+    "cache_size": -16 * 1024,           # negative: KiB
+    "temp_store": "MEMORY",
+}
+
+
+def database_uri(path):
+    '''
+    URI that opens a database file read-only.
+    '''
+    return "file:{}?mode=ro".format(
+        urllib.request.pathname2url(os.path.abspath(path)))
+
+
+def enable_wal(path):
+    '''
+    Switches a database to WAL journal mode (needs write access to the
+    file and its directory; does nothing if it is already in WAL mode).
+    Output:
+        (str) the journal mode after the change
+    '''
+    connection = sqlite3.connect(path)
+    try:
+        mode, = connection.execute("PRAGMA journal_mode = WAL").fetchone()
+    finally:
+        connection.close()
+    return mode
+
+
+class ConnectionPool:
+    '''
+    Thread-safe pool of read-only connections to one database.
+    '''
+    def __init__(self, path, size=DEFAULT_SIZE, functions=None,
+                 pragmas=None, timeout=DEFAULT_TIMEOUT, wal=False,
+                 statements=DEFAULT_STATEMENTS):
+        '''
+        Constructor of the ConnectionPool class.
+
+        Inputs:
+            path (str): database file
+            size (int): most connections open at once (0: open a new
+              connection for every borrower and close it afterwards)
+            functions (dict): SQL function names mapped to (number of
+              arguments, Python function) pairs
+            pragmas (dict): pragmas to apply on top of READ_ONLY_PRAGMAS
+            timeout (float): seconds to wait for a free connection
+            wal (bool): switch the database to WAL mode first
+            statements (int): prepared statements each connection keeps
+              (sqlite3's cached_statements)
+        '''
+        if size < 0:
+            raise ValueError("pool size must not be negative")
+        self.path = path
+        self.size = size
+        self.functions = dict(functions or {})
+        self.pragmas = dict(READ_ONLY_PRAGMAS)
+        self.pragmas.update(pragmas or {})
+        self.timeout = timeout
+        self.statements = statements
+        if wal:
+            enable_wal(path)
+
+        self.opened = 0
+        self.borrowed = 0
+        self.waited = 0
+        self._idle = []
+        self._waiters = collections.deque()
+        self._open = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._pid = os.getpid()
+        self.closed = False
+
+    def open_connection(self):
+        '''
+        A new read-only connection with the pragmas and functions set up.
+        '''
+        connection = sqlite3.connect(database_uri(self.path), uri=True,
+                                     check_same_thread=False,
+                                     cached_statements=self.statements)
+        for pragma, value in self.pragmas.items():
+            connection.execute("PRAGMA {} = {}".format(pragma, value))
+        for name, (num_args, function) in self.functions.items():
+            connection.create_function(name, num_args, function,
+                                       deterministic=True)
+        with self._lock:
+            self.opened += 1
+        return connection
+
+    def _check_process(self):
+        '''
+        Forgets connections inherited from the parent after a fork
+        (SQLite connections must not be shared between processes).
+        Called with the lock held.
+        '''
+        if self._pid != os.getpid():
+            self._idle = []
+            self._waiters = collections.deque()
+            self._open = 0
+            self._pid = os.getpid()
+
+    def acquire(self):
+        '''
+        Borrows a connection: an idle one, a new one if fewer than size
+        are open, or else the next one given back within timeout
+        seconds.  Waiting borrowers are served first come, first served.
+        '''
+        with self._changed:
+            if self.closed:
+                raise RuntimeError("the connection pool is closed")
+            self._check_process()
+            self.borrowed += 1
+            if self.size != 0:
+                if self._idle and not self._waiters:
+                    return self._idle.pop()
+                if self._open >= self.size or self._waiters:
+                    connection = self._wait()
+                    if connection is not None:
+                        return connection
+                self._open += 1
+
+        try:
+            return self.open_connection()
+        except BaseException:
+            if self.size != 0:
+                with self._changed:
+                    self._open -= 1
+                    self._changed.notify_all()
+            raise
+
+    def _wait(self):
+        '''
+        Waits, with the lock held, until a connection is handed over
+        (returned) or one may be opened (None returned).
+        '''
+        self.waited += 1
+        slot = []
+        self._waiters.append(slot)
+        deadline = time.monotonic() + self.timeout
+        while not slot:
+            if self.closed:
+                self._waiters.remove(slot)
+                raise RuntimeError("the connection pool is closed")
+            if self._open < self.size and self._waiters[0] is slot:
+                self._waiters.popleft()
+                return None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._waiters.remove(slot)
+                self._changed.notify_all()
+                raise RuntimeError(
+                    "no database connection free after {}s".format(
+                        self.timeout))
+            self._changed.wait(remaining)
+        return slot[0]
+
+    def release(self, connection, discard=False):
+        '''
+        Gives a borrowed connection back: to the borrower that has waited
+        longest, if any.  It is closed instead if the pool does not keep
+        connections or is closed, if discard is true, or if its open
+        transaction cannot be rolled back.
+        '''
+        if not discard and connection.in_transaction:
+            try:
+                connection.rollback()
+            except sqlite3.Error:
+                discard = True
+        if self.size == 0:
+            connection.close()
+            return
+        with self._changed:
+            if self._pid != os.getpid():
+                connection.close()
+                return
+            if not (discard or self.closed):
+                if self._waiters:
+                    self._waiters.popleft().append(connection)
+                    self._changed.notify_all()
+                else:
+                    self._idle.append(connection)
+                return
+            self._open -= 1
+            self._changed.notify_all()
+        connection.close()
+
+    @contextlib.contextmanager
+    def connection(self):
+        '''
+        Borrows a connection for the with block.  A connection that
+        raised sqlite3.ProgrammingError or sqlite3.InterfaceError is
+        closed instead of going back to the pool.
+        '''
+        connection = self.acquire()
+        discard = False
+        try:
+            yield connection
+        except (sqlite3.ProgrammingError, sqlite3.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard)
+
+    def close(self):
+        '''
+        Closes the idle connections; borrowed ones are closed when they
+        are given back.
+        '''
+        with self._changed:
+            self.closed = True
+            idle = self._idle
+            self._idle = []
+            self._open -= len(idle)
+        for connection in idle:
+            connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -6,18 +6,55 @@ Kenia Godinez Nogueda
 '''
 
 from math import radians, cos, sin, asin, sqrt, ceil
-import sqlite3
+import json
+import threading
+import time
 import os
 
+import building_index
+import catalog_postings
+import connection_pool
+import query_compiler
+import result_cache
+
 # Use this filename for the database
 DATA_DIR = os.path.dirname(__file__)
 DATABASE_FILENAME = os.path.join(DATA_DIR, 'course_information.sqlite3')
 
+# Binary catalog index (see catalog_postings.py): when this file exists,
+# terms are looked up in it instead of the catalog_index table.  It must
+# be built from the same rows as the table.
+CATALOG_INDEX_FILENAME = os.path.join(DATA_DIR, 'catalog_index.bin')
+
+# Searches borrow read-only connections to DATABASE_FILENAME from a pool
+# of at most POOL_SIZE (see connection_pool.py; 0 opens one per search)
+POOL_SIZE = connection_pool.DEFAULT_SIZE
+
+# Query shapes whose SQL is kept, and statements each pooled connection
+# keeps prepared (see query_compiler.py)
+QUERY_CACHE_SIZE = query_compiler.DEFAULT_SIZE
+
+# Searches whose results are kept (0: none), their most estimated bytes
+# and the seconds they are kept (see result_cache.py)
+RESULT_CACHE_SIZE = result_cache.DEFAULT_SIZE
+RESULT_CACHE_BYTES = result_cache.DEFAULT_MAX_BYTES
+RESULT_CACHE_TTL = result_cache.DEFAULT_TTL
+
+# Rows of a page of find_courses_page, and rows stream_courses fetches
+# at a time
+PAGE_SIZE = 50
+STREAM_BATCH_SIZE = 500
+
 # Classification of attributes within args_from_ui
 INPUT_1 = ["terms", "dept"]
 INPUT_2 = ["day", "enrollment", "time_start", "time_end"]
 INPUT_3 = ["building_code", "walking_time"]
 
+# Order of the criteria in a query (building_code first: it is the
+# parameter of JOIN_GPS or JOIN_WALK, in the FROM clause)
+CRITERIA_ORDER = ["building_code", "terms", "dept", "day", "enrollment",
+                  "time_start", "time_end", "walking_time"]
+
 # Classification of outputs of args_to_ui
 OUTPUT_1 = '''
     c.dept,
@@ -32,6 +69,19 @@ OUTPUT_3 = ''',
     a.building_code,
     time_between(a.lon,a.lat,b.lon,b.lat) AS walking_time'''
 
+# OUTPUT_3 from the precomputed walking times (see walking_times.py)
+OUTPUT_3_TABLE = ''',
+    w.to_code AS building_code,
+    w.minutes AS walking_time'''
+
+# Columns of OUTPUT_1, OUTPUT_2 and OUTPUT_3
+COLUMNS_1 = ["dept", "course_num", "title"]
+COLUMNS_2 = ["section_num", "day", "time_start", "time_end", "enrollment"]
+COLUMNS_3 = ["building_code", "walking_time"]
+
+# Columns find_courses_page sorts by first
+PAGE_ORDER = ["dept", "course_num", "section_num"]
+
 # FROM clause
 Q_FORM = '''FROM courses as c'''
 
@@ -50,6 +100,10 @@ JOIN gps as a
 JOIN (SELECT gps.lon, gps.lat, gps.building_code FROM gps WHERE gps.building_code = ?) AS b
 ON a.building_code = s.building_code'''
 
+JOIN_WALK = '''
+JOIN walking_times AS w
+ON w.from_code = ? AND w.to_code = s.building_code'''
+
 def find_courses(args_from_ui):
     '''
     Takes a dictionary containing search criteria and returns courses
@@ -69,91 +123,425 @@ def find_courses(args_from_ui):
      is empty.
     '''
     assert_valid_input(args_from_ui)
-    connection = sqlite3.connect(DATABASE_FILENAME)
-    connection.create_function("time_between", 4, compute_time_between)
-    c = connection.cursor()
-    params = [] #Initiate list of parameters for execute
-    s_break = '\n'
-    expre = ""
-    inputs = []
 
     if args_from_ui == {}:
         return ([], [])
 
-    # Build SELECT clause
-    for attribute in args_from_ui:
-        inputs.append(attribute)
+    header, table = search(args_from_ui)
+    return (list(header), list(table))
+
+
+def find_courses_page(args_from_ui, limit=PAGE_SIZE, offset=0):
+    '''
+    One page of the results of find_courses, sorted by dept, course_num
+    and section_num (then by the other columns), and the number of
+    results of all pages.
+    Inputs:
+        args_from_ui (dict): search criteria, as for find_courses
+        limit (int): most rows returned
+        offset (int): rows of the earlier pages, skipped
+    Output:
+        (tuple) header, rows of the page and total number of rows
+    '''
+    assert_valid_input(args_from_ui)
+    if limit < 0 or offset < 0:
+        raise ValueError("limit and offset must not be negative")
+
+    if args_from_ui == {}:
+        return ([], [], 0)
+
+    header, table, total = search(args_from_ui, (limit, offset))
+    return (list(header), list(table), total)
+
+
+def stream_courses(args_from_ui, batch_size=STREAM_BATCH_SIZE):
+    '''
+    Generator of the header and then the rows of find_courses, fetched
+    batch_size rows at a time, so they are never all in memory (for
+    exports; the result cache is not used).  It holds a pooled
+    connection until it is exhausted or closed.
+
+        writer.writerows(courses.stream_courses(args))
+    '''
+    assert_valid_input(args_from_ui)
+
+    if args_from_ui == {}:
+        yield []
+        return
+
+    _, sql_q, params = compile_query(args_from_ui)
+    with get_connection_pool().connection() as connection:
+        cursor = connection.execute(sql_q, params)
+        try:
+            yield get_header(cursor)
+            rows = cursor.fetchmany(batch_size)
+            while rows:
+                yield from rows
+                rows = cursor.fetchmany(batch_size)
+        finally:
+            cursor.close()
+
+
+def search(args_from_ui, page=None):
+    '''
+    Header and rows of a non-empty search, from the result cache when it
+    has them.  With page, a (limit, offset) pair, only the rows of that
+    page (in page order) and then the number of rows of the search.
+    '''
+    results = get_result_cache()
+    key = version = None
+    if results.size:
+        # read before searching: a result is never kept under a version
+        # newer than the data it was computed on
+        key = (DATABASE_FILENAME, result_cache.canonical_key(args_from_ui),
+               page)
+        version = database_version()
+        cached = results.get(key, version)
+        if cached is not None:
+            return cached
+
+    shape, sql_q, params = compile_query(args_from_ui)
+    start = time.perf_counter()
+    with get_connection_pool().connection() as connection:
+        if page is None:
+            cursor = connection.execute(sql_q, params)
+            result = (tuple(get_header(cursor)), tuple(cursor.fetchall()))
+        else:
+            # the rows are counted in SQLite, not fetched: each row of
+            # the page ends with the number of rows of the search
+            cursor = connection.execute(
+                "SELECT *, COUNT(*) OVER () FROM (" + sql_q + ")\n" +
+                page_order(shape) + "\nLIMIT ? OFFSET ?",
+                params + list(page))
+            header = tuple(get_header(cursor)[:-1])
+            table = cursor.fetchall()
+            if table:
+                total = table[0][-1]
+            else:
+                total = connection.execute(
+                    "SELECT COUNT(*) FROM (" + sql_q + ")",
+                    params).fetchone()[0]
+            result = (header, tuple(row[:-1] for row in table), total)
+    get_query_cache().record(shape, time.perf_counter() - start)
+
+    if key is not None:
+        results.put(key, version, result)
+    return result
+
+
+def page_order(shape):
+    '''
+    ORDER BY clause of the pages of a query shape: the columns of
+    PAGE_ORDER it returns, then its other columns, by position.
+    '''
+    inputs = [attribute for attribute, _ in shape]
+    columns = list(COLUMNS_1)
+    if any(att in INPUT_2 + INPUT_3 for att in inputs):
+        columns += COLUMNS_2
+    if any(att in INPUT_3 for att in inputs):
+        columns += COLUMNS_3
+    order = [name for name in PAGE_ORDER if name in columns]
+    order += [name for name in columns if name not in order]
+    return "ORDER BY " + ", ".join(str(columns.index(name) + 1)
+                                   for name in order)
+
+
+def build_query(args_from_ui):
+    '''
+    Builds the query find_courses runs for a non-empty dictionary of
+    search criteria.
+    Returns a pair: the SQL statement and the list of its parameters.
+    '''
+    _, sql_q, params = compile_query(args_from_ui)
+    return (sql_q, params)
+
+
+def compile_query(args_from_ui):
+    '''
+    Query shape, SQL statement (from the query cache) and parameters of
+    the query for a non-empty dictionary of search criteria.
+    '''
+    # With a binary catalog index, terms become a list of course IDs
+    # (repeated terms keep the table query, whose COUNT(*) depends on them)
+    postings = None
+    terms = args_from_ui.get("terms")
+    if terms is not None and len(set(terms)) == len(terms):
+        postings = get_catalog_postings()
 
+    use_table = "walking_time" in args_from_ui and has_walking_times()
+    shape = query_shape(args_from_ui, postings is not None, use_table)
+    sql_q = get_query_cache().get(shape, build_sql)
+    return (shape, sql_q, query_params(args_from_ui, postings))
+
+
+def query_shape(args_from_ui, use_postings=False, use_table=False):
+    '''
+    The criteria of a search, in CRITERIA_ORDER, as (name, variant)
+    pairs.  The variant is None except for day and for terms looked up
+    in the catalog_index table (the number of values), and for
+    walking_time looked up in the walking_times table ("table").
+    '''
+    shape = []
+    for attribute in CRITERIA_ORDER:
+        if attribute not in args_from_ui:
+            continue
+        n = None
+        if attribute == "day" or (attribute == "terms" and not use_postings):
+            n = len(args_from_ui[attribute])
+        elif attribute == "walking_time" and use_table:
+            n = "table"
+        shape.append((attribute, n))
+    return tuple(shape)
+
+
+def build_sql(shape):
+    '''
+    SQL statement of a query shape.
+    '''
+    s_break = '\n'
+    inputs = [attribute for attribute, _ in shape]
+    use_table = ("walking_time", "table") in shape
+
+    # Build SELECT clause
     matched_input1 = [att for att in inputs if att in INPUT_1]
     matched_input2 = [att for att in inputs if att in INPUT_2]
     matched_input3 = [att for att in inputs if att in INPUT_3]
     select = "SELECT DISTINCT " #Get rid of duplicated
 
-    if matched_input3 != []:
+    if matched_input3 != [] and use_table:
+        q_select = select + OUTPUT_1 + OUTPUT_2 + OUTPUT_3_TABLE + s_break + \
+            Q_FORM + JOIN_SEC_MEET + JOIN_CAT + JOIN_WALK + s_break
+    elif matched_input3 != []:
         q_select = select + OUTPUT_1 + OUTPUT_2 + OUTPUT_3 + s_break + Q_FORM + \
             JOIN_SEC_MEET + JOIN_CAT + JOIN_GPS + s_break
-    elif matched_input2 != [] and matched_input1 != [] and matched_input3 == []:
+    elif matched_input2 != [] and matched_input1 != []:
         q_select = select + OUTPUT_1 + OUTPUT_2 + s_break + Q_FORM + JOIN_SEC_MEET \
             + JOIN_CAT + s_break
-    elif matched_input1 != [] and matched_input2 == [] and matched_input3 == []:
+    elif matched_input1 != [] and matched_input2 == []:
         q_select = select + OUTPUT_1 + s_break + Q_FORM + JOIN_CAT + s_break
+    else:
+        raise ValueError("a search needs terms, dept or building_code "
+                         "and walking_time")
+
+    # Build WHERE & AND clauses
+    conditions = []
+    for attribute, n in shape:
+        if attribute == "terms" and n is None:
+            conditions.append("c.course_id IN (SELECT value FROM json_each(?))")
+        elif attribute == "terms":
+            par = "?," * (n-1)
+            conditions.append(
+                "c.course_id IN(SELECT course_id FROM catalog_index AS ci "
+                "WHERE word IN (" + par + "?)" + s_break + "GROUP BY ci.course_id"
+                + s_break + "HAVING COUNT(*) = " + f'{n})')
+        elif attribute == "dept":
+            conditions.append("c.dept = ?")
+        elif attribute == "day":
+            par = "?," * (n-1)
+            conditions.append("m.day IN (" + par + "?)")
+        elif attribute == "enrollment":
+            conditions.append("s.enrollment BETWEEN ? AND ?")
+        elif attribute == "time_start":
+            conditions.append("m.time_start >= ?")
+        elif attribute == "time_end":
+            conditions.append("m.time_end <= ?")
+        elif attribute == "walking_time":
+            # only sections in the buildings within walking_time (from
+            # the building index) are joined and timed
+            conditions.append(
+                "s.building_code IN (SELECT value FROM json_each(?))")
+            if n == "table":
+                conditions.append("w.minutes <= ?")
+            else:
+                conditions.append("walking_time <= ?")
+
+    return q_select + "WHERE " + (s_break + "AND ").join(conditions)
+
+
+def query_params(args_from_ui, postings=None, buildings=None):
+    '''
+    Parameters of the query for a dictionary of search criteria, in the
+    order of the placeholders of build_sql.
+    Inputs:
+        args_from_ui (dict): search criteria
+        postings (PostingsReader): binary catalog index to look the
+          terms up in, or None
+        buildings (list): codes of the buildings within walking_time of
+          building_code (None: look them up in get_building_index())
+    '''
+    params = []
+    for attribute in CRITERIA_ORDER:
+        if attribute not in args_from_ui:
+            continue
+        value = args_from_ui[attribute]
+        if attribute == "terms" and postings is not None:
+            params.append(json.dumps(postings.matching(value)))
+        elif attribute == "walking_time":
+            if buildings is None:
+                buildings = get_building_index().within(
+                    args_from_ui["building_code"], value)
+            params.append(json.dumps(buildings))
+            params.append(value)
+        elif attribute in ("terms", "day", "enrollment"):
+            params.extend(value)
+        else:
+            params.append(value)
+    return params
 
 
-    for index, (attribute, value) in enumerate(args_from_ui.items()):
+# Held while the query cache, result cache or connection pool is
+# created, so threads searching at the same time share one of each
+_shared_lock = threading.Lock()
 
-        if attribute == "building_code":
-            params.insert(0,value)
+_query_caches = {}
 
-        # Conditions for connector clause
-        if index == 0:
-            connector = "WHERE "
-        else:
-            connector = s_break + "AND "
+def get_query_cache():
+    '''
+    The QueryCache of find_courses (created again if QUERY_CACHE_SIZE
+    changes).
+    '''
+    cache = _query_caches.get(QUERY_CACHE_SIZE)
+    if cache is None:
+        with _shared_lock:
+            cache = _query_caches.get(QUERY_CACHE_SIZE)
+            if cache is None:
+                cache = query_compiler.QueryCache(QUERY_CACHE_SIZE)
+                _query_caches.clear()
+                _query_caches[QUERY_CACHE_SIZE] = cache
+    return cache
 
-        # Build WHERE & AND clauses
-        if attribute == "terms":
-            n = len(value)
-            par = "?," * (n-1)
-            expre += connector + "c.course_id IN(SELECT course_id FROM catalog_index AS ci " \
-                "WHERE word IN (" + par + "?)" + s_break + "GROUP BY ci.course_id" + s_break\
-                    + "HAVING COUNT(*) = " + f'{n})' + s_break
-            for term in value:
-                params.append(term)
-
-        if attribute == "dept":
-            expre += connector + "c.dept = ?"
-            params.append(value)
 
-        if attribute == "day":
-            n = len(value)
-            par = "?," * (n-1)
-            expre += connector + "m.day IN (" + par + "?) "
-            for day in value:
-                params.append(day)
+_result_caches = {}
+
+def get_result_cache():
+    '''
+    The ResultCache of find_courses (created again if RESULT_CACHE_SIZE,
+    RESULT_CACHE_BYTES or RESULT_CACHE_TTL change).
+    '''
+    key = (RESULT_CACHE_SIZE, RESULT_CACHE_BYTES, RESULT_CACHE_TTL)
+    cache = _result_caches.get(key)
+    if cache is None:
+        with _shared_lock:
+            cache = _result_caches.get(key)
+            if cache is None:
+                cache = result_cache.ResultCache(*key)
+                _result_caches.clear()
+                _result_caches[key] = cache
+    return cache
+
+
+def database_version():
+    '''
+    Version of the data searches read: size and modification time of
+    DATABASE_FILENAME, of its -wal file (WAL commits leave the database
+    file alone) and of CATALOG_INDEX_FILENAME, and the number in its
+    catalog_version table.
+    '''
+    version = []
+    for path in (DATABASE_FILENAME, DATABASE_FILENAME + "-wal",
+                 CATALOG_INDEX_FILENAME):
+        try:
+            stat = os.stat(path)
+            version.append((stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            version.append(None)
+    with get_connection_pool().connection() as connection:
+        version.append(result_cache.read_version(connection))
+    return tuple(version)
+
+
+_connection_pools = {}
+
+def get_connection_pool():
+    '''
+    The ConnectionPool of DATABASE_FILENAME, with time_between
+    registered on its connections.  It is created on first use, and
+    again if DATABASE_FILENAME, POOL_SIZE or QUERY_CACHE_SIZE change.
+    '''
+    key = (DATABASE_FILENAME, POOL_SIZE, QUERY_CACHE_SIZE)
+    pool = _connection_pools.get(key)
+    if pool is None:
+        with _shared_lock:
+            pool = _connection_pools.get(key)
+            if pool is None:
+                close_connection_pools()
+                pool = connection_pool.ConnectionPool(
+                    DATABASE_FILENAME, POOL_SIZE,
+                    functions={"time_between": (4, compute_time_between)},
+                    statements=QUERY_CACHE_SIZE)
+                _connection_pools[key] = pool
+    return pool
+
+
+def close_connection_pools():
+    '''
+    Closes the connections of the pools get_connection_pool created.
+    '''
+    for pool in list(_connection_pools.values()):
+        pool.close()
+    _connection_pools.clear()
 
-        if attribute == "enrollment":
-            expre += connector + "s.enrollment BETWEEN ? AND ?"
-            params.append(value[0])
-            params.append(value[1])
 
-        if attribute == "time_start":
-            expre += connector + "m.time_start >= ? "
-            params.append(value)
+_walking_times = {}
 
-        if attribute == "time_end":
-            expre += connector + "m.time_end <= ?"
-            params.append(value)
+def has_walking_times():
+    '''
+    Whether DATABASE_FILENAME has a walking_times table (checked again
+    when the file changes).
+    '''
+    try:
+        key = (DATABASE_FILENAME, os.stat(DATABASE_FILENAME).st_mtime_ns)
+    except FileNotFoundError:
+        return False
+    found = _walking_times.get(key)
+    if found is None:
+        with get_connection_pool().connection() as connection:
+            found = connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                "AND name = 'walking_times'").fetchone() is not None
+        _walking_times.clear()
+        _walking_times[key] = found
+    return found
+
+
+_building_indexes = {}
+
+def get_building_index():
+    '''
+    The BuildingIndex of the gps table of DATABASE_FILENAME (built again
+    when the file changes).
+    '''
+    key = (DATABASE_FILENAME, os.stat(DATABASE_FILENAME).st_mtime_ns)
+    index = _building_indexes.get(key)
+    if index is None:
+        index = building_index.load_index(DATABASE_FILENAME)
+        _building_indexes.clear()
+        _building_indexes[key] = index
+    return index
 
-        if attribute == "walking_time":
-            expre += connector + "walking_time <= ?"
-            params.append(value)
 
-    sql_q = q_select + expre
-    cursor = c.execute(sql_q, params)
-    header = get_header(cursor)
-    table = c.fetchall()
+_catalog_postings = {}
 
-    return (header, table)
+def get_catalog_postings():
+    '''
+    The PostingsReader of CATALOG_INDEX_FILENAME, or None if there is no
+    binary index.  The file is mapped once and mapped again if it changes.
+    '''
+    try:
+        mtime = os.stat(CATALOG_INDEX_FILENAME).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    key = (CATALOG_INDEX_FILENAME, mtime)
+    reader = _catalog_postings.get(key)
+    if reader is None:
+        # The old reader is not closed: searches in other threads may
+        # still be reading it.  Its file is unmapped when the last of
+        # them lets go of it.
+        _catalog_postings.clear()
+        reader = catalog_postings.PostingsReader(CATALOG_INDEX_FILENAME)
+        _catalog_postings[key] = reader
+    return reader
 
 
 ########### auxiliary functions #################
@@ -0,0 +1,114 @@
+'''
+Course search engine: walking times for arrays of coordinates
+
+courses.compute_time_between converts the haversine distance between
+two points to whole minutes of walking, one pair of points at a time.
+The functions here do the same for NumPy arrays of coordinates in one
+call: the same formula, the same 6367 km radius, walking speed and
+ceil rounding.
+
+NumPy's sin, cos and sqrt can differ from the math module's in the last
+bit.  That only matters for the minutes when the unrounded time is
+within a hair of a whole minute, so those few pairs (and any that are
+not finite) are recomputed one at a time by time_between, a copy of
+compute_time_between (this module does not import courses, which
+imports it through building_index): the results are always exactly
+those of compute_time_between.
+
+    distances.walking_minutes(lon1, lat1, lon2, lat2)
+                                        # compute_time_between, per pair
+    distances.minutes_matrix(lons, lats)
+                                        # every pair of points
+'''
+# pylint: disable-msg=invalid-name
+
+from math import radians, cos, sin, asin, sqrt, ceil
+
+import numpy as np
+
+
+# The constants of courses.haversine and courses.compute_time_between
+EARTH_RADIUS_KM = 6367
+WALK_SPEED_M_PER_SEC = 1.1
+
+# Unrounded times this close to a whole minute are recomputed with
+# time_between
+TIE_TOLERANCE = 1e-6
+
+
+def time_between(lon1, lat1, lon2, lat2):
+    '''
+    Walking minutes between two points given in decimal degrees:
+    courses.compute_time_between, operation for operation.
+    '''
+    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
+    c = 2 * asin(sqrt(a))
+    meters = EARTH_RADIUS_KM * c * 1000
+    return int(ceil(meters / (WALK_SPEED_M_PER_SEC * 60)))
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    '''
+    Circle distances in meters between points given in decimal degrees
+    (arrays, or numbers broadcast against them).
+    '''
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(x, dtype=np.float64))
+                              for x in (lon1, lat1, lon2, lat2))
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2)**2
+    c = 2 * np.arcsin(np.sqrt(a))
+    km = EARTH_RADIUS_KM * c
+    return km * 1000
+
+
+def walking_minutes(lon1, lat1, lon2, lat2):
+    '''
+    compute_time_between(lon1[i], lat1[i], lon2[i], lat2[i]) for every
+    i, in one call.
+    Inputs:
+        lon1, lat1, lon2, lat2: arrays of decimal degrees (or numbers,
+          broadcast against the arrays)
+    Output:
+        (ndarray) of int64 minutes, of the broadcast shape of the inputs
+        (0-d if they are all numbers)
+    '''
+    lon1, lat1, lon2, lat2 = np.broadcast_arrays(
+        *(np.asarray(x, dtype=np.float64) for x in (lon1, lat1, lon2, lat2)))
+    shape = lon1.shape
+    # 0-d arrays cannot be indexed by np.nonzero: work on 1-d ones
+    lon1, lat1, lon2, lat2 = (np.atleast_1d(x) for x in
+                              (lon1, lat1, lon2, lat2))
+    with np.errstate(invalid="ignore"):
+        mins = haversine(lon1, lat1, lon2, lat2) / (WALK_SPEED_M_PER_SEC * 60)
+    minutes = np.ceil(mins)
+
+    close = ~np.isfinite(mins) | (np.abs(mins - np.rint(mins)) <=
+                                  TIE_TOLERANCE)
+    for i in zip(*np.nonzero(close)):
+        minutes[i] = time_between(lon1[i], lat1[i], lon2[i], lat2[i])
+    return minutes.astype(np.int64).reshape(shape)
+
+
+def minutes_matrix(lons, lats):
+    '''
+    Walking minutes between every pair of points, oriented the way
+    find_courses queries them: matrix[i, j] is the time from point i to
+    point j, compute_time_between(lons[j], lats[j], lons[i], lats[i]).
+    '''
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    return walking_minutes(lons[np.newaxis, :], lats[np.newaxis, :],
+                           lons[:, np.newaxis], lats[:, np.newaxis])
+
+
+def within(lons, lats, lon, lat, minutes):
+    '''
+    Indexes of the points at most a number of minutes' walk from (lon,
+    lat), as find_courses measures it.
+    '''
+    times = walking_minutes(lons, lats, lon, lat)
+    return np.flatnonzero(times <= minutes)
@@ -0,0 +1,168 @@
+'''
+Course search engine: cache of compiled queries
+
+find_courses builds one SQL statement per query shape: which search
+criteria are given, in a fixed order, and how many values the list
+criteria have (see courses.query_shape).  Two searches of the same
+shape run the same statement with different parameters, so the
+statement is built once and kept in a QueryCache, a least recently used
+cache of size shapes.
+
+Keeping the SQL text the same for every search of a shape is also what
+lets SQLite reuse the statement prepared for it: each pooled connection
+keeps its own LRU of prepared statements keyed by SQL text (sqlite3's
+cached_statements, see connection_pool.py).
+
+The cache counts hits and misses, and the calls and seconds of the
+searches of each cached shape:
+
+    cache = query_compiler.QueryCache(128)
+    sql = cache.get(shape, build_sql)
+    ...
+    cache.record(shape, seconds)
+    print(cache.report())
+'''
+# pylint: disable-msg=invalid-name
+
+import collections
+import threading
+
+
+# Query shapes kept
+DEFAULT_SIZE = 128
+
+
+class ShapeStats:
+    '''
+    SQL of a query shape, and the calls and seconds of its searches.
+    '''
+    def __init__(self, sql):
+        '''
+        Constructor of the ShapeStats class.
+
+        Inputs:
+            sql (str): the statement of the shape
+        '''
+        self.sql = sql
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    @property
+    def mean_seconds(self):
+        '''
+        Average seconds per search.
+        '''
+        return self.seconds / self.calls if self.calls else 0.0
+
+
+class QueryCache:
+    '''
+    Thread-safe LRU cache of SQL statements keyed by query shape.
+    '''
+    def __init__(self, size=DEFAULT_SIZE):
+        '''
+        Constructor of the QueryCache class.
+
+        Inputs:
+            size (int): most shapes kept (0: build every statement)
+        '''
+        if size < 0:
+            raise ValueError("cache size must not be negative")
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._shapes = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, shape, build):
+        '''
+        The SQL of a query shape, built with build(shape) on a miss.
+        Inputs:
+            shape (tuple): query shape
+            build (function): returns the SQL of a shape
+        Output:
+            (str) the SQL statement
+        '''
+        with self._lock:
+            stats = self._shapes.get(shape)
+            if stats is not None:
+                self._shapes.move_to_end(shape)
+                self.hits += 1
+                return stats.sql
+            self.misses += 1
+
+        sql = build(shape)
+        if self.size == 0:
+            return sql
+        with self._lock:
+            if shape not in self._shapes:
+                self._shapes[shape] = ShapeStats(sql)
+                while len(self._shapes) > self.size:
+                    self._shapes.popitem(last=False)
+        return sql
+
+    def record(self, shape, seconds):
+        '''
+        Counts a search of a shape that took seconds to run (ignored if
+        the shape is not cached).
+        '''
+        with self._lock:
+            stats = self._shapes.get(shape)
+            if stats is not None:
+                stats.calls += 1
+                stats.seconds += seconds
+                stats.max_seconds = max(stats.max_seconds, seconds)
+
+    @property
+    def hit_rate(self):
+        '''
+        Fraction of lookups that found their shape.
+        '''
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def shapes(self):
+        '''
+        (shape, ShapeStats) pairs of the cached shapes, most time first.
+        '''
+        with self._lock:
+            items = list(self._shapes.items())
+        return sorted(items, key=lambda item: item[1].seconds, reverse=True)
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def clear(self):
+        '''
+        Forgets every shape and resets the counters.
+        '''
+        with self._lock:
+            self._shapes.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def report(self, limit=None):
+        '''
+        Hit rate, and calls and latency of the shapes with the most time
+        (all of them, or the first limit).
+        '''
+        lines = ["{} shapes cached, {} hits, {} misses ({:.1%} hit "
+                 "rate)".format(len(self), self.hits, self.misses,
+                                self.hit_rate)]
+        lines.append("{:>7} {:>10} {:>9} {:>9}  {}".format(
+            "calls", "total ms", "mean ms", "max ms", "shape"))
+        for shape, stats in self.shapes()[:limit]:
+            lines.append("{:>7} {:>10.2f} {:>9.3f} {:>9.3f}  {}".format(
+                stats.calls, stats.seconds * 1e3, stats.mean_seconds * 1e3,
+                stats.max_seconds * 1e3, format_shape(shape)))
+        return "\n".join(lines)
+
+
+def format_shape(shape):
+    '''
+    Short text for a query shape: criteria names, with the number of
+    values of the list criteria.
+    '''
+    return ", ".join(name if n is None else "{}[{}]".format(name, n)
+                     for name, n in shape)
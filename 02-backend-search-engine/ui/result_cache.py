@@ -0,0 +1,234 @@
+'''
+Course search engine: cache of search results
+
+The search page calls find_courses on every request, and the same
+searches (one department, one term, ...) come back again and again
+while the database only changes when the catalog is reloaded.  A
+ResultCache keeps the (header, rows) of recent searches keyed by their
+canonical criteria (canonical_key: the same criteria in any order, with
+lists or tuples, give the same key) and drops them:
+
+    - when they are older than ttl seconds;
+    - least recently used first, when there are more than size of them
+      or they take more than max_bytes (as estimated by result_bytes);
+    - when the database version changes.
+
+The version is whatever the caller passes (find_courses uses the file
+size and modification time of the database, its -wal file and the
+binary catalog index, and the number in the catalog_version table).
+catalog_loader bumps catalog_version in the transaction that swaps the
+new catalog in, so even a reload that keeps the file's size and
+modification time (a copy with preserved timestamps, a coarse
+filesystem clock) invalidates the cache.
+
+    cache = result_cache.ResultCache(1024)
+    result = cache.get(key, version)
+    if result is None:
+        result = search()
+        cache.put(key, version, result)
+    print(cache.report())
+'''
+# pylint: disable-msg=invalid-name
+
+import collections
+import json
+import sqlite3
+import sys
+import threading
+import time
+
+
+# Searches kept
+DEFAULT_SIZE = 1024
+
+# Estimated bytes of the results kept
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Seconds a result is kept
+DEFAULT_TTL = 600.0
+
+VERSION_TABLE = "catalog_version"
+
+CREATE_VERSION_TABLE = '''
+CREATE TABLE IF NOT EXISTS catalog_version
+(
+    version integer         -- incremented on every catalog reload
+)'''
+
+
+class CachedResult:
+    '''
+    A result kept by a ResultCache.
+    '''
+    def __init__(self, version, result, size, expires):
+        '''
+        Constructor of the CachedResult class.
+
+        Inputs:
+            version: database version the result was computed on
+            result (tuple): header and rows (of a page, then the
+              number of rows of the search)
+            size (int): estimated bytes of the result
+            expires (float): clock time after which it is dropped
+        '''
+        self.version = version
+        self.result = result
+        self.size = size
+        self.expires = expires
+
+
+class ResultCache:
+    '''
+    Thread-safe LRU cache of search results with a time to live, a byte
+    budget and version invalidation.
+    '''
+    def __init__(self, size=DEFAULT_SIZE, max_bytes=DEFAULT_MAX_BYTES,
+                 ttl=DEFAULT_TTL, clock=time.monotonic):
+        '''
+        Constructor of the ResultCache class.
+
+        Inputs:
+            size (int): most results kept (0: keep none)
+            max_bytes (int): most estimated bytes kept
+            ttl (float): seconds a result is kept
+            clock (function): current time in seconds
+        '''
+        if size < 0 or max_bytes < 0 or ttl < 0:
+            raise ValueError("cache size, bytes and ttl must not be negative")
+        self.size = size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+        self.evicted = 0
+        self._results = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        '''
+        The result kept for a key, or None if there is none for this
+        version that has not expired.
+        '''
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                if cached.version != version:
+                    self._drop(key)
+                    self.invalidated += 1
+                elif cached.expires < self.clock():
+                    self._drop(key)
+                    self.expired += 1
+                else:
+                    self._results.move_to_end(key)
+                    self.hits += 1
+                    return cached.result
+            self.misses += 1
+            return None
+
+    def put(self, key, version, result):
+        '''
+        Keeps the result of a key, computed on a database version (a
+        result larger than max_bytes is not kept).
+        '''
+        if self.size == 0:
+            return
+        size = result_bytes(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._results:
+                self._drop(key)
+            self._results[key] = CachedResult(version, result, size,
+                                              self.clock() + self.ttl)
+            self.bytes += size
+            while len(self._results) > self.size or \
+                    self.bytes > self.max_bytes:
+                self._drop(next(iter(self._results)))
+                self.evicted += 1
+
+    def _drop(self, key):
+        self.bytes -= self._results.pop(key).size
+
+    @property
+    def hit_rate(self):
+        '''
+        Fraction of lookups that found a result.
+        '''
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self._results)
+
+    def clear(self):
+        '''
+        Forgets every result and resets the counters.
+        '''
+        with self._lock:
+            self._results.clear()
+            self.bytes = 0
+            self.hits = self.misses = 0
+            self.expired = self.invalidated = self.evicted = 0
+
+    def report(self):
+        '''
+        Results kept, and hits, misses and drops so far.
+        '''
+        return ("{} results cached ({:.1f} KB), {} hits, {} misses ({:.1%} "
+                "hit rate); dropped {} expired, {} invalidated, {} "
+                "evicted".format(len(self), self.bytes / 1024, self.hits,
+                                 self.misses, self.hit_rate, self.expired,
+                                 self.invalidated, self.evicted))
+
+
+def canonical_key(args_from_ui):
+    '''
+    Text that is the same for the same search criteria, whatever their
+    order and whether their values are lists or tuples.
+    '''
+    return json.dumps(args_from_ui, sort_keys=True, separators=(",", ":"))
+
+
+def result_bytes(result):
+    '''
+    Estimated bytes of a (header, rows, ...) result: the lists, the rows
+    and the values in them.
+    '''
+    header, rows = result[:2]
+    size = sys.getsizeof(header) + sys.getsizeof(rows)
+    size += sum(sys.getsizeof(name) for name in header)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(map(sys.getsizeof, row))
+    return size
+
+
+def read_version(connection):
+    '''
+    The number in the catalog_version table of a database (None if it
+    has no such table).
+    '''
+    try:
+        row = connection.execute(
+            "SELECT MAX(version) FROM catalog_version").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0]
+
+
+def bump_version(connection):
+    '''
+    Increments the number in the catalog_version table of a database,
+    creating the table if needed (inside the caller's transaction, if
+    there is one).
+    Output:
+        (int) the new version
+    '''
+    connection.execute(CREATE_VERSION_TABLE)
+    version = (read_version(connection) or 0) + 1
+    connection.execute("DELETE FROM catalog_version")
+    connection.execute("INSERT INTO catalog_version VALUES (?)", (version,))
+    return version
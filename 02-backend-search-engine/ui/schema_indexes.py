@@ -0,0 +1,209 @@
+'''
+Course search engine: indexes on the course database
+
+The tables of course_information.sqlite3 come without indexes, so every
+join in find_courses and every catalog_index word lookup scans a whole
+table.  migrate creates INDEXES (if they do not exist yet) and runs
+ANALYZE so the query planner knows how selective they are; the loader
+(catalog_loader.py) rebuilds the catalog_index ones after each load,
+alternating their names with and without a suffix.
+
+advise runs EXPLAIN QUERY PLAN over every query shape find_courses can
+build, one per combination of search criteria (building_code and
+walking_time count as one), with sample values, and flags each step
+that still scans a whole table.  Terms are looked up in the
+catalog_index table, and walking times in the walking_times table if
+the database has one (walking_times.py).
+
+    python3 schema_indexes.py migrate
+    python3 schema_indexes.py advise [--verbose]
+'''
+# pylint: disable-msg=invalid-name
+
+import argparse
+import itertools
+import sqlite3
+import sys
+
+import catalog_loader
+import connection_pool
+import courses
+
+
+# Index name, table, indexed columns
+INDEXES = (
+    # terms: word IN (...), covering course_id
+    ("catalog_index_word", "catalog_index", ("word", "course_id")),
+    # the catalog_index join on course_id, covering word
+    ("catalog_index_course", "catalog_index", ("course_id", "word")),
+    ("courses_course_id", "courses", ("course_id",)),
+    ("courses_dept", "courses", ("dept",)),
+    ("sections_course", "sections", ("course_id", "meeting_pattern_id")),
+    # walking_time: s.building_code IN (buildings within the walk)
+    ("sections_building", "sections", ("building_code",)),
+    ("meeting_patterns_id", "meeting_patterns", ("meeting_pattern_id",)),
+    ("gps_building", "gps", ("building_code",)),
+)
+
+# Sample value of each search criterion
+SAMPLE_ARGS = {
+    "terms": ["economics", "market"],
+    "dept": "ECON",
+    "day": ["MWF", "TR"],
+    "enrollment": [10, 40],
+    "time_start": 900,
+    "time_end": 1500,
+    "building_code": "RY",
+    "walking_time": 10,
+}
+
+# Criteria that are only given together
+CRITERIA = (("terms",), ("dept",), ("day",), ("enrollment",),
+            ("time_start",), ("time_end",),
+            ("building_code", "walking_time"))
+
+
+def create_index_sql(name, table, columns):
+    '''
+    CREATE INDEX statement of one of INDEXES.
+    '''
+    return "CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+        name, table, ", ".join(columns))
+
+
+def existing_indexes(connection):
+    '''
+    Names of the explicit indexes of a database (as migrate names them,
+    without the suffix catalog_loader may have added).
+    '''
+    return set(catalog_loader.index_base_name(name) for name, in
+               connection.execute(
+                   "SELECT name FROM sqlite_master WHERE type = 'index' "
+                   "AND sql IS NOT NULL"))
+
+
+def migrate(database=courses.DATABASE_FILENAME, analyze=True):
+    '''
+    Creates the missing INDEXES of a database in one transaction.
+    Inputs:
+        database (str): course database
+        analyze (bool): run ANALYZE afterwards
+    Output:
+        (list) names of the indexes created
+    '''
+    connection = sqlite3.connect(database, isolation_level=None)
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            existing = existing_indexes(connection)
+            created = []
+            for name, table, columns in INDEXES:
+                if name not in existing:
+                    connection.execute(create_index_sql(name, table,
+                                                        columns))
+                    created.append(name)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        if analyze:
+            connection.execute("ANALYZE")
+    finally:
+        connection.close()
+    return created
+
+
+def query_shapes():
+    '''
+    find_courses inputs covering every combination of CRITERIA, plus one
+    with a repeated term (queried differently, see find_courses).
+    Combinations with none of INPUT_1 and INPUT_3 are left out:
+    find_courses builds no query for them.
+    '''
+    buildable = set(courses.INPUT_1 + courses.INPUT_3)
+    for n in range(1, len(CRITERIA) + 1):
+        for combination in itertools.combinations(CRITERIA, n):
+            names = [name for group in combination for name in group]
+            if buildable.intersection(names):
+                yield {name: SAMPLE_ARGS[name] for name in names}
+    yield {"terms": ["economics", "economics"]}
+
+
+def explain(connection, sql, params):
+    '''
+    The steps of the query plan of a statement, in order.
+    '''
+    return [row[3] for row in
+            connection.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def scans(plan):
+    '''
+    The steps of a query plan that scan a whole table or index (reading
+    a list of values with json_each is not one).
+    '''
+    return [step for step in plan if step.startswith("SCAN ")
+            and "VIRTUAL TABLE" not in step]
+
+
+def advise(database=courses.DATABASE_FILENAME):
+    '''
+    Query plan of every query shape of find_courses.
+    Input:
+        database (str): course database
+    Output:
+        (list) of (find_courses input, query plan steps, scanning steps)
+    '''
+    report = []
+    with connection_pool.ConnectionPool(
+            database, size=1,
+            functions={"time_between": (4, courses.compute_time_between)}
+    ) as pool, pool.connection() as connection:
+        use_table = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+            "AND name = 'walking_times'").fetchone() is not None
+        for args in query_shapes():
+            shape = courses.query_shape(args, use_table=use_table)
+            sql = courses.build_sql(shape)
+            params = courses.query_params(args, buildings=["RY"])
+            plan = explain(connection, sql, params)
+            report.append((args, plan, scans(plan)))
+    return report
+
+
+def go():
+    '''
+    Migrates or advises from the command line.
+    '''
+    parser = argparse.ArgumentParser(
+        description="indexes of the course database")
+    parser.add_argument("command", choices=["migrate", "advise"])
+    parser.add_argument("--database", default=courses.DATABASE_FILENAME,
+                        help="course database (default: %(default)s)")
+    parser.add_argument("--verbose", action="store_true",
+                        help="advise: print every plan, not only scans")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        created = migrate(args.database)
+        print("created {} index(es): {}".format(
+            len(created), ", ".join(created) or "none"))
+        return
+
+    report = advise(args.database)
+    flagged = 0
+    for shape, plan, scanning in report:
+        if scanning:
+            flagged += 1
+        if scanning or args.verbose:
+            print(", ".join(shape))
+            for step in plan:
+                print("    {} {}".format("!" if step in scanning else " ",
+                                         step))
+    print("{} of {} query shapes scan a table".format(flagged, len(report)))
+    if flagged:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    go()
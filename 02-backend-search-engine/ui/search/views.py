@@ -10,9 +10,11 @@ from operator import and_
 from django.shortcuts import render
 from django import forms
 
-from courses import find_courses
+from courses import find_courses_page, get_result_cache
 
 NOPREF_STR = 'No preference'
+RESULTS_PER_PAGE = 50
+MAX_PAGE = sys.maxsize // RESULTS_PER_PAGE
 RES_DIR = os.path.join(os.path.dirname(__file__), '..', 'res')
 COLUMN_NAMES = dict(
     dept='Deptartment',
@@ -45,6 +47,24 @@ def _valid_result(res):
     return reduce(and_, (_valid_row(x) for x in res[RESULTS]), True)
 
 
+def _page_number(value):
+    """Page requested in the query string (1 if missing or invalid).
+
+    Pages are at most MAX_PAGE, so the row offset fits in SQLite's
+    integers."""
+    try:
+        return min(max(1, int(value)), MAX_PAGE)
+    except (TypeError, ValueError):
+        return 1
+
+
+def _page_url(request, page):
+    """Query string of the current search, on another page."""
+    query = request.GET.copy()
+    query['page'] = page
+    return '?' + query.urlencode()
+
+
 def _valid_military_time(time):
     return (0 <= time < 2400) and (time % 100 < 60)
 
@@ -203,8 +223,25 @@ def home(request):
             if form.cleaned_data['show_args']:
                 context['args'] = 'args_to_ui = ' + json.dumps(args, indent=2)
 
+            page = _page_number(request.GET.get('page'))
             try:
-                res = find_courses(args)
+                columns, result, total = find_courses_page(
+                    args, RESULTS_PER_PAGE, (page - 1) * RESULTS_PER_PAGE)
+                # past the last page: show the last one
+                pages = max(1, -(-total // RESULTS_PER_PAGE))
+                if page > pages:
+                    page = pages
+                    columns, result, total = find_courses_page(
+                        args, RESULTS_PER_PAGE,
+                        (page - 1) * RESULTS_PER_PAGE)
+                res = (columns, result)
+                context['page'] = page
+                context['pages'] = pages
+                context['total'] = total
+                if page > 1:
+                    context['previous_url'] = _page_url(request, page - 1)
+                if page < pages:
+                    context['next_url'] = _page_url(request, page + 1)
             except Exception as e:
                 print('Exception caught')
                 bt = traceback.format_exception(*sys.exc_info()[:3])
@@ -215,6 +252,10 @@ def home(request):
                 """.format(e, '\n'.join(bt))
 
                 res = None
+
+            if form.cleaned_data['show_args']:
+                context['args'] += ('\n\nresult cache: ' +
+                                    get_result_cache().report())
     else:
         form = SearchForm()
 
@@ -238,7 +279,7 @@ def home(request):
             result = [(r,) for r in result]
 
         context['result'] = result
-        context['num_results'] = len(result)
+        context['num_results'] = context.get('total', len(result))
         context['columns'] = [COLUMN_NAMES.get(col, col) for col in columns]
 
     context['form'] = form
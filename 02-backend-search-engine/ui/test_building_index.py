@@ -0,0 +1,77 @@
+'''
+Tests for the spatial index of buildings
+'''
+
+import numpy as np
+
+import building_index
+import courses
+import distances
+
+
+def brute_force(index, code, minutes):
+    '''
+    Codes within minutes of a building, timing every building.
+    '''
+    found = set()
+    for i, from_code in enumerate(index.codes):
+        if from_code != code:
+            continue
+        for j, to_code in enumerate(index.codes):
+            if courses.compute_time_between(index.lons[j], index.lats[j],
+                                            index.lons[i],
+                                            index.lats[i]) <= minutes:
+                found.add(to_code)
+    return sorted(found)
+
+
+def test_within_matches_function_for_gps_buildings():
+    '''
+    For every building in gps, within finds exactly the buildings that
+    time_between puts in range.
+    '''
+    index = building_index.load_index(courses.DATABASE_FILENAME)
+    assert len(index) > 0
+    for code in index.codes:
+        for minutes in (0, 2, 5, 10, 30):
+            assert index.within(code, minutes) == \
+                brute_force(index, code, minutes)
+    assert index.within("NOT A BUILDING", 10) == []
+
+
+def test_large_campus_set_visits_only_nearby_cells():
+    '''
+    On many buildings spread over several campuses, queries return the
+    exact answer while looking at a small part of the buildings.
+    '''
+    rng = np.random.default_rng(3)
+    centers = [(-87.60, 41.79), (-87.63, 41.89), (2.35, 48.86),
+               (116.40, 39.90)]
+    lons, lats = [], []
+    for lon, lat in centers:
+        lons.extend(rng.normal(lon, 0.02, 5000).tolist())
+        lats.extend(rng.normal(lat, 0.02, 5000).tolist())
+    codes = ["B{}".format(i) for i in range(len(lons))]
+    index = building_index.BuildingIndex(codes, lons, lats)
+
+    all_lons, all_lats = np.array(lons), np.array(lats)
+    for i in rng.choice(len(codes), 25, replace=False).tolist():
+        for minutes in (1, 8, 20):
+            expected = np.flatnonzero(distances.walking_minutes(
+                all_lons, all_lats, lons[i], lats[i]) <= minutes)
+            found = index.near_point(lons[i], lats[i], minutes)
+            assert found.tolist() == expected.tolist()
+            assert len(index.candidates(lons[i], lats[i], minutes)) < \
+                len(codes) / 4
+
+
+def test_boxes_at_antimeridian_and_poles_fall_back():
+    '''
+    Buildings across the antimeridian or near a pole are still found.
+    '''
+    index = building_index.BuildingIndex(
+        ["EAST", "WEST", "POLE", "FAR"],
+        [179.9999, -179.9999, 0.0, 10.0], [0.0, 0.0, 89.9999, 0.0])
+    assert index.within("EAST", 5) == ["EAST", "WEST"]
+    assert index.within("POLE", 5) == ["POLE"]
+    assert index.within("FAR", 0) == ["FAR"]
@@ -0,0 +1,126 @@
+'''
+Tests for the catalog index bulk loader
+'''
+
+import sqlite3
+import pytest
+
+import catalog_loader
+import catalog_postings
+
+
+@pytest.fixture
+def database(course_database):
+    '''
+    Copy of the course database, with an index on catalog_index.
+    '''
+    path = course_database
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE INDEX catalog_index_word "
+                       "ON catalog_index (word, course_id)")
+    connection.commit()
+    connection.close()
+    return path
+
+
+def table_rows(path):
+    '''
+    Sorted rows of the catalog_index table, and the names of all tables.
+    '''
+    connection = sqlite3.connect(path)
+    rows = sorted(connection.execute("SELECT course_id, word "
+                                     "FROM catalog_index"))
+    tables = [name for name, in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'")]
+    connection.close()
+    return rows, tables
+
+
+def index_columns(path):
+    '''
+    Columns of each index on the catalog_index table.
+    '''
+    connection = sqlite3.connect(path)
+    indexes = {name: [column for _, _, column in connection.execute(
+        "PRAGMA index_info({})".format(name))]
+               for name, _ in catalog_loader.table_indexes(connection,
+                                                           "catalog_index")}
+    connection.close()
+    return indexes
+
+
+def test_load_csv_swaps_in_rows(database, tmp_path):
+    '''
+    The loaded rows replace the table, the index is rebuilt on them
+    (under the other of its two names) and an existing binary index is
+    brought in sync.
+    '''
+    rows = [(course_id, "word{}".format(course_id % 7))
+            for course_id in range(1000)]
+    csv_path = tmp_path / "catalog_index.csv"
+    csv_path.write_text("".join("{}|{}\n".format(*row) for row in rows))
+    binary = str(tmp_path / "catalog_index.bin")
+    catalog_postings.write_index([(1, "stale")], binary)
+
+    report = catalog_loader.load_csv(str(csv_path), database, binary,
+                                     batch_size=300)
+
+    assert report.rows == 1000
+    assert report.batches == 4
+    loaded, tables = table_rows(database)
+    assert loaded == sorted(rows)
+    assert catalog_loader.STAGING_TABLE not in tables
+    assert index_columns(database) == \
+        {"catalog_index_word_load": ["word", "course_id"]}
+    with catalog_postings.PostingsReader(binary) as reader:
+        assert "stale" not in reader
+        assert reader["word3"] == [i for i in range(1000) if i % 7 == 3]
+
+    catalog_loader.load_csv(str(csv_path), database, binary)
+    assert index_columns(database) == \
+        {"catalog_index_word": ["word", "course_id"]}
+    assert table_rows(database)[0] == sorted(rows)
+
+
+def test_failed_load_keeps_table(database):
+    '''
+    A load that fails part way leaves the old table as it was.
+    '''
+    before = table_rows(database)
+
+    def rows():
+        yield 1, "one"
+        yield 2, "two"
+        raise ValueError("bad row")
+
+    with pytest.raises(ValueError):
+        catalog_loader.load_rows(rows(), database, None, batch_size=1)
+    assert table_rows(database) == before
+
+
+@pytest.mark.parametrize("failing", [(catalog_postings, "write_index"),
+                                     (catalog_loader.result_cache,
+                                      "bump_version")])
+def test_failed_swap_keeps_binary_index(database, tmp_path, monkeypatch,
+                                        failing):
+    '''
+    The new binary index is only renamed into place once the swap
+    commits: a load that fails writing it or in the swap leaves the old
+    table and binary index, and no staging table or temporary file.
+    '''
+    binary = str(tmp_path / "catalog_index.bin")
+    catalog_postings.write_index([(1, "old")], binary)
+    before = table_rows(database)
+
+    def fail(*args):
+        raise sqlite3.OperationalError("disk full")
+
+    monkeypatch.setattr(*failing, fail)
+    with pytest.raises(sqlite3.OperationalError):
+        catalog_loader.load_rows([(2, "new")], database, binary)
+    assert table_rows(database) == before
+    assert index_columns(database) == \
+        {"catalog_index_word": ["word", "course_id"]}
+    with catalog_postings.PostingsReader(binary) as reader:
+        assert list(reader.terms()) == ["old"]
+    assert not (tmp_path / "catalog_index.bin.new").exists()
@@ -0,0 +1,110 @@
+'''
+Tests for the binary catalog index
+'''
+
+import os
+import sqlite3
+import pytest
+
+import catalog_postings
+import courses
+from test_courses import TESTS, check_type, check_header, check_rows
+
+
+@pytest.fixture(scope="module")
+def index_path(tmp_path_factory):
+    '''
+    Binary index of the catalog_index table of the course database.
+    '''
+    path = str(tmp_path_factory.mktemp("index") / "catalog_index.bin")
+    catalog_postings.write_index(
+        catalog_postings.read_database_rows(courses.DATABASE_FILENAME), path)
+    return path
+
+
+def test_postings_match_table(index_path):
+    '''
+    Every word's postings are the course IDs the table has for it.
+    '''
+    connection = sqlite3.connect(courses.DATABASE_FILENAME)
+    expected = {}
+    for course_id, word in connection.execute(
+            "SELECT course_id, word FROM catalog_index"):
+        expected.setdefault(word, set()).add(course_id)
+    connection.close()
+
+    with catalog_postings.PostingsReader(index_path) as reader:
+        assert len(reader) == len(expected)
+        assert list(reader.terms()) == sorted(
+            expected, key=lambda word: word.encode("utf-8"))
+        for word, ids in expected.items():
+            assert reader[word] == sorted(ids)
+        assert reader.get("no such word") is None
+        assert "no such word" not in reader
+
+
+def test_csv_conversion(tmp_path):
+    '''
+    Converting a crawler CSV round-trips its rows, including large gaps
+    between IDs and non-ASCII words.
+    '''
+    rows = [(300, "économie"), (7, "history"), (1, "history"),
+            (100000, "history"), (7, "history"), (0, "a|b")]
+    csv_path = tmp_path / "catalog_index.csv"
+    csv_path.write_text("".join('{}|"{}"\n'.format(i, w) if "|" in w else
+                                "{}|{}\n".format(i, w) for i, w in rows),
+                        encoding="utf-8")
+    bin_path = str(tmp_path / "catalog_index.bin")
+    catalog_postings.convert_csv(str(csv_path), bin_path)
+
+    with catalog_postings.PostingsReader(bin_path) as reader:
+        assert reader.num_rows == 5
+        assert reader["history"] == [1, 7, 100000]
+        assert reader["économie"] == [300]
+        assert reader["a|b"] == [0]
+        assert reader.matching(["history", "économie"]) == []
+        assert reader.matching(["history"]) == [1, 7, 100000]
+
+
+def test_not_an_index(tmp_path):
+    '''
+    Other files are rejected.
+    '''
+    path = tmp_path / "catalog_index.bin"
+    path.write_bytes(b"identifier|word\n" * 10)
+    with pytest.raises(ValueError):
+        catalog_postings.PostingsReader(str(path))
+
+
+def test_changed_index_leaves_old_reader_open(tmp_path, monkeypatch):
+    '''
+    When the binary index changes, a reader a search still holds keeps
+    working while new searches get the new file.
+    '''
+    path = str(tmp_path / "catalog_index.bin")
+    monkeypatch.setattr(courses, "CATALOG_INDEX_FILENAME", path)
+    catalog_postings.write_index([(1, "old")], path)
+    old = courses.get_catalog_postings()
+    catalog_postings.write_index([(2, "new")], path)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+
+    new = courses.get_catalog_postings()
+    assert new is not old
+    assert old.matching(["old"]) == [1]
+    assert new.matching(["new"]) == [2]
+
+
+@pytest.mark.parametrize("t", TESTS)
+def test_find_courses_binary_index(t, index_path, monkeypatch):
+    '''
+    find_courses gives the same results with the binary index.
+    '''
+    monkeypatch.setattr(courses, "CATALOG_INDEX_FILENAME", index_path)
+    err_msg = "Test #{}\n".format(t["test_num"])
+    err_msg += "Input: {}\n"
+
+    actual = courses.find_courses(t["input"])
+    expected = t["expected"]
+    check_type(actual, err_msg, t["input"])
+    check_header(expected, actual, err_msg, t["input"])
+    check_rows(expected, actual, err_msg, t["input"])
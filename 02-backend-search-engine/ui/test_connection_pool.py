@@ -0,0 +1,152 @@
+'''
+Tests for the pooled database connections
+'''
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import pytest
+
+import connection_pool
+import courses
+
+
+TEST_DIR = os.path.dirname(__file__)
+TESTS = json.load(open(os.path.join(TEST_DIR, 'find_courses_tests.json')))
+
+
+@pytest.fixture
+def pool():
+    '''
+    Pool of two connections to the course database.
+    '''
+    with connection_pool.ConnectionPool(
+            courses.DATABASE_FILENAME, size=2,
+            functions={"time_between": (4, courses.compute_time_between)},
+            timeout=0.5) as pool_:
+        yield pool_
+
+
+def test_connections_are_reused(pool):
+    '''
+    A connection given back is lent again; no more than size are opened.
+    '''
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+        with pool.connection() as third:
+            assert third is not first
+    assert pool.opened == 2
+    assert pool.borrowed == 3
+
+
+def test_connections_are_read_only_and_set_up(pool):
+    '''
+    Writes fail, the pragmas are applied and time_between is registered.
+    '''
+    with pool.connection() as connection:
+        with pytest.raises(sqlite3.OperationalError):
+            connection.execute("DELETE FROM catalog_index")
+        assert connection.execute("PRAGMA query_only").fetchone() == (1,)
+        assert connection.execute("PRAGMA cache_size").fetchone() == (
+            connection_pool.READ_ONLY_PRAGMAS["cache_size"],)
+        minutes, = connection.execute(
+            "SELECT time_between(-87.6, 41.79, -87.6, 41.8)").fetchone()
+        assert minutes == courses.compute_time_between(-87.6, 41.79,
+                                                       -87.6, 41.8)
+
+
+def test_pool_without_free_connection_times_out(pool):
+    '''
+    With every connection borrowed, acquire waits and then gives up.
+    '''
+    with pool.connection(), pool.connection():
+        with pytest.raises(RuntimeError):
+            pool.acquire()
+    assert pool.waited == 1
+    with pool.connection():
+        pass
+
+
+def test_waiting_borrower_is_served_first(pool):
+    '''
+    A connection given back goes to the borrower already waiting, not to
+    the thread that gave it back.
+    '''
+    order = []
+    first, second = pool.acquire(), pool.acquire()
+
+    def waiter():
+        with pool.connection() as connection:
+            order.append(("waiter", connection))
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    while not pool.waited:
+        time.sleep(0.001)
+    pool.release(first)
+    with pool.connection() as connection:
+        order.append(("releaser", connection))
+    thread.join()
+    pool.release(second)
+
+    assert [name for name, _ in order] == ["waiter", "releaser"]
+    assert order[0][1] is first
+
+
+def test_unpooled_connections_are_closed():
+    '''
+    A pool of size 0 opens a connection per borrower and closes it.
+    '''
+    pool_ = connection_pool.ConnectionPool(courses.DATABASE_FILENAME, size=0)
+    with pool_.connection() as connection:
+        connection.execute("SELECT 1")
+    with pytest.raises(sqlite3.ProgrammingError):
+        connection.execute("SELECT 1")
+    assert pool_.opened == 1
+
+
+def test_broken_connection_is_not_returned(pool):
+    '''
+    A connection that raised ProgrammingError is replaced.
+    '''
+    with pytest.raises(sqlite3.ProgrammingError):
+        with pool.connection() as connection:
+            connection.close()
+            connection.execute("SELECT 1")
+    with pool.connection() as other:
+        assert other is not connection
+        other.execute("SELECT 1")
+
+
+def test_find_courses_in_threads(monkeypatch):
+    '''
+    Concurrent searches through a small pool return the expected results
+    and open no more connections than the pool holds.
+    '''
+    monkeypatch.setattr(courses, "POOL_SIZE", 2)
+    courses.close_connection_pools()
+    errors = []
+
+    def search():
+        try:
+            for t in TESTS:
+                header, rows = courses.find_courses(t["input"])
+                expected_header, expected_rows = t["expected"]
+                assert header == expected_header
+                assert sorted(map(list, rows)) == sorted(expected_rows)
+        except Exception as e:     # pylint: disable=broad-except
+            errors.append(e)
+
+    threads = [threading.Thread(target=search) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert courses.get_connection_pool().opened <= 2
+    courses.close_connection_pools()
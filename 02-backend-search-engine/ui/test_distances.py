@@ -0,0 +1,128 @@
+'''
+Tests for the array walking times
+'''
+
+import os
+import sqlite3
+import subprocess
+import sys
+import numpy as np
+import pytest
+
+import courses
+import distances
+
+
+def gps_points():
+    '''
+    Longitudes and latitudes of the buildings in gps.
+    '''
+    connection = sqlite3.connect(courses.DATABASE_FILENAME)
+    rows = connection.execute(
+        "SELECT lon, lat FROM gps ORDER BY building_code").fetchall()
+    connection.close()
+    return [lon for lon, _ in rows], [lat for _, lat in rows]
+
+
+def test_random_pairs_match_scalar_function():
+    '''
+    Walking minutes for random pairs around campus and across the world
+    are those of compute_time_between.
+    '''
+    rng = np.random.default_rng(1)
+    n = 20000
+    near = [rng.uniform(-87.62, -87.58, n), rng.uniform(41.77, 41.81, n),
+            rng.uniform(-87.62, -87.58, n), rng.uniform(41.77, 41.81, n)]
+    far = [rng.uniform(-180, 180, n), rng.uniform(-89, 89, n),
+           rng.uniform(-180, 180, n), rng.uniform(-89, 89, n)]
+    for points in (near, far):
+        expected = [courses.compute_time_between(*pair)
+                    for pair in zip(*(p.tolist() for p in points))]
+        actual = distances.walking_minutes(*points)
+        assert actual.dtype == np.int64
+        assert actual.tolist() == expected
+        assert [distances.time_between(*pair) for pair in
+                zip(*(p.tolist() for p in points))] == expected
+
+
+def test_distances_does_not_import_courses():
+    '''
+    courses imports distances (through building_index), not the other
+    way round.
+    '''
+    code = "import sys, distances; print('courses' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], check=True,
+                            cwd=os.path.dirname(__file__) or ".",
+                            capture_output=True, text=True).stdout
+    assert output.strip() == "False"
+
+
+def test_whole_minutes_are_not_rounded_up():
+    '''
+    A pair exactly a whole number of minutes apart (as computed by the
+    scalar function) gets that number of minutes, not one more.
+    '''
+    lon, lat = -87.6, 41.79
+    meters_per_minute = distances.WALK_SPEED_M_PER_SEC * 60
+    for whole in (1, 7, 30):
+        # latitude offset of whole minutes of walking, up to rounding
+        dlat = np.degrees(whole * meters_per_minute /
+                          (distances.EARTH_RADIUS_KM * 1000))
+        for lat2 in np.nextafter(lat + dlat, [-np.inf, np.inf]).tolist() + \
+                [lat + dlat]:
+            assert distances.walking_minutes([lon], [lat], [lon], [lat2])[0] \
+                == courses.compute_time_between(lon, lat, lon, lat2)
+
+
+def test_numbers_give_a_number():
+    '''
+    With only numbers, walking_minutes gives a 0-d array, also for a
+    pair that is recomputed with the scalar function; mixed inputs keep
+    their broadcast shape.
+    '''
+    lon, lat = -87.6, 41.79
+    dlat = np.degrees(7 * distances.WALK_SPEED_M_PER_SEC * 60 /
+                      (distances.EARTH_RADIUS_KM * 1000))
+    for lat2 in (lat + 0.004, lat + dlat):
+        minutes = distances.walking_minutes(lon, lat, lon, lat2)
+        assert minutes.shape == ()
+        assert minutes == courses.compute_time_between(lon, lat, lon, lat2)
+    assert distances.walking_minutes([[lon, lon]], lat, lon, lat).shape == \
+        (1, 2)
+
+
+def test_minutes_matrix_orientation():
+    '''
+    matrix[i, j] is the time find_courses gives from building i to j.
+    '''
+    lons, lats = gps_points()
+    matrix = distances.minutes_matrix(lons, lats)
+    assert matrix.shape == (len(lons), len(lons))
+    for i in range(0, len(lons), 7):
+        for j in range(len(lons)):
+            assert matrix[i, j] == courses.compute_time_between(
+                lons[j], lats[j], lons[i], lats[i])
+
+
+def test_within_returns_points_in_range():
+    '''
+    within gives the buildings a search from one building would keep.
+    '''
+    lons, lats = gps_points()
+    for minutes in (0, 5, 12):
+        found = distances.within(lons, lats, lons[3], lats[3], minutes)
+        expected = [j for j in range(len(lons))
+                    if courses.compute_time_between(
+                        lons[j], lats[j], lons[3], lats[3]) <= minutes]
+        assert found.tolist() == expected
+
+
+def test_invalid_coordinates_raise_like_function():
+    '''
+    A coordinate that is not a number raises ValueError, as it does in
+    compute_time_between.
+    '''
+    with pytest.raises(ValueError):
+        courses.compute_time_between(float("nan"), 0, 0, 0)
+    with pytest.raises(ValueError):
+        distances.walking_minutes([0, np.nan], [0, 0], [0, 0], [0, 0])
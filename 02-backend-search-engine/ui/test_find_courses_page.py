@@ -0,0 +1,75 @@
+'''
+Tests for paginated and streamed search results
+'''
+
+import json
+import os
+import pytest
+
+import courses
+
+
+TEST_DIR = os.path.dirname(__file__)
+TESTS = json.load(open(os.path.join(TEST_DIR, 'find_courses_tests.json')))
+
+
+@pytest.mark.parametrize("t", TESTS)
+def test_pages_cover_find_courses_results(t):
+    '''
+    The pages of a search, in order, hold each expected row once, and
+    each page gives the number of rows of the whole search.
+    '''
+    header, rows = t["expected"]
+    found = []
+    offset = 0
+    while True:
+        page_header, page, total = courses.find_courses_page(
+            t["input"], 7, offset)
+        assert page_header == header and total == len(rows)
+        assert len(page) == min(7, max(total - offset, 0))
+        found.extend(page)
+        offset += 7
+        if offset >= total:
+            break
+    assert sorted(map(tuple, found)) == sorted(map(tuple, rows))
+
+    if "section_num" in header:
+        keys = [(row[0], row[1], row[header.index("section_num")])
+                for row in found]
+    else:
+        keys = [tuple(row[:2]) for row in found]
+    assert keys == sorted(keys)
+
+
+def test_stream_courses_in_batches(monkeypatch):
+    '''
+    stream_courses gives the header, then the rows of find_courses.
+    '''
+    args = {"dept": "MATH", "time_start": 800}
+    header, rows = courses.find_courses(args)
+    streamed = courses.stream_courses(args, batch_size=4)
+    assert next(streamed) == header
+    assert sorted(streamed) == sorted(rows)
+    assert list(courses.stream_courses({})) == [[]]
+
+    # an export stopped part way gives its connection back
+    monkeypatch.setattr(courses, "POOL_SIZE", 1)
+    monkeypatch.setattr(courses, "RESULT_CACHE_SIZE", 0)
+    streamed = courses.stream_courses(args, batch_size=4)
+    next(streamed)
+    next(streamed)
+    streamed.close()
+    with courses.get_connection_pool().connection():
+        pass
+    courses.close_connection_pools()
+
+
+def test_negative_limit_or_offset_is_an_error():
+    '''
+    find_courses_page needs a non-negative limit and offset.
+    '''
+    with pytest.raises(ValueError):
+        courses.find_courses_page({"dept": "MATH"}, -1)
+    with pytest.raises(ValueError):
+        courses.find_courses_page({"dept": "MATH"}, 10, -10)
+    assert courses.find_courses_page({}) == ([], [], 0)
@@ -0,0 +1,97 @@
+'''
+Tests for the compiled query cache
+'''
+
+import json
+import pytest
+
+import courses
+import query_compiler
+
+
+def test_cache_counts_hits_and_evicts_least_recent():
+    '''
+    Lookups hit or build; the least recently used shape goes first.
+    '''
+    built = []
+
+    def build(shape):
+        built.append(shape)
+        return "SQL {}".format(shape)
+
+    cache = query_compiler.QueryCache(2)
+    assert cache.get("a", build) == "SQL a"
+    assert cache.get("b", build) == "SQL b"
+    assert cache.get("a", build) == "SQL a"
+    cache.get("c", build)
+    cache.get("a", build)
+    cache.get("b", build)
+
+    assert built == ["a", "b", "c", "b"]
+    assert (cache.hits, cache.misses) == (2, 4)
+    assert len(cache) == 2
+
+
+def test_shape_latency_is_counted_only_when_cached():
+    '''
+    record adds to the calls and seconds of a cached shape.
+    '''
+    cache = query_compiler.QueryCache(1)
+    cache.get("a", str)
+    cache.record("a", 0.25)
+    cache.record("a", 0.75)
+    cache.record("b", 1.0)
+    (shape, stats), = cache.shapes()
+    assert shape == "a"
+    assert (stats.calls, stats.seconds, stats.max_seconds) == (2, 1.0, 0.75)
+    assert stats.mean_seconds == 0.5
+
+    uncached = query_compiler.QueryCache(0)
+    uncached.get("a", str)
+    uncached.record("a", 1.0)
+    assert len(uncached) == 0 and uncached.misses == 1
+
+
+def test_argument_order_gives_one_statement():
+    '''
+    Searches with the same criteria in a different order share a shape
+    and a statement; the number of days is part of the shape.
+    '''
+    args = {"walking_time": 10, "dept": "CMSC", "building_code": "RY",
+            "day": ["MWF"]}
+    reordered = dict(reversed(list(args.items())))
+    shape, sql, params = courses.compile_query(args)
+    assert courses.compile_query(reordered) == (shape, sql, params)
+    assert params[:3] + params[4:] == ["RY", "CMSC", "MWF", 10]
+    assert "RY" in json.loads(params[3])
+
+    more_days = dict(args, day=["MWF", "TR"])
+    assert courses.query_shape(more_days) != shape
+
+
+def test_only_input_2_has_no_statement():
+    '''
+    find_courses builds no query from day, time or enrollment alone.
+    '''
+    with pytest.raises(ValueError):
+        courses.build_query({"day": ["MWF"]})
+
+
+def test_find_courses_records_shape_latency(monkeypatch):
+    '''
+    Repeated searches hit the cache and are timed under their shape.
+    '''
+    monkeypatch.setattr(courses, "QUERY_CACHE_SIZE", 4)
+    monkeypatch.setattr(courses, "RESULT_CACHE_SIZE", 0)
+    args = {"dept": "CMSC", "time_start": 900}
+    first = courses.find_courses(args)
+    second = courses.find_courses(dict(reversed(list(args.items()))))
+    cache = courses.get_query_cache()
+
+    assert first == second
+    assert (cache.hits, cache.misses) == (1, 1)
+    (shape, stats), = cache.shapes()
+    assert shape == (("dept", None), ("time_start", None))
+    assert stats.calls == 2
+    assert "time_start" in cache.report()
+    courses.close_connection_pools()
@@ -0,0 +1,134 @@
+'''
+Tests for the search result cache
+'''
+
+import os
+import sqlite3
+import threading
+import time
+import pytest
+
+import catalog_loader
+import courses
+import query_compiler
+import result_cache
+
+
+@pytest.fixture
+def database(course_database, tmp_path, monkeypatch):
+    '''
+    Copy of the course database that find_courses searches, with no
+    binary catalog index and a result cache of its own.
+    '''
+    path = course_database
+    monkeypatch.setattr(courses, "DATABASE_FILENAME", path)
+    monkeypatch.setattr(courses, "CATALOG_INDEX_FILENAME",
+                        str(tmp_path / "catalog_index.bin"))
+    monkeypatch.setattr(courses, "RESULT_CACHE_SIZE", 16)
+    yield path
+    courses.close_connection_pools()
+
+
+def test_cache_drops_old_large_and_stale_results():
+    '''
+    Results go least recently used first past the size or the byte
+    budget, after ttl seconds, and when the version changes.
+    '''
+    now = [0.0]
+    result = (("dept",), (("CMSC",),))
+    size = result_cache.result_bytes(result)
+    cache = result_cache.ResultCache(2, max_bytes=2 * size, ttl=10,
+                                     clock=lambda: now[0])
+    cache.put("a", 1, result)
+    cache.put("b", 1, result)
+    assert cache.get("a", 1) is result
+    cache.put("c", 1, result)
+    assert cache.get("b", 1) is None and cache.get("a", 1) is result
+    assert cache.bytes == 2 * size
+
+    cache.put("big", 1, (("dept",), (("CMSC",),) * 100))
+    assert len(cache) == 2
+
+    now[0] = 11
+    assert cache.get("a", 1) is None
+    cache.put("a", 1, result)
+    assert cache.get("a", 2) is None
+    assert (cache.hits, cache.misses) == (2, 3)
+    assert (cache.expired, cache.invalidated, cache.evicted) == (1, 1, 1)
+    assert "2 hits, 3 misses" in cache.report()
+
+
+def test_canonical_key_ignores_order_and_sequence_type():
+    '''
+    The same criteria give the same key.
+    '''
+    key = result_cache.canonical_key({"dept": "CMSC", "enrollment": (1, 40)})
+    assert key == result_cache.canonical_key(
+        {"enrollment": [1, 40], "dept": "CMSC"})
+    assert key != result_cache.canonical_key(
+        {"enrollment": [1, 41], "dept": "CMSC"})
+
+
+def test_find_courses_reuses_results_until_catalog_reload(database):
+    '''
+    A repeated search is answered from the cache; reloading the catalog
+    gives fresh results, and so does a new catalog_version alone.
+    '''
+    args = {"terms": ["economics"], "dept": "ECON"}
+    first = courses.find_courses(args)
+    assert first[1]
+    assert courses.find_courses(dict(reversed(list(args.items())))) == first
+    cache = courses.get_result_cache()
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    connection = sqlite3.connect(database)
+    course_ids = [course_id for course_id, in connection.execute(
+        "SELECT ci.course_id FROM catalog_index AS ci JOIN courses AS c "
+        "ON c.course_id = ci.course_id "
+        "WHERE ci.word = 'economics' AND c.dept = 'ECON'")]
+    connection.close()
+    catalog_loader.load_rows([(course_ids[0], "economics")], database, None)
+
+    reloaded = courses.find_courses(args)
+    assert 0 < len(reloaded[1]) < len(first[1])
+    assert courses.find_courses(args) == reloaded
+    assert (cache.hits, cache.invalidated) == (2, 1)
+
+    # a new version with the file's size and timestamps unchanged
+    stat = os.stat(database)
+    connection = sqlite3.connect(database)
+    assert result_cache.bump_version(connection) == 2
+    connection.commit()
+    connection.close()
+    os.utime(database, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert os.stat(database).st_size == stat.st_size
+    assert courses.find_courses(args) == reloaded
+    assert cache.invalidated == 2
+
+
+def test_concurrent_first_use_shares_one_cache(monkeypatch):
+    '''
+    Threads that search at the same time right after start-up all get
+    the same result cache and query cache.
+    '''
+    for module, name in ((result_cache, "ResultCache"),
+                         (query_compiler, "QueryCache")):
+        make = getattr(module, name)
+
+        def slow(*args, make=make):
+            time.sleep(0.01)
+            return make(*args)
+
+        monkeypatch.setattr(module, name, slow)
+    monkeypatch.setattr(courses, "_result_caches", {})
+    monkeypatch.setattr(courses, "_query_caches", {})
+
+    found = []
+    threads = [threading.Thread(target=lambda: found.append(
+        (courses.get_result_cache(), courses.get_query_cache())))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(found)) == 1
@@ -0,0 +1,59 @@
+'''
+Tests for the course database indexes and the query plan advisor
+'''
+
+import json
+import os
+import pytest
+
+import catalog_loader
+import courses
+import schema_indexes
+
+
+TEST_DIR = os.path.dirname(__file__)
+TESTS = json.load(open(os.path.join(TEST_DIR, 'find_courses_tests.json')))
+
+
+def test_migration_is_idempotent(course_database):
+    '''
+    The first migration creates every index, the second none.
+    '''
+    created = schema_indexes.migrate(course_database)
+    assert created == [name for name, _, _ in schema_indexes.INDEXES]
+    assert schema_indexes.migrate(course_database) == []
+
+
+def test_migration_after_load(course_database):
+    '''
+    The catalog_index indexes a load rebuilds under their other name
+    are not created again.
+    '''
+    schema_indexes.migrate(course_database)
+    catalog_loader.load_rows([(1, "one")], course_database, None)
+    assert schema_indexes.migrate(course_database) == []
+
+
+def test_indexes_remove_scans(course_database):
+    '''
+    Without indexes every query shape scans; with them, none does.
+    '''
+    before = schema_indexes.advise(course_database)
+    assert all(scanning for _, _, scanning in before)
+
+    schema_indexes.migrate(course_database)
+    after = schema_indexes.advise(course_database)
+    assert [args for args, _, scanning in after if scanning] == []
+
+
+@pytest.mark.parametrize("t", TESTS)
+def test_find_courses_on_indexed_database(t, course_database, monkeypatch):
+    '''
+    find_courses returns the same results from the indexed database.
+    '''
+    schema_indexes.migrate(course_database)
+    monkeypatch.setattr(courses, "DATABASE_FILENAME", course_database)
+    header, rows = courses.find_courses(t["input"])
+    assert header == t["expected"][0]
+    assert set(map(tuple, rows)) == set(map(tuple, t["expected"][1]))
+    courses.close_connection_pools()
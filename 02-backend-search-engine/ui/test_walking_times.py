@@ -0,0 +1,146 @@
+'''
+Tests for the precomputed walking times
+'''
+
+import json
+import os
+import shutil
+import sqlite3
+import pytest
+
+import courses
+import schema_indexes
+import walking_times
+
+
+TEST_DIR = os.path.dirname(__file__)
+TESTS = json.load(open(os.path.join(TEST_DIR, 'find_courses_tests.json')))
+
+
+@pytest.fixture
+def database(course_database):
+    '''
+    Copy of the course database with a walking_times table.
+    '''
+    walking_times.refresh(course_database)
+    return course_database
+
+
+def building_codes():
+    '''
+    Codes of the buildings in gps.
+    '''
+    connection = sqlite3.connect(courses.DATABASE_FILENAME)
+    codes = [code for code, in connection.execute(
+        "SELECT building_code FROM gps ORDER BY building_code")]
+    connection.close()
+    return codes
+
+
+def test_refresh_stores_every_pair_once(database):
+    '''
+    Refreshing stores one walking time per pair of buildings, matching
+    time_between, and can run again.
+    '''
+    assert walking_times.check(database) == []
+    assert walking_times.refresh(database) == len(building_codes()) ** 2
+    assert walking_times.check(database) == []
+
+
+def test_check_finds_moved_building(database):
+    '''
+    After a building moves, check lists the pairs out of date.
+    '''
+    connection = sqlite3.connect(database)
+    connection.execute("UPDATE gps SET lat = lat + 0.01 "
+                       "WHERE building_code = 'RY'")
+    connection.commit()
+    connection.close()
+
+    stale = walking_times.check(database)
+    assert stale
+    assert all("RY" in (from_code, to_code)
+               for from_code, to_code, _, _ in stale)
+    walking_times.refresh(database)
+    assert walking_times.check(database) == []
+
+
+@pytest.mark.parametrize("t", [t for t in TESTS
+                               if "walking_time" in t["input"]])
+def test_find_courses_walking_tests_with_table(t, database, monkeypatch):
+    '''
+    The walking time tests pass using the table.
+    '''
+    monkeypatch.setattr(courses, "DATABASE_FILENAME", database)
+    sql, _ = courses.build_query(t["input"])
+    assert "walking_times" in sql and "time_between" not in sql
+    header, rows = courses.find_courses(t["input"])
+    assert header == t["expected"][0]
+    assert set(map(tuple, rows)) == set(map(tuple, t["expected"][1]))
+    courses.close_connection_pools()
+
+
+def test_table_matches_function_for_every_building(database,
+                                                  copy_course_database,
+                                                  monkeypatch):
+    '''
+    For every building and a range of walking times, the table and
+    time_between give the same rows (both databases indexed, to keep
+    the searches quick).
+    '''
+    without_table = copy_course_database("without_table.sqlite3")
+    schema_indexes.migrate(without_table)
+    schema_indexes.migrate(database)
+    found = 0
+    for building in building_codes():
+        for minutes in (0, 3, 7, 15):
+            args = {"building_code": building, "walking_time": minutes,
+                    "dept": "MATH"}
+            monkeypatch.setattr(courses, "DATABASE_FILENAME", database)
+            with_table = courses.find_courses(args)
+            monkeypatch.setattr(courses, "DATABASE_FILENAME", without_table)
+            with_function = courses.find_courses(args)
+            assert with_table[0] == with_function[0]
+            assert sorted(with_table[1]) == sorted(with_function[1])
+            found += len(with_function[1])
+    assert found > 0
+    courses.close_connection_pools()
+
+
+
+def test_building_with_two_locations(database, tmp_path, monkeypatch):
+    '''
+    A code with two locations in gps refreshes, and searches from it
+    give the rows of time_between.
+    '''
+    connection = sqlite3.connect(database)
+    connection.execute("INSERT INTO gps (building_code, lon, lat) "
+                       "SELECT building_code, lon + 0.004, lat "
+                       "FROM gps WHERE building_code = 'RY'")
+    connection.commit()
+    connection.close()
+    assert walking_times.check(database) != []
+    walking_times.refresh(database)
+    assert walking_times.check(database) == []
+    schema_indexes.migrate(database)
+
+    without_table = str(tmp_path / "without_table.sqlite3")
+    shutil.copy(database, without_table)
+    connection = sqlite3.connect(without_table)
+    connection.execute("DROP TABLE walking_times")
+    connection.commit()
+    connection.close()
+
+    found = 0
+    for building in ("RY", "BSLC"):
+        for minutes in (3, 7, 15):
+            args = {"building_code": building, "walking_time": minutes,
+                    "dept": "MATH"}
+            monkeypatch.setattr(courses, "DATABASE_FILENAME", database)
+            with_table = courses.find_courses(args)
+            monkeypatch.setattr(courses, "DATABASE_FILENAME", without_table)
+            with_function = courses.find_courses(args)
+            assert sorted(with_table[1]) == sorted(with_function[1])
+            found += len(with_function[1])
+    assert found > 0
+    courses.close_connection_pools()
@@ -0,0 +1,160 @@
+'''
+Course search engine: precomputed walking times
+
+Searches with building_code and walking_time used to join gps against
+itself and call time_between (a Python function) on every candidate
+row.  refresh stores the walking time between every pair of buildings
+in gps in a walking_times table, keyed by (from_code, to_code,
+minutes), so find_courses looks the time up with one index search per
+section instead; it uses the table whenever the database has one.
+
+The minutes are exactly those of the function with the arguments the
+query used, compute_time_between(to lon, to lat, from lon, from lat)
+(computed for all pairs at once by distances.minutes_matrix), so
+searches return exactly the same rows.  A building code with several
+locations in gps gets every distinct time between them, as the
+function query does.  The table does not follow changes to gps: run
+refresh again after changing building coordinates (check lists the
+pairs that are out of date).
+
+    python3 walking_times.py refresh
+    python3 walking_times.py check
+'''
+# pylint: disable-msg=invalid-name
+
+import argparse
+import sqlite3
+import sys
+import time
+
+import courses
+import distances
+
+
+TABLE = "walking_times"
+
+CREATE_TABLE = '''
+CREATE TABLE walking_times
+(
+    from_code varchar(5),   -- building searched from
+    to_code varchar(5),     -- building of a section
+    minutes integer,        -- walking time, as computed by time_between
+    PRIMARY KEY (from_code, to_code, minutes)
+) WITHOUT ROWID'''
+
+
+def compute_rows(connection):
+    '''
+    (from code, to code, minutes) for every pair of buildings in gps,
+    sorted.  A code with several locations in gps gets the distinct
+    times between each of its locations and the other building's, as
+    the time_between query finds them.
+    '''
+    buildings = connection.execute(
+        "SELECT building_code, lon, lat FROM gps").fetchall()
+    codes = [code for code, _, _ in buildings]
+    matrix = distances.minutes_matrix([lon for _, lon, _ in buildings],
+                                      [lat for _, _, lat in buildings])
+    return sorted({(from_code, to_code, minutes)
+                   for from_code, row in zip(codes, matrix.tolist())
+                   for to_code, minutes in zip(codes, row)})
+
+
+def table_exists(connection):
+    '''
+    Whether a database has a walking_times table.
+    '''
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (TABLE,)).fetchone() is not None
+
+
+def refresh(database=courses.DATABASE_FILENAME):
+    '''
+    Replaces the walking_times table of a database (in one transaction,
+    so searches see either the old table or the new one).
+    Output:
+        (int) number of pairs stored
+    '''
+    connection = sqlite3.connect(database, isolation_level=None)
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = compute_rows(connection)
+            connection.execute("DROP TABLE IF EXISTS " + TABLE)
+            connection.execute(CREATE_TABLE)
+            connection.executemany(
+                "INSERT INTO walking_times VALUES (?, ?, ?)", rows)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    finally:
+        connection.close()
+    return len(rows)
+
+
+def pair_minutes(rows):
+    '''
+    Sorted tuple of the minutes of each (from code, to code) pair of
+    (from code, to code, minutes) rows.
+    '''
+    minutes = {}
+    for from_code, to_code, time in rows:
+        minutes.setdefault((from_code, to_code), set()).add(time)
+    return {pair: tuple(sorted(times)) for pair, times in minutes.items()}
+
+
+def check(database=courses.DATABASE_FILENAME):
+    '''
+    Pairs whose stored walking times differ from gps.
+    Output:
+        (list) of (from code, to code, stored minutes, computed minutes),
+        the minutes as sorted tuples (one time per pair, unless a code
+        has several locations); stored minutes is None for missing
+        pairs, computed minutes None for pairs of buildings no longer in
+        gps
+    '''
+    connection = sqlite3.connect(database)
+    try:
+        computed = pair_minutes(compute_rows(connection))
+        stored = {}
+        if table_exists(connection):
+            stored = pair_minutes(connection.execute(
+                "SELECT from_code, to_code, minutes FROM walking_times"))
+    finally:
+        connection.close()
+    return sorted(pair + (stored.get(pair), computed.get(pair))
+                  for pair in set(computed) | set(stored)
+                  if stored.get(pair) != computed.get(pair))
+
+
+def go():
+    '''
+    Refreshes or checks the walking_times table from the command line.
+    '''
+    parser = argparse.ArgumentParser(
+        description="precomputed walking times between buildings")
+    parser.add_argument("command", choices=["refresh", "check"])
+    parser.add_argument("--database", default=courses.DATABASE_FILENAME,
+                        help="course database (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.command == "refresh":
+        start = time.perf_counter()
+        pairs = refresh(args.database)
+        print("stored {} walking times in {:.2f}s".format(
+            pairs, time.perf_counter() - start))
+        return
+
+    stale = check(args.database)
+    for from_code, to_code, stored, computed in stale:
+        print("{} -> {}: stored {}, gps gives {}".format(
+            from_code, to_code, stored, computed))
+    print("{} walking time(s) out of date".format(len(stale)))
+    if stale:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    go()